@@ -1,9 +1,14 @@
 import streamlit as st
 import os
 from pathlib import Path
+from src.backends import prewarm
+from src.metrics import get_metrics
 # from .streamlit.marcos_ import main_vba_code_converter
 
 
+# Import the extraction and conversion backends in the background while the first page renders
+prewarm()
+
 if "role" not in st.session_state:
     st.session_state.role = None
 
@@ -71,4 +76,6 @@ if len(page_dict) > 0:
 else:
     pg = st.navigation([st.Page(login)])
 
-pg.run()
\ No newline at end of file
+# The page's own imports and first render, per page
+with get_metrics().span("page_run", page=pg.title):
+    pg.run()
\ No newline at end of file
@@ -0,0 +1,164 @@
+"""
+Extraction micro-benchmarks: time and peak memory of each extractor on
+synthetic workbooks of increasing size.
+
+    python -m benchmarks.bench_extraction --tiers small medium --output bench.json
+    python -m benchmarks.bench_extraction --baseline bench.json --max-regression 0.25
+    python -m benchmarks.bench_extraction --formats xlsm xlsb xls --extractors separate scan
+
+The extractors are the backend calls behind the UI: ``vba`` is what
+extract_vba_from_excel runs (with the macro cache bypassed), ``controls`` is
+the zip-only scan_controls_ooxml, ``inspection`` is what the controls page
+runs (sheet list, controls and annotations), ``separate`` is ``vba`` followed
+by ``controls`` and ``scan`` is the single-pass scan_workbook that replaced
+them. Every tier is generated in each of ``--formats``. With ``--baseline``
+the exit status is 1 when any median time or peak memory grew by more than
+the tolerance.
+"""
+import argparse
+import gc
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from benchmarks.synthetic import make_workbook, make_xls, make_xlsb
+from src.controls import scan_controls_ooxml
+from src.inspection import WorkbookInspection
+from src.scanner import scan_workbook
+from src.vba_extraction import extract_vba_modules
+
+TIERS = {
+    "small": dict(sheets=2, rows=200, cols=10, modules=3, module_lines=100,
+                  form_controls=2, activex_controls=1, comments=5),
+    "medium": dict(sheets=5, rows=5000, cols=15, modules=15, module_lines=400,
+                   form_controls=10, activex_controls=5, comments=50),
+    "large": dict(sheets=8, rows=20000, cols=20, modules=40, module_lines=1500,
+                  form_controls=25, activex_controls=10, comments=200),
+}
+
+
+class _NoCache:
+    """Cache that never hits, so every run measures a full parse."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+
+def _inspect(data: bytes) -> Any:
+    with WorkbookInspection(data) as inspection:
+        return inspection.sheet_names, inspection.controls(), inspection.annotations()
+
+
+def _separate(data: bytes) -> Any:
+    return extract_vba_modules(data, "benchmark.xlsm", cache=_NoCache()), scan_controls_ooxml(data)
+
+
+EXTRACTORS: Dict[str, Callable[[bytes], Any]] = {
+    "vba": lambda data: extract_vba_modules(data, "benchmark.xlsm", cache=_NoCache()),
+    "controls": scan_controls_ooxml,
+    "inspection": _inspect,
+    "separate": _separate,
+    "scan": lambda data: scan_workbook(data, "benchmark.xlsm", cache=_NoCache()),
+}
+# Comments are only generated for .xlsx/.xlsm
+FORMATS: Dict[str, Callable[..., bytes]] = {
+    "xlsm": make_workbook,
+    "xlsb": lambda comments=0, **params: make_xlsb(**params),
+    "xls": lambda comments=0, **params: make_xls(**params),
+}
+# scan_controls_ooxml only reads zip packages
+UNSUPPORTED = {("xls", "controls"), ("xls", "separate")}
+
+
+def measure(fn: Callable[[bytes], Any], data: bytes, repeat: int) -> Dict[str, float]:
+    """Median and best wall time over ``repeat`` runs, then peak traced memory of one more run."""
+    fn(data)  # warm-up: imports, regex compilation
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn(data)
+        timings.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn(data)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"median_s": statistics.median(timings), "min_s": min(timings), "peak_mib": peak / 2 ** 20}
+
+
+def run(tiers: List[str], extractors: List[str], repeat: int, formats: List[str] = ("xlsm",)) -> List[Dict[str, Any]]:
+    results = []
+    for tier in tiers:
+        for fmt in formats:
+            data = FORMATS[fmt](**TIERS[tier])
+            print(f"{tier}: {len(data) / 2 ** 20:.1f} MiB .{fmt} workbook", file=sys.stderr)
+            for name in extractors:
+                if (fmt, name) in UNSUPPORTED:
+                    continue
+                stats = measure(EXTRACTORS[name], data, repeat)
+                results.append({"tier": tier, "format": fmt, "extractor": name,
+                                "workbook_mib": len(data) / 2 ** 20, **stats})
+    return results
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """Return one message per metric that regressed by more than ``tolerance`` against ``baseline``."""
+    # Results written before the format dimension existed are all .xlsm
+    previous = {(r["tier"], r.get("format", "xlsm"), r["extractor"]): r for r in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get((result["tier"], result["format"], result["extractor"]))
+        if before is None:
+            continue
+        for metric in ("median_s", "peak_mib"):
+            if before[metric] > 0 and result[metric] > before[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{result['tier']}/{result['format']}/{result['extractor']} {metric}: "
+                    f"{before[metric]:.3f} -> {result[metric]:.3f} (+{result[metric] / before[metric] - 1:.0%})"
+                )
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark workbook extraction on synthetic files.")
+    parser.add_argument("--tiers", nargs="+", choices=list(TIERS), default=["small", "medium"])
+    parser.add_argument("--extractors", nargs="+", choices=list(EXTRACTORS),
+                        default=["vba", "controls", "inspection"])
+    parser.add_argument("--formats", nargs="+", choices=list(FORMATS), default=["xlsm"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="Allowed relative growth of time or memory (default: 0.25)")
+    args = parser.parse_args(argv)
+
+    results = run(args.tiers, args.extractors, args.repeat, args.formats)
+    print(f"{'tier':<8} {'format':<6} {'extractor':<12} {'median ms':>10} {'min ms':>10} {'peak MiB':>9}")
+    for r in results:
+        print(f"{r['tier']:<8} {r['format']:<6} {r['extractor']:<12} {r['median_s'] * 1000:>10.1f} "
+              f"{r['min_s'] * 1000:>10.1f} {r['peak_mib']:>9.1f}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,159 @@
+"""
+Minimal writer for OLE compound files ([MS-CFB] version 3), enough to build
+vbaProject.bin and activeX*.bin parts for synthetic workbooks.
+"""
+import struct
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+SECTOR_SIZE = 512
+MINI_SECTOR_SIZE = 64
+MINI_STREAM_CUTOFF = 4096
+
+FREESECT = 0xFFFFFFFF
+ENDOFCHAIN = 0xFFFFFFFE
+FATSECT = 0xFFFFFFFD
+NOSTREAM = 0xFFFFFFFF
+
+_STORAGE, _STREAM, _ROOT = 1, 2, 5
+_BLACK = 1
+# Without DIFAT sectors the header can address 109 FAT sectors (about 7 MB)
+_MAX_FAT_SECTORS = 109
+
+
+def _compare_key(name: str) -> Tuple[int, str]:
+    # Siblings are ordered by name length first, then by upper-cased name
+    return len(name), name.upper()
+
+
+class _Entry:
+    def __init__(self, name: str, kind: int, data: bytes = b"", clsid: Optional[str] = None):
+        self.name = name
+        self.kind = kind
+        self.data = data
+        self.clsid = clsid
+        self.children: Dict[str, "_Entry"] = {}
+        self.left = self.right = self.child = NOSTREAM
+        self.start = ENDOFCHAIN
+        self.sid = 0
+
+
+def _chain(fat: List[int], start: int, count: int) -> None:
+    for i in range(count):
+        fat[start + i] = start + i + 1 if i < count - 1 else ENDOFCHAIN
+
+
+def _sectors(size: int, sector_size: int) -> int:
+    return -(-size // sector_size)
+
+
+def _pad(data: bytes, size: int) -> bytes:
+    return data + b"\x00" * (-len(data) % size)
+
+
+def write_compound_file(streams: Dict[str, bytes], root_clsid: Optional[str] = None) -> bytes:
+    """
+    Build a compound file from ``{"Storage/Stream": data}``. Storages are
+    created from the path segments; ``root_clsid`` (e.g. "{D7053240-...}")
+    is stored on the root entry.
+    """
+    root = _Entry("Root Entry", _ROOT, clsid=root_clsid)
+    for path, data in streams.items():
+        node = root
+        *storages, name = path.split("/")
+        for storage in storages:
+            node = node.children.setdefault(storage, _Entry(storage, _STORAGE))
+        node.children[name] = _Entry(name, _STREAM, data)
+
+    # Number the entries and link each storage's children into a balanced tree
+    entries = [root]
+
+    def link(node: _Entry) -> None:
+        children = sorted(node.children.values(), key=lambda e: _compare_key(e.name))
+        for child in children:
+            child.sid = len(entries)
+            entries.append(child)
+
+        def balance(items: List[_Entry]) -> int:
+            if not items:
+                return NOSTREAM
+            middle = len(items) // 2
+            items[middle].left = balance(items[:middle])
+            items[middle].right = balance(items[middle + 1:])
+            return items[middle].sid
+
+        node.child = balance(children)
+        for child in children:
+            link(child)
+
+    link(root)
+
+    # Small streams go to the mini stream, which is itself stored in the root entry
+    stream_entries = [e for e in entries if e.kind == _STREAM]
+    mini_stream = b""
+    mini_fat: List[int] = []
+    for entry in stream_entries:
+        if len(entry.data) < MINI_STREAM_CUTOFF and entry.data:
+            entry.start = len(mini_fat)
+            count = _sectors(len(entry.data), MINI_SECTOR_SIZE)
+            mini_fat.extend([0] * count)
+            _chain(mini_fat, entry.start, count)
+            mini_stream += _pad(entry.data, MINI_SECTOR_SIZE)
+    root.data = mini_stream
+
+    # Regular sectors: large streams, mini stream, mini FAT, directory, then FAT
+    body: List[bytes] = []
+    fat: List[int] = []
+
+    def allocate(data: bytes) -> int:
+        if not data:
+            return ENDOFCHAIN
+        start = len(fat)
+        count = _sectors(len(data), SECTOR_SIZE)
+        fat.extend([0] * count)
+        _chain(fat, start, count)
+        body.append(_pad(data, SECTOR_SIZE))
+        return start
+
+    for entry in stream_entries:
+        if len(entry.data) >= MINI_STREAM_CUTOFF:
+            entry.start = allocate(entry.data)
+    root.start = allocate(mini_stream)
+    mini_fat_bytes = struct.pack(f"<{len(mini_fat)}I", *mini_fat) if mini_fat else b""
+    mini_fat_start = allocate(_pad(mini_fat_bytes, SECTOR_SIZE))
+
+    directory = b"".join(_directory_entry(e) for e in entries)
+    directory_start = allocate(_pad(directory, SECTOR_SIZE))
+
+    fat_count = 1
+    while fat_count * (SECTOR_SIZE // 4) < len(fat) + fat_count:
+        fat_count += 1
+    if fat_count > _MAX_FAT_SECTORS:
+        raise ValueError("Compound file too large for a header-only DIFAT")
+    fat_start = len(fat)
+    fat.extend([FATSECT] * fat_count)
+    fat.extend([FREESECT] * (fat_count * (SECTOR_SIZE // 4) - len(fat)))
+
+    difat = [fat_start + i for i in range(fat_count)] + [FREESECT] * (_MAX_FAT_SECTORS - fat_count)
+    header = struct.pack(
+        "<8s16sHHHHH6sIIIIIIIII",
+        b"\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1", b"\x00" * 16, 0x003E, 0x0003, 0xFFFE, 9, 6, b"\x00" * 6,
+        0, fat_count, directory_start, 0, MINI_STREAM_CUTOFF,
+        mini_fat_start if mini_fat else ENDOFCHAIN, _sectors(len(mini_fat_bytes), SECTOR_SIZE),
+        ENDOFCHAIN, 0,
+    ) + struct.pack(f"<{_MAX_FAT_SECTORS}I", *difat)
+    return header + b"".join(body) + struct.pack(f"<{len(fat)}I", *fat)
+
+
+def _directory_entry(entry: _Entry) -> bytes:
+    name = entry.name.encode("utf-16-le")
+    if len(name) > 62:
+        raise ValueError(f"Entry name too long: {entry.name!r}")
+    clsid = uuid.UUID(entry.clsid).bytes_le if entry.clsid else b"\x00" * 16
+    size = len(entry.data) if entry.kind != _STORAGE else 0
+    start = entry.start if entry.kind != _STORAGE else 0
+    return struct.pack(
+        "<64sHBBIII16sIQQIQ",
+        name, len(name) + 2, entry.kind, _BLACK, entry.left, entry.right, entry.child,
+        clsid, 0, 0, 0, start, size,
+    )
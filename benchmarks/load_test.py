@@ -0,0 +1,138 @@
+"""
+End-to-end load test of the single-request conversion path: N simulated
+users each upload a synthetic workbook, extract its macros with
+extract_vba_from_excel and convert them with convert_vba_to_csharp.
+
+    python -m benchmarks.load_test --users 16 --duration 60 --stream --error-rate 0.05
+
+By default the requests go to an in-process mock Azure OpenAI server (see
+benchmarks.mock_azure_openai); ``--endpoint`` points the run at another
+one. The conversion cache is bypassed so every request reaches the server,
+and the macro cache is kept in a temporary directory. The client-side
+rate limiter stays active; raise AZURE_OPENAI_RPM / AZURE_OPENAI_TPM to
+measure the server rather than the limiter.
+"""
+import argparse
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from benchmarks.mock_azure_openai import add_server_arguments, server_options, start_server
+from benchmarks.synthetic import make_workbook
+
+DEPLOYMENT = "load-test"
+PROMPT = "Convert the following VBA code to C#."
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile of ``values``."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def _user(user: int, workbooks: List[bytes], deadline: float, iterations: int, stream: bool,
+          samples: List[Dict[str, Any]], lock: threading.Lock) -> None:
+    # Imported late so the endpoint and cache environment variables are already set
+    from src.conversion import convert_vba_to_csharp, extract_vba_from_excel
+
+    done = 0
+    while time.monotonic() < deadline and (not iterations or done < iterations):
+        data = workbooks[(user + done) % len(workbooks)]
+        start = time.perf_counter()
+        vba_code = extract_vba_from_excel(data, f"user{user}.xlsm")
+        extracted = time.perf_counter()
+        timings: Dict[str, Any] = {}
+        csharp_code = convert_vba_to_csharp(vba_code, f"{PROMPT} VBA Code:{vba_code}", use_cache=False,
+                                            stream=stream, timings=timings)
+        end = time.perf_counter()
+        with lock:
+            samples.append({
+                "ok": not csharp_code.startswith(("Error", "No valid")),
+                "extract": extracted - start,
+                "convert": end - extracted,
+                "first_token": timings.get("time_to_first_token", end - extracted),
+                "total": end - start,
+            })
+        done += 1
+
+
+def summarize(samples: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    ok = [s for s in samples if s["ok"]]
+    summary: Dict[str, Any] = {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "elapsed_s": elapsed,
+        "throughput_rps": len(ok) / elapsed if elapsed else 0.0,
+    }
+    for stage in ("extract", "first_token", "convert", "total"):
+        values = [s[stage] for s in ok]
+        summary[stage] = {f"p{p}": percentile(values, p) for p in (50, 95, 99)}
+    return summary
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load-test the upload -> extract -> convert flow.")
+    parser.add_argument("--users", type=int, default=8, help="Concurrent simulated users")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run")
+    parser.add_argument("--iterations", type=int, default=0, help="Stop each user after this many uploads")
+    parser.add_argument("--stream", action="store_true", help="Request streamed completions")
+    parser.add_argument("--workbooks", type=int, default=8, help="Distinct synthetic workbooks to cycle through")
+    parser.add_argument("--modules", type=int, default=4)
+    parser.add_argument("--module-lines", type=int, default=150)
+    parser.add_argument("--endpoint", help="Use this server instead of starting the mock")
+    parser.add_argument("--output", help="Write the summary as JSON")
+    add_server_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.endpoint:
+        endpoint = args.endpoint
+    else:
+        server = start_server(**server_options(args))
+        endpoint = server.endpoint
+    os.environ["ENDPOINT_URL"] = endpoint
+    os.environ.setdefault("AZURE_OPENAI_API_KEY", "load-test")
+    os.environ["DEPLOYMENT_NAME"] = os.environ.get("DEPLOYMENT_NAME", DEPLOYMENT)
+    os.environ.setdefault("VBA_CACHE_DIR", tempfile.mkdtemp(prefix="vba-load-test-"))
+
+    workbooks = [make_workbook(sheets=1, rows=50, modules=args.modules, module_lines=args.module_lines, seed=i)
+                 for i in range(args.workbooks)]
+    samples: List[Dict[str, Any]] = []
+    lock = threading.Lock()
+    start = time.monotonic()
+    deadline = start + args.duration
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        for user in range(args.users):
+            pool.submit(_user, user, workbooks, deadline, args.iterations, args.stream, samples, lock)
+    summary = summarize(samples, time.monotonic() - start)
+
+    from src.rate_limit import get_rate_limiter
+    summary["rate_limiter"] = get_rate_limiter(os.environ["DEPLOYMENT_NAME"]).stats()
+    if server is not None:
+        summary["server"] = server.stats()
+        server.shutdown()
+
+    print(f"{summary['requests']} requests, {summary['errors']} errors in {summary['elapsed_s']:.1f}s "
+          f"({summary['throughput_rps']:.2f} conversions/s)")
+    print(f"{'stage':<12} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage in ("extract", "first_token", "convert", "total"):
+        row = summary[stage]
+        print(f"{stage:<12} {row['p50'] * 1000:>9.0f} {row['p95'] * 1000:>9.0f} {row['p99'] * 1000:>9.0f}")
+    print(f"rate limiter: {summary['rate_limiter']}")
+    if "server" in summary:
+        print(f"server: {summary['server']}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,253 @@
+"""
+Local stand-in for the Azure OpenAI chat completions endpoint, for load
+tests that must not spend real quota.
+
+    python -m benchmarks.mock_azure_openai --port 8089 --latency lognormal:400:0.5 \\
+        --tokens-per-second 60 --error-rate 0.02 --rpm 600
+
+Serves POST /openai/deployments/<deployment>/chat/completions, both as a
+single JSON response and as an SSE stream (including Azure's leading chunk
+with prompt filter results and no choices). Every request waits for a
+sampled latency, then produces completion tokens at ``tokens_per_second``.
+Throttling is injected at random (``error_rate``) and when the request rate
+exceeds ``rpm``; throttled responses carry retry-after-ms and Retry-After.
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+
+_PATH_RE = re.compile(r"^/openai/deployments/([^/]+)/chat/completions")
+_CSHARP_LINES = [
+    "public static double Compute(int count)",
+    "{",
+    "    double total = 0;",
+    "    for (int i = 1; i <= count; i++)",
+    "    {",
+    "        total += worksheet.Cells[i, 1].GetValue<double>() * 2;",
+    "    }",
+    "    return total;",
+    "}",
+]
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Parse a latency distribution, in milliseconds: "fixed:200",
+    "uniform:100:400" or "lognormal:<median>:<sigma>". Returns a sampler
+    giving seconds.
+    """
+    kind, *params = spec.split(":")
+    values = [float(p) for p in params]
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0] / 1000
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1]) / 1000
+    if kind == "lognormal" and len(values) == 2:
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1]) / 1000
+    raise ValueError(f"Invalid latency spec: {spec!r}")
+
+
+def completion_text(tokens: int) -> str:
+    """C#-looking text of roughly ``tokens`` tokens (about four characters each)."""
+    out = []
+    length = 0
+    while length < tokens * 4:
+        line = _CSHARP_LINES[len(out) % len(_CSHARP_LINES)]
+        out.append(line)
+        length += len(line) + 1
+    return "\n".join(out)
+
+
+class MockAzureOpenAI(ThreadingHTTPServer):
+    """HTTP server holding the simulation settings and the served/throttled counters."""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], latency: str = "fixed:200", tokens_per_second: float = 100.0,
+                 completion_ratio: float = 1.0, max_completion_tokens: int = 4096, error_rate: float = 0.0,
+                 rpm: Optional[float] = None, seed: Optional[int] = None):
+        super().__init__(address, _Handler)
+        self.sample_latency = parse_latency(latency)
+        self.tokens_per_second = tokens_per_second
+        self.completion_ratio = completion_ratio
+        self.max_completion_tokens = max_completion_tokens
+        self.error_rate = error_rate
+        self.rpm = rpm
+        self.rng = random.Random(seed)
+        self.counters = {"requests": 0, "throttled": 0, "completed": 0}
+        self._recent: deque = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def admit(self) -> Tuple[Optional[float], float]:
+        """
+        Decide the fate of one request: returns (retry_after, latency), where a
+        retry_after in seconds means the request is throttled.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.counters["requests"] += 1
+            while self._recent and self._recent[0] <= now - 60:
+                self._recent.popleft()
+            retry_after = None
+            if self.rpm and len(self._recent) >= self.rpm:
+                retry_after = self._recent[0] + 60 - now
+            elif self.rng.random() < self.error_rate:
+                retry_after = self.rng.uniform(0.5, 2.0)
+            if retry_after is not None:
+                self.counters["throttled"] += 1
+            else:
+                self._recent.append(now)
+            return retry_after, self.sample_latency(self.rng)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockAzureOpenAI
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: Dict[str, str] = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_event(self, payload) -> None:
+        data = payload if isinstance(payload, str) else json.dumps(payload)
+        self._write_chunk(f"data: {data}\n\n".encode("utf-8"))
+
+    def do_POST(self):
+        match = _PATH_RE.match(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+        if match is None:
+            self._send_json(404, {"error": {"code": "404", "message": "Resource not found"}})
+            return
+        request = json.loads(body or b"{}")
+        deployment = match.group(1)
+
+        retry_after, latency = self.server.admit()
+        if retry_after is not None:
+            self._send_json(
+                429,
+                {"error": {"code": "429", "message": "Requests to the ChatCompletions_Create Operation have exceeded "
+                                                    "the rate limit of your current tier."}},
+                {"retry-after-ms": str(int(retry_after * 1000)), "Retry-After": str(math.ceil(retry_after))},
+            )
+            return
+
+        prompt_tokens = sum(len(m.get("content") or "") // 4 + 4 for m in request.get("messages", [])) + 3
+        completion_tokens = max(1, min(self.server.max_completion_tokens,
+                                       request.get("max_tokens") or self.server.max_completion_tokens,
+                                       int(prompt_tokens * self.server.completion_ratio)))
+        text = completion_text(completion_tokens)
+        response_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        time.sleep(latency)
+
+        if not request.get("stream"):
+            time.sleep(completion_tokens / self.server.tokens_per_second)
+            self._send_json(200, {
+                "id": response_id, "object": "chat.completion", "created": created, "model": deployment,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": text}}],
+                "usage": usage,
+            })
+        else:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self._send_event({"id": "", "object": "", "created": 0, "model": "", "choices": [],
+                              "prompt_filter_results": [{"prompt_index": 0, "content_filter_results": {}}]})
+            # One event per line of text, paced at the configured token rate
+            for line in text.splitlines(keepends=True):
+                time.sleep(max(1, len(line) // 4) / self.server.tokens_per_second)
+                self._send_event({
+                    "id": response_id, "object": "chat.completion.chunk", "created": created, "model": deployment,
+                    "choices": [{"index": 0, "delta": {"content": line}, "finish_reason": None}],
+                })
+            self._send_event({
+                "id": response_id, "object": "chat.completion.chunk", "created": created, "model": deployment,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            })
+            self._send_event("[DONE]")
+            self._write_chunk(b"")
+        with self.server._lock:
+            self.server.counters["completed"] += 1
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, **options) -> MockAzureOpenAI:
+    """Start the mock server on a daemon thread; ``port=0`` picks a free port."""
+    server = MockAzureOpenAI((host, port), **options)
+    threading.Thread(target=server.serve_forever, name="mock-azure-openai", daemon=True).start()
+    return server
+
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", default="lognormal:400:0.5",
+                        help="Latency before the first token: fixed:MS, uniform:MIN:MAX or lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--completion-ratio", type=float, default=1.0,
+                        help="Completion tokens per prompt token")
+    parser.add_argument("--max-completion-tokens", type=int, default=4096)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--rpm", type=float, help="Requests per minute before the server throttles")
+    parser.add_argument("--seed", type=int)
+
+
+def server_options(args: argparse.Namespace) -> Dict[str, object]:
+    return {
+        "latency": args.latency, "tokens_per_second": args.tokens_per_second,
+        "completion_ratio": args.completion_ratio, "max_completion_tokens": args.max_completion_tokens,
+        "error_rate": args.error_rate, "rpm": args.rpm, "seed": args.seed,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run a mock Azure OpenAI chat completions server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    add_server_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = MockAzureOpenAI((args.host, args.port), **server_options(args))
+    print(f"Mock Azure OpenAI listening on {server.endpoint}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.stats()))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
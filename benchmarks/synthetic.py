@@ -0,0 +1,568 @@
+"""
+Generator for synthetic .xlsx/.xlsm, .xlsb and .xls workbooks with a
+controllable number of sheets, cells, VBA modules, form controls, ActiveX
+controls and comments (comments: .xlsx/.xlsm only).
+
+    python -m benchmarks.synthetic out.xlsm --sheets 4 --rows 5000 --modules 20
+    python -m benchmarks.synthetic out.xls --modules 5 --form-controls 3
+
+The output is deterministic for a given set of parameters and seed.
+"""
+import argparse
+import io
+import random
+import struct
+import uuid
+import zipfile
+from typing import List, Optional, Tuple
+
+from benchmarks.cfb import write_compound_file
+from benchmarks.vba_project import MODULE_DOCUMENT, MODULE_PROCEDURAL, build_vba_project, vba_project_streams
+from src.activex import ACTIVEX_CLSID_MAP
+from src.ooxml import NS, column_letter
+
+R = NS["r"]
+_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_REL_MS = "http://schemas.microsoft.com/office/2006/relationships"
+_CT = "application/vnd.openxmlformats-officedocument.spreadsheetml"
+
+# (ctrlProps objectType, VML ObjectType, name prefix)
+_FORM_CONTROLS = [
+    ("CheckBox", "Checkbox", "Check Box"),
+    ("Button", "Button", "Button"),
+    ("Drop", "Drop", "Drop Down"),
+    ("Radio", "Radio", "Option Button"),
+    ("Spin", "Spin", "Spinner"),
+    ("List", "List", "List Box"),
+]
+_ACTIVEX_CONTROLS = ["Forms.CommandButton.1", "Forms.CheckBox.1", "Forms.TextBox.1"]
+_CLSID_BY_PROG_ID = {prog_id: clsid for clsid, prog_id in ACTIVEX_CLSID_MAP.items()}
+# Written as a bare stream after its CLSID, as Excel does for simple controls; the rest as OLE storages
+_STREAM_INIT_CONTROLS = {"Forms.CommandButton.1"}
+
+_WORDS = ["total", "amount", "customer", "invoice", "region", "rate", "count", "index", "value", "report"]
+
+
+def _rels(items: List[Tuple[str, str, str]]) -> str:
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<Relationships xmlns="{NS["rel"]}">'
+        + "".join(f'<Relationship Id="{rid}" Type="{kind}" Target="{target}"/>' for rid, kind, target in items)
+        + "</Relationships>"
+    )
+
+
+def vba_module_source(rng: random.Random, index: int, lines: int, modules: int) -> str:
+    """
+    VBA source of roughly ``lines`` lines: procedures that loop over ranges,
+    branch, and call procedures of other modules.
+    """
+    out = ["Option Explicit", ""]
+    procedure = 0
+    while len(out) < lines:
+        name = f"Proc{index}_{procedure}"
+        word = rng.choice(_WORDS)
+        out += [
+            f"Public Function {name}(ByVal {word} As Long) As Double",
+            "    Dim i As Long, acc As Double",
+            f"    For i = 1 To {word}",
+            f'        acc = acc + Worksheets("Sheet1").Range("A" & i).Value * {rng.randint(2, 9)}',
+            f"        If acc > {rng.randint(100, 10000)} Then",
+            "            acc = acc / 2",
+            "        End If",
+            "    Next i",
+        ]
+        if modules > 1:
+            target = rng.randrange(modules)
+            out.append(f"    acc = acc + Proc{target}_0({rng.randint(1, 20)})")
+        out += [f"    {name} = acc", "End Function", ""]
+        procedure += 1
+    return "\n".join(out) + "\n"
+
+
+def _activex_contents(prog_id: str, caption: str) -> bytes:
+    # [MS-OFORMS] control stream with Caption and Size set
+    text = caption.encode("latin-1")
+    string = struct.pack("<I", 0x80000000 | len(text))
+    padded = text + b"\x00" * (-len(text) % 4)
+    size = struct.pack("<ii", 2540, 635)
+    if prog_id == "Forms.CommandButton.1":
+        body = struct.pack("<I", (1 << 3) | (1 << 5)) + string + padded + size
+    else:
+        # MorphData: 8-byte PropMask, Size comes before the strings in the ExtraDataBlock
+        value = b"1" if prog_id == "Forms.CheckBox.1" else caption.encode("latin-1")
+        value_size = struct.pack("<I", 0x80000000 | len(value))
+        body = (struct.pack("<Q", (1 << 8) | (1 << 22) | (1 << 23)) + value_size + string + size
+                + value + b"\x00" * (-len(value) % 4) + padded)
+    return struct.pack("<BBH", 0, 2, len(body)) + body
+
+
+def _clsid_bytes(prog_id: str) -> bytes:
+    return uuid.UUID(_CLSID_BY_PROG_ID[prog_id]).bytes_le
+
+
+def _anchor(col: int, row: int) -> str:
+    return (
+        '<anchor moveWithCells="1">'
+        f"<from><xdr:col>{col}</xdr:col><xdr:colOff>0</xdr:colOff><xdr:row>{row}</xdr:row><xdr:rowOff>0</xdr:rowOff></from>"
+        f"<to><xdr:col>{col + 2}</xdr:col><xdr:colOff>0</xdr:colOff><xdr:row>{row + 1}</xdr:row><xdr:rowOff>0</xdr:rowOff></to>"
+        "</anchor>"
+    )
+
+
+def _vml_shape(shape_id: int, name: str, object_type: str, col: int, row: int, extra: str = "") -> str:
+    return (
+        f'<v:shape id="{name}" o:spid="_x0000_s{shape_id}" type="#_x0000_t201" style="position:absolute">'
+        f'<x:ClientData ObjectType="{object_type}"><x:Anchor>{col}, 0, {row}, 0, {col + 2}, 0, {row + 1}, 0</x:Anchor>'
+        f"{extra}</x:ClientData></v:shape>"
+    )
+
+
+def _vba_sources(rng: random.Random, modules: int, module_lines: int) -> List[Tuple[str, str, str]]:
+    sources = [("ThisWorkbook", "Private Sub Workbook_Open()\n    Proc0_0 1\nEnd Sub\n", MODULE_DOCUMENT)]
+    sources += [(f"Module{i}", vba_module_source(rng, i, module_lines, modules), MODULE_PROCEDURAL)
+                for i in range(modules)]
+    return sources
+
+
+def _write_ctrl_prop(z: zipfile.ZipFile, number: int, object_type: str) -> List[Tuple[str, str]]:
+    """Write ctrlProp{number}.xml and return its content type overrides."""
+    z.writestr(
+        f"xl/ctrlProps/ctrlProp{number}.xml",
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<formControlPr xmlns="{NS["x14"]}" objectType="{object_type}" lockText="1"/>',
+    )
+    return [(f"/xl/ctrlProps/ctrlProp{number}.xml", "application/vnd.ms-excel.controlproperties+xml")]
+
+
+def _write_activex(z: zipfile.ZipFile, number: int, prog_id: str, name: str) -> List[Tuple[str, str]]:
+    """Write activeX{number}.xml with its persisted .bin and return their content type overrides."""
+    persistence = "persistStreamInit" if prog_id in _STREAM_INIT_CONTROLS else "persistStorage"
+    z.writestr(
+        f"xl/activeX/activeX{number}.xml",
+        f'<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n'
+        f'<ax:ocx xmlns:ax="{NS["ax"]}" xmlns:r="{R}" ax:classid="{_CLSID_BY_PROG_ID[prog_id]}" '
+        f'ax:persistence="{persistence}" r:id="rId1"/>',
+    )
+    z.writestr(
+        f"xl/activeX/_rels/activeX{number}.xml.rels",
+        _rels([("rId1", f"{_REL_MS}/activeXControlBinary", f"activeX{number}.bin")]),
+    )
+    contents = _activex_contents(prog_id, f"{name} caption")
+    if persistence == "persistStreamInit":
+        binary = _clsid_bytes(prog_id) + contents
+    else:
+        binary = write_compound_file(
+            {"contents": contents, "\x03OCXNAME": (name + "\x00").encode("utf-16-le")},
+            root_clsid=_CLSID_BY_PROG_ID[prog_id],
+        )
+    z.writestr(f"xl/activeX/activeX{number}.bin", binary)
+    return [(f"/xl/activeX/activeX{number}.xml", "application/vnd.ms-office.activeX+xml"),
+            (f"/xl/activeX/activeX{number}.bin", "application/vnd.ms-office.activeX")]
+
+
+def make_workbook(sheets: int = 1, rows: int = 100, cols: int = 10, modules: int = 0, module_lines: int = 100,
+                  form_controls: int = 0, activex_controls: int = 0, comments: int = 0, seed: int = 0) -> bytes:
+    """
+    Build a workbook and return its bytes. With ``modules`` > 0 the result is
+    an .xlsm with a ThisWorkbook module plus ``modules`` standard modules of
+    about ``module_lines`` lines each.
+
+    ``rows`` x ``cols`` cells, ``form_controls``, ``activex_controls`` and
+    ``comments`` are per sheet.
+    """
+    rng = random.Random(seed)
+    buffer = io.BytesIO()
+    overrides = []
+    workbook_rels = []
+    shape_id = 1025
+    part_counters = {"ctrlProp": 0, "activeX": 0}
+
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
+        sheet_entries = []
+        for s in range(1, sheets + 1):
+            sheet_rels = []
+            xml = [
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                f'<worksheet xmlns="{NS["main"]}" xmlns:r="{R}" xmlns:mc="{NS["mc"]}" xmlns:xdr="{NS["xdr"]}" '
+                f'xmlns:x14="{NS["x14"]}"><dimension ref="A1:{column_letter(cols)}{rows}"/><sheetData>'
+            ]
+            for r in range(1, rows + 1):
+                cells = []
+                for c in range(1, cols + 1):
+                    ref = f"{column_letter(c)}{r}"
+                    if c % 3 == 1:
+                        cells.append(f'<c r="{ref}" t="inlineStr"><is><t>{rng.choice(_WORDS)} {r}</t></is></c>')
+                    else:
+                        cells.append(f'<c r="{ref}"><v>{rng.randint(0, 100000) / 100}</v></c>')
+                xml.append(f'<row r="{r}">{"".join(cells)}</row>')
+            xml.append("</sheetData>")
+
+            vml_shapes = []
+            controls = []
+            if comments:
+                comment_xml = "".join(
+                    f'<comment ref="{column_letter(i % cols + 1)}{i // cols + 1}" authorId="0"><text><r><t>'
+                    f"Check {rng.choice(_WORDS)} {i}</t></r></text></comment>"
+                    for i in range(comments)
+                )
+                z.writestr(
+                    f"xl/comments{s}.xml",
+                    f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<comments xmlns="{NS["main"]}">'
+                    f"<authors><author>Benchmark</author></authors><commentList>{comment_xml}</commentList></comments>",
+                )
+                overrides.append((f"/xl/comments{s}.xml", f"{_CT}.comments+xml"))
+                sheet_rels.append((f"rId{len(sheet_rels) + 1}", f"{_REL}/comments", f"../comments{s}.xml"))
+                for i in range(comments):
+                    vml_shapes.append(_vml_shape(
+                        shape_id, f"_x0000_s{shape_id}", "Note", i % cols + 1, i // cols,
+                        f"<x:Row>{i // cols}</x:Row><x:Column>{i % cols}</x:Column>",
+                    ))
+                    shape_id += 1
+
+            for i in range(form_controls):
+                object_type, vml_type, prefix = _FORM_CONTROLS[i % len(_FORM_CONTROLS)]
+                part_counters["ctrlProp"] += 1
+                number = part_counters["ctrlProp"]
+                overrides.extend(_write_ctrl_prop(z, number, object_type))
+                rid = f"rId{len(sheet_rels) + 1}"
+                sheet_rels.append((rid, f"{_REL}/ctrlProp", f"../ctrlProps/ctrlProp{number}.xml"))
+                name = f"{prefix} {shape_id}"
+                col, row = cols + 1, 2 + i * 2
+                vml_shapes.append(_vml_shape(shape_id, name, vml_type, col, row))
+                controls.append(
+                    f'<mc:AlternateContent><mc:Choice Requires="x14"><control shapeId="{shape_id}" r:id="{rid}" '
+                    f'name="{name}"><controlPr defaultSize="0" autoPict="0">{_anchor(col, row)}</controlPr></control>'
+                    f"</mc:Choice></mc:AlternateContent>"
+                )
+                shape_id += 1
+
+            for i in range(activex_controls):
+                prog_id = _ACTIVEX_CONTROLS[i % len(_ACTIVEX_CONTROLS)]
+                part_counters["activeX"] += 1
+                number = part_counters["activeX"]
+                name = f"{prog_id.split('.')[1]}{number}"
+                overrides.extend(_write_activex(z, number, prog_id, name))
+                rid = f"rId{len(sheet_rels) + 1}"
+                sheet_rels.append((rid, f"{_REL}/control", f"../activeX/activeX{number}.xml"))
+                col, row = cols + 4, 2 + i * 2
+                vml_shapes.append(_vml_shape(shape_id, name, "Pict", col, row))
+                controls.append(
+                    f'<mc:AlternateContent><mc:Choice Requires="x14"><control shapeId="{shape_id}" r:id="{rid}" '
+                    f'name="{name}"><controlPr defaultSize="0" autoLine="0">{_anchor(col, row)}</controlPr></control>'
+                    f'</mc:Choice><mc:Fallback><control shapeId="{shape_id}" r:id="{rid}" name="{name}"/></mc:Fallback>'
+                    "</mc:AlternateContent>"
+                )
+                shape_id += 1
+
+            if vml_shapes:
+                z.writestr(
+                    f"xl/drawings/vmlDrawing{s}.vml",
+                    '<xml xmlns:v="urn:schemas-microsoft-com:vml" xmlns:o="urn:schemas-microsoft-com:office:office" '
+                    'xmlns:x="urn:schemas-microsoft-com:office:excel">' + "".join(vml_shapes) + "</xml>",
+                )
+                rid = f"rId{len(sheet_rels) + 1}"
+                sheet_rels.append((rid, f"{_REL}/vmlDrawing", f"../drawings/vmlDrawing{s}.vml"))
+                xml.append(f'<legacyDrawing r:id="{rid}"/>')
+            if controls:
+                xml.append(f'<mc:AlternateContent><mc:Choice Requires="x14"><controls>{"".join(controls)}</controls>'
+                           "</mc:Choice></mc:AlternateContent>")
+            xml.append("</worksheet>")
+
+            z.writestr(f"xl/worksheets/sheet{s}.xml", "".join(xml))
+            overrides.append((f"/xl/worksheets/sheet{s}.xml", f"{_CT}.worksheet+xml"))
+            if sheet_rels:
+                z.writestr(f"xl/worksheets/_rels/sheet{s}.xml.rels", _rels(sheet_rels))
+            workbook_rels.append((f"rId{s}", f"{_REL}/worksheet", f"worksheets/sheet{s}.xml"))
+            sheet_entries.append(f'<sheet name="Sheet{s}" sheetId="{s}" r:id="rId{s}"/>')
+
+        if modules:
+            z.writestr("xl/vbaProject.bin", build_vba_project(_vba_sources(rng, modules, module_lines)))
+            overrides.append(("/xl/vbaProject.bin", "application/vnd.ms-office.vbaProject"))
+            workbook_rels.append((f"rId{sheets + 1}", f"{_REL_MS}/vbaProject", "vbaProject.bin"))
+            main_type = "application/vnd.ms-excel.sheet.macroEnabled.main+xml"
+        else:
+            main_type = f"{_CT}.sheet.main+xml"
+
+        z.writestr(
+            "xl/workbook.xml",
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<workbook xmlns="{NS["main"]}" xmlns:r="{R}">'
+            f'<sheets>{"".join(sheet_entries)}</sheets></workbook>',
+        )
+        z.writestr("xl/_rels/workbook.xml.rels", _rels(workbook_rels))
+        z.writestr("_rels/.rels", _rels([("rId1", f"{_REL}/officeDocument", "xl/workbook.xml")]))
+        overrides.append(("/xl/workbook.xml", main_type))
+        z.writestr(
+            "[Content_Types].xml",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Default Extension="vml" ContentType="application/vnd.openxmlformats-officedocument.vmlDrawing"/>'
+            + "".join(f'<Override PartName="{name}" ContentType="{kind}"/>' for name, kind in overrides)
+            + "</Types>",
+        )
+    return buffer.getvalue()
+
+
+# BIFF12 (.xlsb) records
+_BRT_ROW_HDR, _BRT_CELL_REAL, _BRT_CELL_ST = 0x00, 0x05, 0x06
+_BRT_BEGIN_SHEET, _BRT_END_SHEET, _BRT_BEGIN_BOOK, _BRT_END_BOOK = 0x81, 0x82, 0x83, 0x84
+_BRT_BEGIN_BUNDLE_SHS, _BRT_END_BUNDLE_SHS, _BRT_BEGIN_SHEET_DATA, _BRT_END_SHEET_DATA = 0x8F, 0x90, 0x91, 0x92
+_BRT_BUNDLE_SH = 0x9C
+# Control records start with the shape id and the relationship id, which is all the scanner reads
+_BRT_CONTROL = 0x0285
+
+
+def _biff12(record_type: int, payload: bytes = b"") -> bytes:
+    header = bytearray([record_type & 0x7F | (0x80 if record_type > 0x7F else 0)])
+    if record_type > 0x7F:
+        header.append(record_type >> 7)
+    size = len(payload)
+    while True:
+        header.append(size & 0x7F | (0x80 if size > 0x7F else 0))
+        size >>= 7
+        if not size:
+            break
+    return bytes(header) + payload
+
+
+def _wide(text: str) -> bytes:
+    return struct.pack("<I", len(text)) + text.encode("utf-16-le")
+
+
+def make_xlsb(sheets: int = 1, rows: int = 100, cols: int = 10, modules: int = 0, module_lines: int = 100,
+              form_controls: int = 0, activex_controls: int = 0, seed: int = 0) -> bytes:
+    """
+    Build an .xlsb workbook: the same cells, modules and controls as
+    make_workbook, with binary workbook and sheet parts.
+    """
+    rng = random.Random(seed)
+    buffer = io.BytesIO()
+    overrides = []
+    workbook_rels = []
+    shape_id = 1025
+    part_counters = {"ctrlProp": 0, "activeX": 0}
+
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
+        bundle = []
+        for s in range(1, sheets + 1):
+            sheet_rels = []
+            records = [_biff12(_BRT_BEGIN_SHEET), _biff12(_BRT_BEGIN_SHEET_DATA)]
+            for r in range(rows):
+                records.append(_biff12(_BRT_ROW_HDR, struct.pack("<IIHBBBI", r, 0, 300, 0, 0, 0, 0)))
+                for c in range(cols):
+                    if c % 3 == 0:
+                        records.append(_biff12(_BRT_CELL_ST, struct.pack("<II", c, 0) + _wide(f"{rng.choice(_WORDS)} {r + 1}")))
+                    else:
+                        records.append(_biff12(_BRT_CELL_REAL, struct.pack("<IId", c, 0, rng.randint(0, 100000) / 100)))
+            records.append(_biff12(_BRT_END_SHEET_DATA))
+
+            vml_shapes = []
+            for i in range(form_controls):
+                object_type, vml_type, prefix = _FORM_CONTROLS[i % len(_FORM_CONTROLS)]
+                part_counters["ctrlProp"] += 1
+                overrides.extend(_write_ctrl_prop(z, part_counters["ctrlProp"], object_type))
+                rid = f"rId{len(sheet_rels) + 1}"
+                sheet_rels.append((rid, f"{_REL}/ctrlProp", f"../ctrlProps/ctrlProp{part_counters['ctrlProp']}.xml"))
+                vml_shapes.append(_vml_shape(shape_id, f"{prefix} {shape_id}", vml_type, cols + 1, 2 + i * 2))
+                records.append(_biff12(_BRT_CONTROL, struct.pack("<I", shape_id) + _wide(rid)))
+                shape_id += 1
+            for i in range(activex_controls):
+                prog_id = _ACTIVEX_CONTROLS[i % len(_ACTIVEX_CONTROLS)]
+                part_counters["activeX"] += 1
+                number = part_counters["activeX"]
+                name = f"{prog_id.split('.')[1]}{number}"
+                overrides.extend(_write_activex(z, number, prog_id, name))
+                rid = f"rId{len(sheet_rels) + 1}"
+                sheet_rels.append((rid, f"{_REL}/control", f"../activeX/activeX{number}.xml"))
+                vml_shapes.append(_vml_shape(shape_id, name, "Pict", cols + 4, 2 + i * 2))
+                records.append(_biff12(_BRT_CONTROL, struct.pack("<I", shape_id) + _wide(rid)))
+                shape_id += 1
+            if vml_shapes:
+                z.writestr(
+                    f"xl/drawings/vmlDrawing{s}.vml",
+                    '<xml xmlns:v="urn:schemas-microsoft-com:vml" xmlns:o="urn:schemas-microsoft-com:office:office" '
+                    'xmlns:x="urn:schemas-microsoft-com:office:excel">' + "".join(vml_shapes) + "</xml>",
+                )
+                sheet_rels.append((f"rId{len(sheet_rels) + 1}", f"{_REL}/vmlDrawing", f"../drawings/vmlDrawing{s}.vml"))
+            records.append(_biff12(_BRT_END_SHEET))
+
+            z.writestr(f"xl/worksheets/sheet{s}.bin", b"".join(records))
+            overrides.append((f"/xl/worksheets/sheet{s}.bin", "application/vnd.ms-excel.worksheet"))
+            if sheet_rels:
+                z.writestr(f"xl/worksheets/_rels/sheet{s}.bin.rels", _rels(sheet_rels))
+            workbook_rels.append((f"rId{s}", f"{_REL}/worksheet", f"worksheets/sheet{s}.bin"))
+            bundle.append(_biff12(_BRT_BUNDLE_SH, struct.pack("<II", 0, s) + _wide(f"rId{s}") + _wide(f"Sheet{s}")))
+
+        if modules:
+            z.writestr("xl/vbaProject.bin", build_vba_project(_vba_sources(rng, modules, module_lines)))
+            overrides.append(("/xl/vbaProject.bin", "application/vnd.ms-office.vbaProject"))
+            workbook_rels.append((f"rId{sheets + 1}", f"{_REL_MS}/vbaProject", "vbaProject.bin"))
+
+        z.writestr("xl/workbook.bin", b"".join(
+            [_biff12(_BRT_BEGIN_BOOK), _biff12(_BRT_BEGIN_BUNDLE_SHS)] + bundle
+            + [_biff12(_BRT_END_BUNDLE_SHS), _biff12(_BRT_END_BOOK)]
+        ))
+        z.writestr("xl/_rels/workbook.bin.rels", _rels(workbook_rels))
+        z.writestr("_rels/.rels", _rels([("rId1", f"{_REL}/officeDocument", "xl/workbook.bin")]))
+        overrides.append(("/xl/workbook.bin", "application/vnd.ms-excel.sheet.binary.macroEnabled.main"))
+        z.writestr(
+            "[Content_Types].xml",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Default Extension="vml" ContentType="application/vnd.openxmlformats-officedocument.vmlDrawing"/>'
+            + "".join(f'<Override PartName="{name}" ContentType="{kind}"/>' for name, kind in overrides)
+            + "</Types>",
+        )
+    return buffer.getvalue()
+
+
+# BIFF8 (.xls) records, OBJ sub-records and ftCmo object types
+_BOF, _EOF, _BOUNDSHEET, _NUMBER, _MSODRAWING, _OBJ = 0x0809, 0x000A, 0x0085, 0x0203, 0x00EC, 0x005D
+_INDEX, _DBCELL = 0x020B, 0x00D7
+_FT_END, _FT_CF, _FT_PIO_GRBIT, _FT_PICT_FMLA, _FT_CMO = 0x00, 0x07, 0x08, 0x09, 0x15
+_OT_PICTURE = 0x08
+_XLS_FORM_CONTROLS = [(0x0B, "Check Box"), (0x07, "Button"), (0x14, "Drop Down"), (0x0C, "Option Button"),
+                      (0x10, "Spinner"), (0x12, "List Box")]
+
+
+def _biff8(record_type: int, payload: bytes = b"") -> bytes:
+    return struct.pack("<HH", record_type, len(payload)) + payload
+
+
+def _art(version: int, instance: int, record_type: int, body: bytes) -> bytes:
+    # OfficeArt record header: version and instance, type, length
+    return struct.pack("<HHI", version | instance << 4, record_type, len(body)) + body
+
+
+def _art_shape(spid: int, name: str, col: int, row: int) -> bytes:
+    wide_name = (name + "\x00").encode("utf-16-le")
+    return _art(0xF, 0, 0xF004, b"".join([
+        _art(2, 201, 0xF00A, struct.pack("<II", spid, 0xA00)),
+        _art(3, 1, 0xF00B, struct.pack("<HI", 0x8380, len(wide_name)) + wide_name),
+        _art(0, 0, 0xF010, struct.pack("<9H", 0, col, 0, row, 0, col + 2, 0, row + 1, 0)),
+        _art(0, 0, 0xF011, b""),
+    ]))
+
+
+def _obj(object_type: int, object_id: int, prog_id: Optional[str] = None, ctl_pos: int = 0, ctl_size: int = 0) -> bytes:
+    subrecords = [struct.pack("<HHHHH", _FT_CMO, 18, object_type, object_id, 0x6011) + b"\x00" * 12]
+    if prog_id is not None:
+        # Embedded object formula (a table token) with the class name, then the Ctls stream location
+        name = prog_id.encode("latin-1")
+        formula = struct.pack("<HI", 5, 0) + b"\x02" + b"\x00" * 4 + bytes([0x03, len(name), 0, 0]) + name
+        formula += b"\x00" * (len(formula) % 2)
+        body = struct.pack("<H", len(formula)) + formula + struct.pack("<II", ctl_pos, ctl_size)
+        subrecords += [
+            struct.pack("<HHH", _FT_CF, 2, 0xFFFF),
+            struct.pack("<HHH", _FT_PIO_GRBIT, 2, 0x0010),
+            struct.pack("<HH", _FT_PICT_FMLA, len(body)) + body,
+        ]
+    return _biff8(_OBJ, b"".join(subrecords) + struct.pack("<HH", _FT_END, 0))
+
+
+def make_xls(sheets: int = 1, rows: int = 100, cols: int = 10, modules: int = 0, module_lines: int = 100,
+             form_controls: int = 0, activex_controls: int = 0, seed: int = 0) -> bytes:
+    """
+    Build a legacy .xls workbook (BIFF8): numeric cells, form controls and
+    ActiveX controls as OBJ records with their drawing records, ActiveX state
+    in the Ctls stream and the VBA project under _VBA_PROJECT_CUR.
+    """
+    rng = random.Random(seed)
+    ctls = bytearray()
+    substreams = []
+    spid = 1025
+    globals_bof = _biff8(_BOF, struct.pack("<HHHHII", 0x0600, 0x0005, 0x0DBB, 0x07CC, 0, 6))
+    boundsheet_sizes = [4 + 8 + len(f"Sheet{s}") for s in range(1, sheets + 1)]
+    offset = len(globals_bof) + sum(boundsheet_sizes) + 4
+    for s in range(1, sheets + 1):
+        records = [_biff8(_BOF, struct.pack("<HHHHII", 0x0600, 0x0010, 0x0DBB, 0x07CC, 0, 6))]
+        # INDEX lists the stream position of the DBCELL record closing each block of 32 rows
+        blocks = -(-rows // 32)
+        position = offset + 20 + 4 + 16 + 4 * blocks
+        cells, dbcells = [], []
+        for r in range(rows):
+            for c in range(cols):
+                cells.append(_biff8(_NUMBER, struct.pack("<HHHd", r, c, 15, rng.randint(0, 100000) / 100)))
+                position += len(cells[-1])
+            if r % 32 == 31 or r == rows - 1:
+                dbcells.append(position)
+                cells.append(_biff8(_DBCELL, struct.pack("<I", 0)))
+                position += len(cells[-1])
+        records.append(_biff8(_INDEX, struct.pack("<IIII", 0, 0, rows, 0) + struct.pack(f"<{blocks}I", *dbcells)))
+        records.extend(cells)
+        shapes = []
+        for i in range(form_controls):
+            object_type, prefix = _XLS_FORM_CONTROLS[i % len(_XLS_FORM_CONTROLS)]
+            shapes.append((_art_shape(spid, f"{prefix} {spid}", cols + 1, 2 + i * 2), _obj(object_type, spid - 1024)))
+            spid += 1
+        for i in range(activex_controls):
+            prog_id = _ACTIVEX_CONTROLS[i % len(_ACTIVEX_CONTROLS)]
+            name = f"{prog_id.split('.')[1]}{spid - 1024}"
+            # Each control in Ctls is its CLSID followed by the persisted stream
+            contents = _clsid_bytes(prog_id) + _activex_contents(prog_id, f"{name} caption")
+            obj = _obj(_OT_PICTURE, spid - 1024, prog_id, len(ctls), len(contents))
+            ctls += contents
+            shapes.append((_art_shape(spid, name, cols + 4, 2 + i * 2), obj))
+            spid += 1
+        if shapes:
+            # The first drawing record opens the sheet's drawing and group containers
+            group = _art(0xF, 0, 0xF004, _art(1, 0, 0xF009, b"\x00" * 16) + _art(2, 0, 0xF00A, struct.pack("<II", spid, 0x5)))
+            total = len(group) + sum(len(art) for art, _ in shapes)
+            opening = (struct.pack("<HHI", 0xF, 0xF002, 16 + 8 + total) + _art(0, s, 0xF008, struct.pack("<II", len(shapes), spid))
+                       + struct.pack("<HHI", 0xF, 0xF003, total) + group)
+            for i, (art, obj) in enumerate(shapes):
+                records.append(_biff8(_MSODRAWING, (opening if i == 0 else b"") + art))
+                records.append(obj)
+        records.append(_biff8(_EOF))
+        substreams.append(b"".join(records))
+        offset += len(substreams[-1])
+
+    offset = len(globals_bof) + sum(boundsheet_sizes) + 4
+    boundsheets = []
+    for s, substream in enumerate(substreams, 1):
+        name = f"Sheet{s}".encode("latin-1")
+        boundsheets.append(_biff8(_BOUNDSHEET, struct.pack("<IBBBB", offset, 0, 0, len(name), 0) + name))
+        offset += len(substream)
+    streams = {"Workbook": globals_bof + b"".join(boundsheets) + _biff8(_EOF) + b"".join(substreams)}
+    if ctls:
+        streams["Ctls"] = bytes(ctls)
+    if modules:
+        streams.update(vba_project_streams(_vba_sources(rng, modules, module_lines), prefix="_VBA_PROJECT_CUR/"))
+    return write_compound_file(streams)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Write a synthetic workbook for benchmarking.")
+    parser.add_argument("output", help="Target path; .xlsb and .xls select those formats, anything else is "
+                                           "written as .xlsm when --modules > 0, else .xlsx")
+    parser.add_argument("--sheets", type=int, default=1)
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--cols", type=int, default=10)
+    parser.add_argument("--modules", type=int, default=0)
+    parser.add_argument("--module-lines", type=int, default=100)
+    parser.add_argument("--form-controls", type=int, default=0, help="Per sheet")
+    parser.add_argument("--activex-controls", type=int, default=0, help="Per sheet")
+    parser.add_argument("--comments", type=int, default=0, help="Per sheet")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    extension = args.output.lower().rsplit(".", 1)[-1]
+    if extension in ("xlsb", "xls"):
+        make = make_xlsb if extension == "xlsb" else make_xls
+        data = make(args.sheets, args.rows, args.cols, args.modules, args.module_lines,
+                    args.form_controls, args.activex_controls, args.seed)
+    else:
+        data = make_workbook(args.sheets, args.rows, args.cols, args.modules, args.module_lines,
+                             args.form_controls, args.activex_controls, args.comments, args.seed)
+    with open(args.output, "wb") as f:
+        f.write(data)
+    print(f"Wrote {args.output} ({len(data) / 1024:.0f} KiB)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,66 @@
+"""
+Smoke tests for the benchmark runners: each one runs end to end on a tiny
+input, so a change to the extractors or the conversion path that breaks a
+benchmark fails here rather than on the next manual run.
+
+    python -m pytest benchmarks
+"""
+import json
+
+import pytest
+
+from benchmarks import bench_extraction, load_test, synthetic
+from src.scanner import scan_workbook
+
+pytest.importorskip("oletools")
+
+TINY = dict(sheets=1, rows=10, cols=3, modules=2, module_lines=20, form_controls=1, activex_controls=1)
+
+
+@pytest.mark.parametrize("make", [synthetic.make_workbook, synthetic.make_xlsb, synthetic.make_xls])
+def test_synthetic_workbooks_scan(make):
+    scan = scan_workbook(make(**TINY), "benchmark.xlsm")
+    assert not scan["errors"]
+    assert len(scan["modules"]) >= TINY["modules"]
+    assert scan["controls"]
+
+
+def test_synthetic_cli_writes_workbook(tmp_path):
+    path = tmp_path / "out.xls"
+    assert synthetic.main([str(path), "--modules", "1", "--module-lines", "10", "--rows", "5"]) == 0
+    assert path.stat().st_size > 0
+
+
+def test_bench_extraction_small(tmp_path, monkeypatch):
+    monkeypatch.setitem(bench_extraction.TIERS, "small", dict(TINY, comments=2))
+    output = tmp_path / "bench.json"
+    argv = ["--tiers", "small", "--formats", *bench_extraction.FORMATS, "--extractors", *bench_extraction.EXTRACTORS,
+            "--repeat", "1"]
+    assert bench_extraction.main(argv + ["--output", str(output)]) == 0
+    results = json.loads(output.read_text())
+    expected = len(bench_extraction.FORMATS) * len(bench_extraction.EXTRACTORS) - len(bench_extraction.UNSUPPORTED)
+    assert len(results) == expected
+    # Comparing a run against itself with a generous tolerance finds no regression
+    assert bench_extraction.main(argv + ["--baseline", str(output), "--max-regression", "100"]) == 0
+
+
+def test_bench_extraction_reports_regressions():
+    baseline = [{"tier": "small", "format": "xlsm", "extractor": "vba", "median_s": 0.1, "peak_mib": 1.0}]
+    result = dict(baseline[0], median_s=0.2)
+    assert bench_extraction.compare([result], baseline, 0.25) == ["small/xlsm/vba median_s: 0.100 -> 0.200 (+100%)"]
+
+
+def test_load_test_one_user(tmp_path, monkeypatch):
+    pytest.importorskip("openai")
+    for name in ("ENDPOINT_URL", "AZURE_OPENAI_API_KEY", "DEPLOYMENT_NAME"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("VBA_CACHE_DIR", str(tmp_path / "cache"))
+    output = tmp_path / "load.json"
+    argv = ["--users", "1", "--iterations", "1", "--duration", "60", "--workbooks", "1", "--modules", "1",
+            "--module-lines", "10", "--latency", "fixed:1", "--tokens-per-second", "100000", "--stream",
+            "--output", str(output)]
+    assert load_test.main(argv) == 0
+    summary = json.loads(output.read_text())
+    assert summary["requests"] == 1
+    assert summary["errors"] == 0
+    assert summary["server"]["completed"] == 1
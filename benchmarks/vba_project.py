@@ -0,0 +1,147 @@
+"""
+Builds vbaProject.bin parts ([MS-OVBA]) from plain VBA source, so synthetic
+workbooks carry real, extractable macros.
+
+Modules are written without a p-code cache; Office recompiles them from
+source on open, and extractors only ever read the compressed source.
+"""
+import struct
+import uuid
+from typing import Dict, List, Tuple
+
+from benchmarks.cfb import write_compound_file
+
+CHUNK_SIZE = 4096
+_MAX_CANDIDATES = 32
+
+MODULE_PROCEDURAL = "procedural"
+MODULE_DOCUMENT = "document"
+
+
+def _copy_token_shape(offset_in_chunk: int) -> Tuple[int, int]:
+    # The split between offset and length bits grows with the position in the chunk
+    bit_count = max((offset_in_chunk - 1).bit_length(), 4)
+    length_mask = 0xFFFF >> bit_count
+    return bit_count, length_mask + 3
+
+
+def _compress_chunk(chunk: bytes) -> bytes:
+    out = bytearray()
+    positions: Dict[bytes, List[int]] = {}
+    current = 0
+    while current < len(chunk):
+        flag_index = len(out)
+        out.append(0)
+        for bit in range(8):
+            if current >= len(chunk):
+                break
+            bit_count, max_length = _copy_token_shape(current)
+            best_length, best_offset = 0, 0
+            key = chunk[current:current + 3]
+            for candidate in reversed(positions.get(key, [])[-_MAX_CANDIDATES:]):
+                length = 0
+                limit = min(max_length, len(chunk) - current)
+                while length < limit and chunk[candidate + length] == chunk[current + length]:
+                    length += 1
+                if length > best_length:
+                    best_length, best_offset = length, current - candidate
+                    if length == limit:
+                        break
+            step = best_length if best_length >= 3 else 1
+            for position in range(current, current + step):
+                positions.setdefault(chunk[position:position + 3], []).append(position)
+            if best_length >= 3:
+                token = ((best_offset - 1) << (16 - bit_count)) | (best_length - 3)
+                out += struct.pack("<H", token)
+                out[flag_index] |= 1 << bit
+            else:
+                out.append(chunk[current])
+            current += step
+    if len(out) > CHUNK_SIZE:
+        # Incompressible chunk: stored raw, which must be exactly 4096 bytes
+        return struct.pack("<H", 0x3FFF) + chunk.ljust(CHUNK_SIZE, b"\x00")
+    return struct.pack("<H", 0xB000 | (len(out) + 2 - 3)) + bytes(out)
+
+
+def compress(data: bytes) -> bytes:
+    """Compress ``data`` into an [MS-OVBA] 2.4.1 CompressedContainer."""
+    return b"\x01" + b"".join(_compress_chunk(data[i:i + CHUNK_SIZE]) for i in range(0, len(data), CHUNK_SIZE))
+
+
+def _record(record_id: int, data: bytes) -> bytes:
+    return struct.pack("<HI", record_id, len(data)) + data
+
+
+def _dir_stream(project_name: str, modules: List[Tuple[str, str, str]], codepage: int) -> bytes:
+    encoding = f"cp{codepage}"
+    parts = [
+        _record(0x0001, struct.pack("<I", 1)),                 # PROJECTSYSKIND: 32-bit Windows
+        _record(0x0002, struct.pack("<I", 0x409)),             # PROJECTLCID
+        _record(0x0014, struct.pack("<I", 0x409)),             # PROJECTLCIDINVOKE
+        _record(0x0003, struct.pack("<H", codepage)),          # PROJECTCODEPAGE
+        _record(0x0004, project_name.encode(encoding)),        # PROJECTNAME
+        _record(0x0005, b""), _record(0x0040, b""),            # PROJECTDOCSTRING
+        _record(0x0006, b""), _record(0x003D, b""),            # PROJECTHELPFILEPATH
+        _record(0x0007, struct.pack("<I", 0)),                 # PROJECTHELPCONTEXT
+        _record(0x0008, struct.pack("<I", 0)),                 # PROJECTLIBFLAGS
+        struct.pack("<HIIH", 0x0009, 4, 1, 0),                 # PROJECTVERSION
+        _record(0x000C, b""), _record(0x003C, b""),            # PROJECTCONSTANTS
+        _record(0x000F, struct.pack("<H", len(modules))),      # PROJECTMODULES
+        _record(0x0013, struct.pack("<H", 0xFFFF)),            # PROJECTCOOKIE
+    ]
+    for name, _, kind in modules:
+        unicode_name = name.encode("utf-16-le")
+        parts += [
+            _record(0x0019, name.encode(encoding)),            # MODULENAME
+            _record(0x0047, unicode_name),                     # MODULENAMEUNICODE
+            _record(0x001A, name.encode(encoding)),            # MODULESTREAMNAME
+            _record(0x0032, unicode_name),
+            _record(0x001C, b""), _record(0x0048, b""),        # MODULEDOCSTRING
+            _record(0x0031, struct.pack("<I", 0)),             # MODULEOFFSET: no p-code before the source
+            _record(0x001E, struct.pack("<I", 0)),             # MODULEHELPCONTEXT
+            _record(0x002C, struct.pack("<H", 0xFFFF)),        # MODULECOOKIE
+            _record(0x0021 if kind == MODULE_PROCEDURAL else 0x0022, b""),  # MODULETYPE
+            _record(0x002B, b""),                              # MODULE terminator
+        ]
+    parts.append(_record(0x0010, b""))                        # dir terminator
+    return b"".join(parts)
+
+
+def _project_stream(project_name: str, modules: List[Tuple[str, str, str]]) -> bytes:
+    lines = [f'ID="{{{str(uuid.uuid5(uuid.NAMESPACE_OID, project_name)).upper()}}}"']
+    for name, _, kind in modules:
+        lines.append(f"Module={name}" if kind == MODULE_PROCEDURAL else f"Document={name}/&H00000000")
+    lines += [f'Name="{project_name}"', 'HelpContextID="0"', 'VersionCompatible32="393222000"', "",
+              "[Host Extender Info]", "&H00000001={3832D640-CF90-11CF-8E43-00A0C911005A};VBE;&H00000000", ""]
+    return "\r\n".join(lines).encode("latin-1")
+
+
+def build_vba_project(modules: List[Tuple[str, str, str]], project_name: str = "VBAProject",
+                      codepage: int = 1252) -> bytes:
+    """
+    Build a vbaProject.bin holding ``modules``, given as (name, source, kind)
+    with kind MODULE_PROCEDURAL or MODULE_DOCUMENT.
+    """
+    return write_compound_file(vba_project_streams(modules, project_name, codepage))
+
+
+def vba_project_streams(modules: List[Tuple[str, str, str]], project_name: str = "VBAProject",
+                        codepage: int = 1252, prefix: str = "") -> Dict[str, bytes]:
+    """
+    The streams of a VBA project as {path: data}, each path prefixed with
+    ``prefix`` (e.g. "_VBA_PROJECT_CUR/", where .xls files keep the project).
+    """
+    streams = {
+        "PROJECT": _project_stream(project_name, modules),
+        # _VBA_PROJECT with version 0xFFFF: no p-code, the project must be recompiled
+        "VBA/_VBA_PROJECT": b"\xCC\x61\xFF\xFF\x00\x00\x00",
+        "VBA/dir": compress(_dir_stream(project_name, modules, codepage)),
+    }
+    for name, source, kind in modules:
+        header = f'Attribute VB_Name = "{name}"\r\n'
+        if kind == MODULE_DOCUMENT:
+            header += "Attribute VB_Base = \"0{00020819-0000-0000-C000-000000000046}\"\r\n" \
+                      "Attribute VB_GlobalNameSpace = False\r\nAttribute VB_Creatable = False\r\n" \
+                      "Attribute VB_PredeclaredId = True\r\nAttribute VB_Exposed = True\r\n"
+        streams[f"VBA/{name}"] = compress((header + source.replace("\n", "\r\n")).encode(f"cp{codepage}"))
+    return {prefix + path: data for path, data in streams.items()}
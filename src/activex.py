@@ -0,0 +1,232 @@
+"""
+Excel-free decoder for the persisted state of Forms 2.0 ActiveX controls
+(xl/activeX/activeX*.bin), following the [MS-OFORMS] binary layouts.
+
+Only the properties users ask for are surfaced: Caption, Value and Text.
+"""
+import struct
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import olefile
+
+from src.ooxml import NS, OOXMLPackage
+
+# ActiveX controls are identified by CLSID in xl/activeX/activeX*.xml
+ACTIVEX_CLSID_MAP = {
+    '{D7053240-CE69-11CD-A777-00DD01143C57}': 'Forms.CommandButton.1',
+    '{8BD21D40-EC42-11CE-9E0D-00AA006002F3}': 'Forms.CheckBox.1',
+    '{8BD21D30-EC42-11CE-9E0D-00AA006002F3}': 'Forms.ComboBox.1',
+    '{8BD21D20-EC42-11CE-9E0D-00AA006002F3}': 'Forms.ListBox.1',
+    '{8BD21D10-EC42-11CE-9E0D-00AA006002F3}': 'Forms.TextBox.1',
+    '{8BD21D50-EC42-11CE-9E0D-00AA006002F3}': 'Forms.OptionButton.1',
+    '{8BD21D60-EC42-11CE-9E0D-00AA006002F3}': 'Forms.ToggleButton.1',
+    '{6E182020-F460-11CE-9BCD-00AA00608E01}': 'Forms.Frame.1',
+    '{978C9E23-D4B0-11CE-BF2D-00AA003F40D0}': 'Forms.Label.1',
+    '{DFD181E0-5E2F-11CE-A449-00AA004A803D}': 'Forms.ScrollBar.1',
+    '{79176FB0-B7F2-11CE-97EF-00AA006D2776}': 'Forms.SpinButton.1',
+    '{4C599241-6926-101B-9992-00000B65C6F9}': 'Forms.Image.1',
+}
+
+# DataBlock layouts as (PropMask bit, property, size). A size of "str" is an
+# fmString length whose characters follow in the ExtraDataBlock.
+_COMMAND_BUTTON = [
+    (0, "ForeColor", 4), (1, "BackColor", 4), (2, "VariousPropertyBits", 4), (3, "Caption", "str"),
+    (4, "PicturePosition", 4), (6, "MousePointer", 1), (7, "Picture", 2), (8, "Accelerator", 2),
+    (10, "MouseIcon", 2),
+]
+_LABEL = [
+    (0, "ForeColor", 4), (1, "BackColor", 4), (2, "VariousPropertyBits", 4), (3, "Caption", "str"),
+    (4, "PicturePosition", 4), (6, "MousePointer", 1), (7, "BorderColor", 4), (8, "BorderStyle", 2),
+    (9, "SpecialEffect", 2), (10, "Picture", 2), (11, "Accelerator", 2), (12, "MouseIcon", 2),
+]
+_MORPH_DATA = [
+    (0, "VariousPropertyBits", 4), (1, "BackColor", 4), (2, "ForeColor", 4), (3, "MaxLength", 4),
+    (4, "BorderStyle", 1), (5, "ScrollBars", 1), (6, "DisplayStyle", 1), (7, "MousePointer", 1),
+    (9, "PasswordChar", 2), (10, "ListWidth", 4), (11, "BoundColumn", 2), (12, "TextColumn", 2),
+    (13, "ColumnCount", 2), (14, "ListRows", 2), (15, "cColumnInfo", 2), (16, "MatchEntry", 1),
+    (17, "ListStyle", 1), (18, "ShowDropButtonWhen", 1), (20, "DropButtonStyle", 1), (21, "MultiSelect", 1),
+    (22, "Value", "str"), (23, "Caption", "str"), (24, "PicturePosition", 4), (25, "BorderColor", 4),
+    (26, "SpecialEffect", 4), (27, "MouseIcon", 2), (28, "Picture", 2), (29, "Accelerator", 2),
+    (32, "GroupName", "str"),
+]
+_SPIN_BUTTON = [
+    (0, "ForeColor", 4), (1, "BackColor", 4), (2, "VariousPropertyBits", 4), (5, "Min", 4), (6, "Max", 4),
+    (7, "Position", 4), (8, "PrevEnabled", 4), (9, "NextEnabled", 4), (10, "SmallChange", 4),
+    (11, "Orientation", 4), (12, "Delay", 4), (13, "MouseIcon", 2), (14, "MousePointer", 1),
+]
+_SCROLL_BAR = [
+    (0, "ForeColor", 4), (1, "BackColor", 4), (2, "VariousPropertyBits", 4), (4, "MousePointer", 1),
+    (5, "Min", 4), (6, "Max", 4), (7, "Position", 4), (9, "PrevEnabled", 4), (10, "NextEnabled", 4),
+    (11, "SmallChange", 4), (12, "LargeChange", 4), (13, "Orientation", 4), (14, "ProportionalThumb", 2),
+    (15, "Delay", 4), (16, "MouseIcon", 2),
+]
+
+# ProgID -> (layout, PropMask size in bytes, PropMask bit of Size, whether Size precedes
+# the strings in the ExtraDataBlock)
+_LAYOUTS = {
+    'Forms.CommandButton.1': (_COMMAND_BUTTON, 4, 5, False),
+    'Forms.Label.1': (_LABEL, 4, 5, False),
+    'Forms.CheckBox.1': (_MORPH_DATA, 8, 8, True),
+    'Forms.ComboBox.1': (_MORPH_DATA, 8, 8, True),
+    'Forms.ListBox.1': (_MORPH_DATA, 8, 8, True),
+    'Forms.TextBox.1': (_MORPH_DATA, 8, 8, True),
+    'Forms.OptionButton.1': (_MORPH_DATA, 8, 8, True),
+    'Forms.ToggleButton.1': (_MORPH_DATA, 8, 8, True),
+    'Forms.SpinButton.1': (_SPIN_BUTTON, 4, 3, True),
+    'Forms.ScrollBar.1': (_SCROLL_BAR, 4, 3, True),
+}
+
+# persistStreamInit parts and the controls of a .xls Ctls stream start with the control's CLSID
+CLSID_SIZE = 16
+
+_SIGNED = {"Min", "Max", "Position"}
+_BOOLEAN_VALUE = {'Forms.CheckBox.1', 'Forms.OptionButton.1', 'Forms.ToggleButton.1'}
+_TEXT_VALUE = {'Forms.TextBox.1', 'Forms.ComboBox.1', 'Forms.ListBox.1'}
+
+
+def _pad(offset: int, size: int) -> int:
+    return offset + (-offset % size)
+
+
+def _read_string(data: bytes, offset: int, size_field: int) -> Tuple[str, int]:
+    # fmString: the high bit of the count flags single-byte (compressed) characters
+    count = size_field & 0x7FFFFFFF
+    compressed = bool(size_field & 0x80000000)
+    raw = data[offset:offset + count]
+    text = raw.decode("latin-1") if compressed else raw.decode("utf-16-le", errors="replace")
+    return text, _pad(offset + count, 4)
+
+
+def decode_control_stream(prog_id: str, data: bytes) -> Dict[str, Any]:
+    """
+    Decode the raw persisted stream of a Forms 2.0 control (the "contents"
+    stream of an activeX*.bin) into its raw properties.
+
+    Raises ValueError for unsupported ProgIDs or malformed streams.
+    """
+    if prog_id not in _LAYOUTS:
+        raise ValueError(f"Unsupported control type: {prog_id}")
+    layout, mask_size, size_bit, size_first = _LAYOUTS[prog_id]
+    if len(data) < 4 + mask_size:
+        raise ValueError("Control stream is truncated")
+    minor, major, _ = struct.unpack_from("<BBH", data, 0)
+    if (minor, major) != (0, 2):
+        raise ValueError(f"Unexpected control stream version {major}.{minor}")
+    mask = int.from_bytes(data[4:4 + mask_size], "little")
+    try:
+        return _decode_blocks(data, layout, mask_size, mask, size_bit, size_first)
+    except struct.error as e:
+        raise ValueError(f"Control stream is truncated: {e}")
+
+
+def _decode_blocks(data, layout, mask_size, mask, size_bit, size_first):
+
+    # Fields are aligned to their own size, relative to the start of the DataBlock
+    base = 4 + mask_size
+    offset = 0
+    properties = {}
+    strings: List[Tuple[str, int]] = []
+    for bit, name, size in layout:
+        if not mask & (1 << bit):
+            continue
+        width = 4 if size == "str" else size
+        offset = _pad(offset, width)
+        fmt = {1: "<B", 2: "<H", 4: "<i" if name in _SIGNED else "<I"}[width]
+        value = struct.unpack_from(fmt, data, base + offset)[0]
+        offset += width
+        if size == "str":
+            strings.append((name, value))
+        else:
+            properties[name] = value
+
+    # ExtraDataBlock: Size (two int32) and the characters of each string, each padded to 4 bytes
+    offset = base + _pad(offset, 4)
+    if size_first and mask & (1 << size_bit):
+        offset += 8
+    for name, size_field in strings:
+        properties[name], offset = _read_string(data, offset, size_field)
+    return properties
+
+
+def summarize_properties(prog_id: str, properties: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce raw properties to the Caption/Value/Text that Excel's object model reports."""
+    summary = {"Caption": properties.get("Caption"), "Value": None, "Text": None}
+    if prog_id in _BOOLEAN_VALUE:
+        value = properties.get("Value", "0")
+        summary["Value"] = {"1": True, "0": False}.get(value)
+    elif prog_id in _TEXT_VALUE:
+        summary["Value"] = summary["Text"] = properties.get("Value", "")
+    elif prog_id in ('Forms.SpinButton.1', 'Forms.ScrollBar.1'):
+        summary["Value"] = properties.get("Position", 0)
+    return summary
+
+
+def split_clsid(data: bytes, prog_id: Optional[str] = None) -> Tuple[Optional[str], bytes]:
+    """
+    Split a persisted control into its ProgID, resolved from the leading
+    CLSID (``prog_id`` when the CLSID is not a Forms 2.0 control), and the
+    control stream that follows it.
+
+    Raises ValueError when the data is too short to hold a CLSID.
+    """
+    if len(data) < CLSID_SIZE:
+        raise ValueError("Persisted control is shorter than its CLSID")
+    clsid = "{" + str(uuid.UUID(bytes_le=data[:CLSID_SIZE])).upper() + "}"
+    return ACTIVEX_CLSID_MAP.get(clsid, prog_id), data[CLSID_SIZE:]
+
+
+def decode_activex_bin(data: bytes, prog_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Decode an activeX*.bin part.
+
+    persistStorage controls are OLE compound files whose root CLSID names the
+    control and whose "contents" stream holds its state; persistStreamInit
+    controls store the CLSID followed by the stream. ``prog_id`` (from the
+    activeX XML part) is used when the CLSID is not a known control. Returns
+    a dict with 'ProgID', 'Name', 'Caption', 'Value' and 'Text'.
+    """
+    name = None
+    # Passed by keyword: olefile takes short positional bytes for a file name
+    if olefile.isOleFile(data=data):
+        ole = olefile.OleFileIO(data)
+        try:
+            clsid = "{" + (ole.root.clsid or "").upper() + "}"
+            prog_id = ACTIVEX_CLSID_MAP.get(clsid, prog_id)
+            if ole.exists("\x03OCXNAME"):
+                name = ole.openstream("\x03OCXNAME").read().decode("utf-16-le", errors="replace").rstrip("\x00")
+            stream = ole.openstream("contents").read() if ole.exists("contents") else b""
+        finally:
+            ole.close()
+    else:
+        prog_id, stream = split_clsid(data, prog_id)
+
+    result = {"ProgID": prog_id, "Name": name, "Caption": None, "Value": None, "Text": None}
+    if prog_id in _LAYOUTS and stream:
+        result.update(summarize_properties(prog_id, decode_control_stream(prog_id, stream)))
+    return result
+
+
+def read_activex_properties(package: OOXMLPackage, activex_part: str) -> Dict[str, Any]:
+    """
+    Return the decoded properties of the control described by an
+    xl/activeX/activeX*.xml part, whatever its persistence format.
+    """
+    root = package.parse(activex_part)
+    clsid = root.get(f"{{{NS['ax']}}}classid", "").upper()
+    prog_id = ACTIVEX_CLSID_MAP.get(clsid)
+    persistence = root.get(f"{{{NS['ax']}}}persistence")
+
+    if persistence == "persistPropertyBag":
+        # Properties are spelled out as <ax:ocxPr ax:name=".." ax:value=".."/>
+        bag = {
+            prop.get(f"{{{NS['ax']}}}name"): prop.get(f"{{{NS['ax']}}}value")
+            for prop in root.findall("ax:ocxPr", NS)
+        }
+        return {"ProgID": prog_id, "Name": None, "Caption": bag.get("Caption"),
+                "Value": bag.get("Value"), "Text": bag.get("Text", bag.get("Value") if prog_id in _TEXT_VALUE else None)}
+
+    binary = package.rels(activex_part).get(root.get(f"{{{NS['r']}}}id"))
+    if binary is None or binary[1] not in package.names:
+        return {"ProgID": prog_id, "Name": None, "Caption": None, "Value": None, "Text": None}
+    return decode_activex_bin(package.read(binary[1]), prog_id)
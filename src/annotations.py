@@ -0,0 +1,162 @@
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, IO, Iterator, List, Tuple, Union
+
+from src.ooxml import REL_COMMENTS, REL_HYPERLINK, REL_THREADED_COMMENT, OOXMLPackage
+
+REL_PERSON = "person"
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _iter_elements(package: OOXMLPackage, part: str, name: str) -> Iterator[ET.Element]:
+    """
+    Stream ``part`` and yield each complete element with local name ``name``,
+    clearing it afterwards so memory is bounded by one element at a time.
+    """
+    with package.open(part) as stream:
+        for _, element in ET.iterparse(stream, events=("end",)):
+            if _local(element.tag) == name:
+                yield element
+                element.clear()
+
+
+def _text(element: ET.Element) -> str:
+    # Rich text comments split their text over several <r><t> runs
+    return "".join(t.text or "" for t in element.iter() if _local(t.tag) == "t")
+
+
+def _child(element: ET.Element, name: str):
+    for child in element:
+        if _local(child.tag) == name:
+            return child
+    return None
+
+
+def load_persons(package: OOXMLPackage) -> Dict[str, str]:
+    """Map threaded comment person ids to display names."""
+    persons = {}
+    for part in package.rels_of_type(package.workbook_part, REL_PERSON):
+        if part in package.names:
+            for person in _iter_elements(package, part, "person"):
+                persons[person.get("id")] = person.get("displayName")
+    return persons
+
+
+def _comments(package: OOXMLPackage, part: str) -> List[Dict[str, Any]]:
+    authors = []
+    comments = []
+    with package.open(part) as stream:
+        for _, element in ET.iterparse(stream, events=("end",)):
+            name = _local(element.tag)
+            if name == "author":
+                authors.append(element.text)
+            elif name == "comment":
+                author_id = int(element.get("authorId", "0"))
+                comments.append({
+                    'type': 'Comment',
+                    'cell': element.get("ref"),
+                    'text': _text(element),
+                    'author': authors[author_id] if author_id < len(authors) else None
+                })
+                element.clear()
+    return comments
+
+
+def _threaded_comments(package: OOXMLPackage, part: str, persons: Dict[str, str]) -> List[Dict[str, Any]]:
+    comments = []
+    for element in _iter_elements(package, part, "threadedComment"):
+        text = _child(element, "text")
+        comments.append({
+            'type': 'Threaded Comment' if element.get("parentId") is None else 'Threaded Comment Reply',
+            'cell': element.get("ref"),
+            'text': text.text if text is not None else "",
+            'author': persons.get(element.get("personId"))
+        })
+    return comments
+
+
+def _data_validations(section: ET.Element) -> List[Dict[str, Any]]:
+    # Handles both the main <dataValidations> section and the x14 one in extLst,
+    # which keeps sqref and formulas in child elements instead of attributes
+    entries = []
+    for dv in section:
+        if dv.tag != "dataValidation":
+            continue
+        sqref = dv.get("sqref") or dv.findtext("sqref", "")
+        formula1 = dv.find("formula1")
+        formula2 = dv.find("formula2")
+        for cell_range in sqref.split():
+            entries.append({
+                'type': 'Data Validation/Dropdown',
+                'cell_range': cell_range,
+                'validation_type': dv.get("type"),
+                'formula1': "".join(formula1.itertext()) if formula1 is not None else None,
+                'formula2': "".join(formula2.itertext()) if formula2 is not None else None,
+                'allow_blank': dv.get("allowBlank") in ("1", "true")
+            })
+    return entries
+
+
+def _hyperlinks(section: ET.Element, rels: Dict[str, Tuple[str, str]]) -> List[Dict[str, Any]]:
+    entries = []
+    for link in section:
+        if link.tag != "hyperlink":
+            continue
+        # External targets live in the sheet rels; in-workbook links use the location attribute
+        kind, target = rels.get(link.get("id"), (None, None))
+        entries.append({
+            'type': 'Hyperlink',
+            'cell': link.get("ref"),
+            'target': target if kind == REL_HYPERLINK else link.get("location"),
+            'display': link.get("display")
+        })
+    return entries
+
+
+def scan_sheet_annotations(package: OOXMLPackage, sheet_part: str, persons: Dict[str, str] = None) -> List[Dict[str, Any]]:
+    """
+    Return the data validations, hyperlinks and comments of one worksheet.
+
+    Comments come from the comments and threadedComments parts. Validations
+    and hyperlinks are cut out of the sheet XML by a streaming byte scan, so
+    the cost depends on the number of annotations, not on the number of cells.
+    """
+    if package.is_binary:
+        # .xlsb keeps these as BIFF12 records in binary sheet and comment parts, which are not decoded
+        return []
+    if persons is None:
+        persons = load_persons(package)
+    rels = package.rels(sheet_part)
+    entries = []
+
+    for tag, section in package.iter_sections(sheet_part, ["dataValidations", "hyperlinks"]):
+        if tag == "dataValidations":
+            entries.extend(_data_validations(section))
+        else:
+            entries.extend(_hyperlinks(section, rels))
+
+    threaded = []
+    for part in package.rels_of_type(sheet_part, REL_THREADED_COMMENT):
+        if part in package.names:
+            threaded.extend(_threaded_comments(package, part, persons))
+    # Excel writes a placeholder legacy comment for every thread; the thread replaces it
+    threaded_cells = {entry['cell'] for entry in threaded}
+    for part in package.rels_of_type(sheet_part, REL_COMMENTS):
+        if part in package.names:
+            entries.extend(c for c in _comments(package, part) if c['cell'] not in threaded_cells)
+    entries.extend(threaded)
+    return entries
+
+
+def scan_annotations(source: Union[bytes, str, IO[bytes]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Return {sheet name: annotations} for every worksheet of an .xlsx/.xlsm file.
+    """
+    with OOXMLPackage(source) as package:
+        persons = load_persons(package)
+        return {
+            sheet_name: scan_sheet_annotations(package, sheet_part, persons)
+            for sheet_name, sheet_part in package.sheets()
+        }
@@ -0,0 +1,143 @@
+"""
+Registry of the extraction and conversion backends used by the pages.
+
+Pages look their backends up by name instead of importing them, and the
+heavy libraries behind them (openai, httpx, oletools, pandas, xlwings) are
+only imported on first use. The first paint and page switches therefore
+only pay for Streamlit and the page itself. prewarm() imports everything
+on a background thread at server start, so the first conversion does not
+pay for the imports either. Every import done through here is timed.
+
+    python -m src.backends    # cold import time of every backend, one fresh interpreter each
+"""
+import argparse
+import importlib
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from src.metrics import get_metrics
+
+# name -> (module, attribute)
+EXTRACTORS = {
+    "vba": ("src.vba_extraction", "extract_vba_modules"),
+    "vba_listing": ("src.conversion", "extract_vba_from_excel"),
+    "controls": ("src.controls", "scan_controls_ooxml"),
+    "scan": ("src.scanner", "scan_workbook"),
+    "inspection": ("src.inspection", "WorkbookInspection"),
+}
+CONVERTERS = {
+    "single": ("src.conversion", "convert_vba_to_csharp"),
+    "parallel": ("src.parallel_conversion", "convert_modules_parallel"),
+    "incremental": ("src.incremental", "convert_incremental"),
+}
+# Imported lazily inside the backends above; prewarm() loads them up front
+LIBRARIES = ["openai", "anthropic", "httpx", "oletools.olevba", "olefile", "pandas", "xlwings"]
+
+_import_times: Dict[str, float] = {}
+_lock = threading.Lock()
+_prewarm_thread: Optional[threading.Thread] = None
+
+
+def load_module(name: str) -> Any:
+    """Import ``name``, recording how long it took if it was not loaded yet."""
+    if name in sys.modules:
+        # import_module rather than sys.modules, to wait for an import still running on the prewarm thread
+        return importlib.import_module(name)
+    with get_metrics().span("backend_import", module=name) as span:
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        span["seconds"] = time.perf_counter() - start
+    with _lock:
+        _import_times.setdefault(name, span["seconds"])
+    return module
+
+
+def is_available(name: str) -> bool:
+    """Whether ``name`` can be imported, checked without importing it."""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def _resolve(registry: Dict[str, tuple], kind: str, name: str) -> Any:
+    try:
+        module, attribute = registry[name]
+    except KeyError:
+        raise ValueError(f"Unknown {kind}: {name!r} (expected one of {', '.join(registry)})")
+    return getattr(load_module(module), attribute)
+
+
+def get_extractor(name: str) -> Any:
+    """Return the extractor registered as ``name``, importing its module on first use."""
+    return _resolve(EXTRACTORS, "extractor", name)
+
+
+def get_converter(name: str) -> Any:
+    """Return the converter registered as ``name``, importing its module on first use."""
+    return _resolve(CONVERTERS, "converter", name)
+
+
+def _backend_modules() -> List[str]:
+    modules = [m for m, _ in list(EXTRACTORS.values()) + list(CONVERTERS.values())]
+    return list(dict.fromkeys(modules + LIBRARIES))
+
+
+def _warm(modules: Iterable[str]) -> None:
+    for name in modules:
+        try:
+            load_module(name)
+        except Exception:
+            # A missing optional library only matters to the page that needs it
+            pass
+
+
+def prewarm(modules: Optional[Iterable[str]] = None) -> Optional[threading.Thread]:
+    """
+    Import the backends (default: all of them) on a daemon thread, once per
+    process. Disabled with VBA_PREWARM=0.
+    """
+    global _prewarm_thread
+    if os.getenv("VBA_PREWARM", "1").lower() in ("0", "false", "no"):
+        return None
+    with _lock:
+        if _prewarm_thread is None:
+            _prewarm_thread = threading.Thread(
+                target=_warm, args=(list(modules or _backend_modules()),), name="backend-prewarm", daemon=True
+            )
+            _prewarm_thread.start()
+    return _prewarm_thread
+
+
+def import_timings() -> Dict[str, float]:
+    """Seconds spent importing each module loaded through this registry, in load order."""
+    with _lock:
+        return dict(_import_times)
+
+
+def main(argv=None) -> int:
+    """Print the cold import time of every backend module, each in a fresh interpreter."""
+    parser = argparse.ArgumentParser(description="Measure the cold import time of every backend.")
+    parser.add_argument("--json", action="store_true", help="Also print the results as JSON")
+    args = parser.parse_args(argv)
+    results = {}
+    for name in _backend_modules():
+        code = ("import time; t = time.perf_counter(); import importlib; "
+                f"importlib.import_module({name!r}); print(time.perf_counter() - t)")
+        completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        results[name] = float(completed.stdout) if completed.returncode == 0 else None
+    for name, seconds in results.items():
+        print(f"{name:<28} {'unavailable' if seconds is None else f'{seconds * 1000:8.0f} ms'}")
+    if args.json:
+        print(json.dumps(results))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
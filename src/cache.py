@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Optional
+
+# Default location for on-disk caches, shared by every Streamlit session on the host
+CACHE_DIR = os.getenv("VBA_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "codeconversion"))
+
+
+def content_hash(data: bytes) -> str:
+    """Return the SHA-256 hex digest used as the content address of an upload."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class SQLiteLRUCache:
+    """
+    Persistent key/value cache backed by a single SQLite file.
+
+    Values are stored as JSON. The total payload size is capped at ``max_bytes``;
+    when a write pushes the cache over the cap, the least recently used entries
+    are evicted. Entries older than ``ttl`` seconds (if given) are treated as
+    misses and purged on the next write. SQLite's WAL mode and busy timeout make
+    the cache safe to share between concurrent Streamlit sessions and processes.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024, ttl: Optional[float] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL DEFAULT 0,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(entries)")]
+            if "created" not in columns:
+                conn.execute("ALTER TABLE entries ADD COLUMN created REAL NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries(last_access)")
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # A fresh connection per operation keeps the cache usable from any script thread
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for ``key`` or None, refreshing its LRU position."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return json.loads(row[0])
+        finally:
+            conn.close()
+
+    def set(self, key: str, value: Any) -> None:
+        """Store ``value`` under ``key`` and evict old entries if over the size cap."""
+        payload = json.dumps(value)
+        size = len(payload.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        conn = self._connect()
+        try:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, size, now, now),
+            )
+            if self.ttl is not None:
+                conn.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl,))
+            self._evict(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access ASC").fetchall():
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self) -> Dict[str, int]:
+        """Return entry count, stored bytes and this process's hit/miss counters."""
+        conn = self._connect()
+        try:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        finally:
+            conn.close()
+        return {"entries": entries, "bytes": size, "hits": self.hits, "misses": self.misses}
+
+    def clear(self) -> None:
+        """Remove every entry from the cache."""
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM entries")
+        finally:
+            conn.close()
+
+
+_macro_cache = None
+
+
+def get_macro_cache() -> SQLiteLRUCache:
+    """Return the process-wide cache of extracted VBA modules, keyed by upload hash."""
+    global _macro_cache
+    if _macro_cache is None:
+        max_mb = int(os.getenv("VBA_CACHE_MAX_MB", "512"))
+        _macro_cache = SQLiteLRUCache(os.path.join(CACHE_DIR, "macros.sqlite3"), max_bytes=max_mb * 1024 * 1024)
+    return _macro_cache
+
+
+_conversion_cache = None
+
+
+def conversion_key(prompt: str, vba_code: str, deployment: str, temperature: float, api_version: str) -> str:
+    """
+    Return a stable hash for one LLM conversion request.
+
+    Line endings and trailing whitespace are normalized so that cosmetic
+    differences in the prompt or code do not defeat the cache.
+    """
+    def normalize(text: str) -> str:
+        lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+        return "\n".join(line.rstrip() for line in lines).strip()
+
+    parts = [normalize(prompt), normalize(vba_code), deployment, repr(float(temperature)), api_version]
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+
+def get_conversion_cache() -> SQLiteLRUCache:
+    """Return the process-wide cache of LLM conversions."""
+    global _conversion_cache
+    if _conversion_cache is None:
+        max_mb = int(os.getenv("CONVERSION_CACHE_MAX_MB", "256"))
+        ttl_hours = float(os.getenv("CONVERSION_CACHE_TTL_HOURS", "168"))
+        _conversion_cache = SQLiteLRUCache(
+            os.path.join(CACHE_DIR, "conversions.sqlite3"),
+            max_bytes=max_mb * 1024 * 1024,
+            ttl=ttl_hours * 3600 if ttl_hours > 0 else None,
+        )
+    return _conversion_cache
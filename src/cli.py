@@ -0,0 +1,302 @@
+"""
+Headless batch converter: walks a directory of workbooks, extracts macros and
+controls in a process pool and optionally converts the macros to C#.
+
+Results are appended to ``<output>/results.jsonl`` one workbook per line as
+soon as each workbook is finished; that file doubles as the checkpoint, so
+rerunning the same command resumes where a previous run stopped. Workbooks
+that could not be read or whose conversion failed are recorded with
+``"failed": true`` and are retried on the next run; a ``format:`` error is
+kept, since the same bytes fail the same way.
+
+With ``--dedup`` every procedure is converted on its own, and procedures that
+were already converted in this or an earlier batch are answered from the
+fingerprint index (src.dedup) instead of the LLM. The share of procedures
+answered that way is reported at the end as the batch's dedup ratio.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Set
+
+from src.cache import content_hash
+from src.dedup import ERROR_PREFIX, REUSE_KINDS, Deduplicator, dedup_scope
+from src.incremental import assemble_modules, convert_units_async, module_units
+from src.inventory import InventoryStore
+from src.llm_client import DEFAULT_API_VERSION, create_async_client
+from src.metrics import STAGE_METRIC, get_metrics
+from src.parallel_conversion import DEFAULT_PROMPT, convert_modules_async
+from src.scanner import scan_workbook
+
+WORKBOOK_EXTENSIONS = (".xlsm", ".xlsb", ".xls", ".xlsx")
+RESULTS_FILE = "results.jsonl"
+
+
+def find_workbooks(root: str) -> List[str]:
+    """Return every workbook below ``root`` as a sorted list of relative paths."""
+    found = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            # Skip Excel's "~$" lock files
+            if name.lower().endswith(WORKBOOK_EXTENSIONS) and not name.startswith("~$"):
+                found.append(os.path.relpath(os.path.join(dirpath, name), root))
+    return sorted(found)
+
+
+def load_checkpoint(output_dir: str) -> Set[str]:
+    """Return the relative paths recorded in the results file, except those that failed to read or convert."""
+    done = set()
+    path = os.path.join(output_dir, RESULTS_FILE)
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                if not entry.get("failed"):
+                    done.add(entry["path"])
+            except (ValueError, KeyError):
+                # A line cut short by a crash; that workbook is simply redone
+                continue
+    return done
+
+
+def extract_workbook(root: str, rel_path: str) -> Dict[str, Any]:
+    """
+    Extract the macros and controls of one workbook. Runs in a worker process,
+    so it only returns plain data and never raises.
+    """
+    record = {"path": rel_path, "sha256": None, "format": None, "modules": [], "controls": [], "sheets": [],
+              "errors": [], "timings": {}}
+    # Spans recorded here stay in the worker process, so stage times travel back in the record
+    timings = record["timings"]
+    start = time.perf_counter()
+    try:
+        with open(os.path.join(root, rel_path), "rb") as f:
+            file_bytes = f.read()
+    except OSError as e:
+        # Often transient (a locked file or a share that dropped), so it is not checkpointed as done
+        record["failed"] = True
+        record["errors"].append(f"read: {e}")
+        return record
+    timings["upload_read"] = time.perf_counter() - start
+
+    record["sha256"] = content_hash(file_bytes)
+    record["bytes"] = len(file_bytes)
+    start = time.perf_counter()
+    # One pass over the container for macros and controls, whatever the format
+    scan = scan_workbook(file_bytes, os.path.basename(rel_path))
+    timings["workbook_scan"] = time.perf_counter() - start
+    record.update(format=scan["format"], modules=scan["modules"], controls=scan["controls"], sheets=scan["sheets"])
+    record["errors"].extend(scan["errors"])
+    return record
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", name)
+
+
+def conversion_failed(conversion: Dict[str, Any]) -> bool:
+    """Whether a module group's conversion, or any procedure in it (with --dedup), failed."""
+    csharp = conversion["csharp"]
+    return csharp is None or csharp.startswith(ERROR_PREFIX) or "failed" in conversion.get("reuse", ())
+
+
+def write_csharp(output_dir: str, rel_path: str, conversions: List[Dict[str, Any]]) -> List[str]:
+    """Write one .cs file per converted module group and return their paths."""
+    target_dir = os.path.join(output_dir, "cs", os.path.splitext(rel_path)[0])
+    os.makedirs(target_dir, exist_ok=True)
+    written = []
+    for conversion in conversions:
+        path = os.path.join(target_dir, _safe_name("_".join(os.path.splitext(m)[0] for m in conversion["modules"])) + ".cs")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(conversion["csharp"] or "")
+        written.append(os.path.relpath(path, output_dir))
+    return written
+
+
+async def convert_procedures(modules: List[Dict[str, Any]], args: argparse.Namespace, client, deployment: str,
+                             semaphore: asyncio.Semaphore, dedup: Deduplicator) -> List[Dict[str, Any]]:
+    """
+    Convert ``modules`` one procedure per request through ``dedup`` and
+    return one conversion per module, shaped like convert_modules_async's.
+    """
+    units = module_units(modules)
+    await convert_units_async(units, modules, args.prompt, client, deployment, api_version=args.api_version,
+                              semaphore=semaphore, dedup=dedup)
+    return [
+        {"modules": [name], "csharp": assemble_modules([u for u in units if u["module"] == name]),
+         "reuse": [u["reuse"] for u in units if u["module"] == name]}
+        for name in dict.fromkeys(u["module"] for u in units)
+    ]
+
+
+def _summarize(record: Dict[str, Any]) -> Dict[str, Any]:
+    # Module code stays out of the JSONL; it is in the workbook and the .cs files
+    summary = dict(record)
+    summary["modules"] = [
+        {
+            "vba_filename": m["vba_filename"],
+            "stream_path": m["stream_path"],
+            "lines": m["code"].count("\n") + 1,
+            "bytes": len(m["code"]),
+        }
+        for m in record["modules"]
+    ]
+    return summary
+
+
+async def run_batch(args: argparse.Namespace) -> int:
+    root = os.path.abspath(args.input_dir)
+    os.makedirs(args.output, exist_ok=True)
+    workbooks = find_workbooks(root)
+    done = load_checkpoint(args.output) if not args.restart else set()
+    todo = [p for p in workbooks if p not in done]
+    print(f"{len(workbooks)} workbooks found, {len(workbooks) - len(todo)} already done, {len(todo)} to process",
+          file=sys.stderr)
+    if not todo:
+        return 0
+
+    client = None
+    if args.convert:
+        client = create_async_client(
+            os.environ["AZURE_OPENAI_API_KEY"], os.environ["ENDPOINT_URL"], args.api_version
+        )
+    deployment = os.getenv("DEPLOYMENT_NAME", "gpt-4o")
+    request_slots = asyncio.Semaphore(args.concurrency)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=args.concurrency * 2)
+    results = open(os.path.join(args.output, RESULTS_FILE), "w" if args.restart else "a", encoding="utf-8")
+    loop = asyncio.get_running_loop()
+    metrics = get_metrics()
+    inventory = InventoryStore(args.inventory) if args.inventory else None
+    dedup = Deduplicator(dedup_scope(args.prompt, deployment)) if args.convert and args.dedup else None
+    finished = failures = 0
+
+    async def produce(pool):
+        # Keep a bounded window of workbooks in the pool so extracted code doesn't pile up in memory
+        pending = set()
+        for rel_path in todo:
+            pending.add(loop.run_in_executor(pool, extract_workbook, root, rel_path))
+            if len(pending) >= args.workers * 2:
+                completed, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for fut in completed:
+                    await queue.put(fut.result())
+        for fut in asyncio.as_completed(pending):
+            await queue.put(await fut)
+        for _ in range(args.concurrency):
+            await queue.put(None)
+
+    async def consume():
+        nonlocal finished, failures
+        while True:
+            record = await queue.get()
+            if record is None:
+                return
+            for stage, seconds in record["timings"].items():
+                metrics.observe(STAGE_METRIC, seconds, stage=stage)
+            try:
+                if (inventory is not None and record["sha256"]
+                        and not any(e.startswith("format:") for e in record["errors"])):
+                    name = os.path.basename(record["path"])
+                    if not any(e.startswith("vba:") for e in record["errors"]):
+                        inventory.record_modules(record["sha256"], name, record["modules"], size=record["bytes"])
+                    if not any(e.startswith("controls:") for e in record["errors"]):
+                        inventory.record_controls(record["sha256"], name, record["controls"], size=record["bytes"])
+                conversions = []
+                if client is not None and record["modules"] and dedup is not None:
+                    conversions = await convert_procedures(record["modules"], args, client, deployment,
+                                                           request_slots, dedup)
+                    reuse = [kind for conversion in conversions for kind in conversion["reuse"]]
+                    record["dedup"] = {kind: reuse.count(kind) for kind in REUSE_KINDS + ("failed",)}
+                elif client is not None and record["modules"]:
+                    conversions = await convert_modules_async(
+                        record["modules"], args.prompt, client, deployment,
+                        api_version=args.api_version, max_group_tokens=args.group_tokens,
+                        semaphore=request_slots,
+                    )
+                failed = [c for c in conversions if conversion_failed(c)]
+                if conversions:
+                    # Error text is not C#; failed groups are left out and the workbook is retried on the next run
+                    record["cs_files"] = write_csharp(args.output, record["path"],
+                                                      [c for c in conversions if c not in failed])
+                if failed:
+                    record["failed"] = True
+                    record["errors"].extend(f"convert: {', '.join(c['modules'])}" for c in failed)
+            except Exception as e:
+                # One bad workbook must not stop the others; it is retried on the next run
+                record["failed"] = True
+                record["errors"].append(f"batch: {e}")
+            results.write(json.dumps(_summarize(record)) + "\n")
+            results.flush()
+            os.fsync(results.fileno())
+            finished += 1
+            failures += bool(record.get("failed"))
+            status = ""
+            if record.get("failed"):
+                status = " (read failed)" if record["errors"][0].startswith("read:") else " (conversion failed)"
+            print(f"[{finished}/{len(todo)}] {record['path']}{status}", file=sys.stderr)
+
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            await asyncio.gather(produce(pool), *[consume() for _ in range(args.concurrency)])
+    finally:
+        results.close()
+        if client is not None:
+            await client.close()
+        if failures:
+            print(f"{failures} workbooks failed to read or convert; rerun the same command to retry them", file=sys.stderr)
+        tokens = {c["labels"]["stage"]: c["value"] for c in metrics.snapshot()["counters"]
+                  if c["name"] == "vba_prompt_code_tokens_total"}
+        if tokens.get("original"):
+            print(f"Prompt code: ~{tokens['original']:.0f} tokens, ~{tokens['compacted']:.0f} after compaction "
+                  f"({1 - tokens['compacted'] / tokens['original']:.1%} saved)", file=sys.stderr)
+        if dedup is not None:
+            stats = dedup.stats()
+            print(f"Dedup: {stats['exact'] + stats['renamed']} of {stats['units']} procedures reused "
+                  f"({stats['exact']} identical, {stats['renamed']} renamed), {stats['near']} adapted from near "
+                  f"matches, {stats['fresh']} converted fresh; dedup ratio {stats['dedup_ratio']:.1%}",
+                  file=sys.stderr)
+        if args.metrics:
+            with open(args.metrics, "w", encoding="utf-8") as f:
+                f.write(metrics.render_prometheus())
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="vba-batch",
+        description="Extract VBA macros and controls from a directory of Excel workbooks and convert them to C#.",
+    )
+    parser.add_argument("input_dir", help="Directory to scan for .xlsm/.xlsb/.xls/.xlsx files")
+    parser.add_argument("-o", "--output", default="vba_batch_output", help="Output directory (default: %(default)s)")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="Extraction worker processes (default: CPU count)")
+    parser.add_argument("--convert", action="store_true",
+                        help="Convert macros to C# with Azure OpenAI (reads AZURE_OPENAI_API_KEY, ENDPOINT_URL, DEPLOYMENT_NAME)")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="Max concurrent LLM requests (default: %(default)s)")
+    parser.add_argument("--group-tokens", type=int, default=0,
+                        help="Batch small modules into one request up to this many tokens; 0 converts each module alone")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Convert one procedure per request and reuse conversions of duplicate or near-duplicate "
+                             "procedures from the fingerprint index (FINGERPRINT_DB_PATH)")
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT, help="Conversion prompt")
+    parser.add_argument("--api-version", default=DEFAULT_API_VERSION)
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from scratch")
+    parser.add_argument("--inventory", help="Also append every control, module and procedure to this inventory file "
+                                             "(see python -m src.inventory)")
+    parser.add_argument("--metrics", help="Write stage timings and token counts to this file in Prometheus format")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return asyncio.run(run_batch(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
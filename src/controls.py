@@ -0,0 +1,281 @@
+import re
+import struct
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, IO, List, Optional, Tuple, Union
+
+from src.activex import ACTIVEX_CLSID_MAP, read_activex_properties
+from src.metrics import get_metrics
+from src.ooxml import (NS, REL_CONTROL, REL_CTRL_PROP, REL_DRAWING, REL_VML_DRAWING, OOXMLPackage, cell_address,
+                       parse_fragment)
+
+# A mapping for common Form Control tags to human-readable names
+FORM_CONTROL_MAP = {
+    'sp': 'Spinner or Scrollbar',
+    'btn': 'Button',
+    'chx': 'Checkbox',
+    'drop': 'Dropdown (Combo Box)',
+    'opt': 'Option Button (Radio Button)',
+    'gbox': 'Group Box',
+    'lbl': 'Label',
+    'edit': 'Text Box', # Less common, usually an ActiveX control
+    'list': 'List Box',
+}
+
+# A mapping for common ActiveX control ProgIDs
+ACTIVEX_CONTROL_MAP = {
+    'Forms.CommandButton.1': 'ActiveX Command Button',
+    'Forms.CheckBox.1': 'ActiveX CheckBox',
+    'Forms.ComboBox.1': 'ActiveX ComboBox (Dropdown)',
+    'Forms.ListBox.1': 'ActiveX ListBox',
+    'Forms.TextBox.1': 'ActiveX TextBox',
+    'Forms.OptionButton.1': 'ActiveX Option Button',
+    'Forms.ToggleButton.1': 'ActiveX Toggle Button',
+    'Forms.Frame.1': 'ActiveX Frame',
+    'Forms.Label.1': 'ActiveX Label',
+    'Forms.ScrollBar.1': 'ActiveX ScrollBar',
+    'Forms.SpinButton.1': 'ActiveX SpinButton',
+}
+
+
+# Form control object types, as written in ctrlProps (objectType) and VML (x:ObjectType),
+# mapped to the tags used by FORM_CONTROL_MAP
+FORM_OBJECT_TYPES = {
+    'button': 'btn',
+    'checkbox': 'chx',
+    'drop': 'drop',
+    'radio': 'opt',
+    'gbox': 'gbox',
+    'label': 'lbl',
+    'spin': 'sp',
+    'scroll': 'sp',
+    'edit': 'edit',
+    'editbox': 'edit',
+    'list': 'list',
+}
+
+_VML_SHAPE_RE = re.compile(rb"<v:shape\b([^>]*)>(.*?)</v:shape>", re.S)
+_VML_ATTR_RE = re.compile(rb'(?:^|\s)(id|o:spid)="([^"]*)"')
+_VML_OBJECT_TYPE_RE = re.compile(rb'ObjectType="(\w+)"')
+_VML_ANCHOR_RE = re.compile(rb"<x:Anchor>\s*([^<]*)</x:Anchor>")
+
+
+def _shape_number(spid: Optional[str]) -> Optional[str]:
+    # "_x0000_s1025" -> "1025", the shapeId used by <control> elements
+    match = re.search(r"(\d+)$", spid or "")
+    return match.group(1) if match else None
+
+
+def _form_control_type(object_type: Optional[str]) -> str:
+    tag = FORM_OBJECT_TYPES.get((object_type or "").lower())
+    return f"Form Control - {FORM_CONTROL_MAP.get(tag, 'Unknown')}"
+
+
+def _vml_shapes(package: OOXMLPackage, part: str) -> List[Dict[str, Any]]:
+    """
+    Return the shapes of a legacy VML drawing. VML written by Excel is not always
+    well-formed XML (e.g. bare <br> in text boxes), so it is scanned with regexes.
+    """
+    shapes = []
+    for match in _VML_SHAPE_RE.finditer(package.read(part)):
+        attrs = {k.decode(): v.decode() for k, v in _VML_ATTR_RE.findall(match.group(1))}
+        object_type = _VML_OBJECT_TYPE_RE.search(match.group(2))
+        anchor = _VML_ANCHOR_RE.search(match.group(2))
+        cell = None
+        if anchor:
+            numbers = [int(n) for n in anchor.group(1).decode().replace(" ", "").split(",") if n]
+            if len(numbers) >= 3:
+                # LeftColumn, LeftOffset, TopRow, TopOffset, ...
+                cell = cell_address(numbers[0], numbers[2])
+        shapes.append({
+            "id": attrs.get("id"),
+            "shape_id": _shape_number(attrs.get("o:spid") or attrs.get("id")),
+            "object_type": object_type.group(1).decode() if object_type else None,
+            "cell": cell,
+        })
+    return shapes
+
+
+def _drawing_anchors(package: OOXMLPackage, part: str) -> Dict[str, str]:
+    """Map shape ids to top-left cells for controls mirrored in a DrawingML drawing."""
+    anchors = {}
+    root = parse_fragment(package.read(part))
+    for anchor in root:
+        start = anchor.find("from")
+        spids = [el.get("spid") for el in anchor.iter("compatExt") if el.get("spid")]
+        if start is None or not spids:
+            continue
+        cell = cell_address(int(start.findtext("col", "0")), int(start.findtext("row", "0")))
+        for spid in spids:
+            anchors[_shape_number(spid)] = cell
+    return anchors
+
+
+def _activex_prog_id(package: OOXMLPackage, part: str) -> Optional[str]:
+    if part not in package.names:
+        return None
+    root = package.parse(part)
+    clsid = root.get(f"{{{NS['ax']}}}classid", "").upper()
+    return ACTIVEX_CLSID_MAP.get(clsid, clsid or None)
+
+
+def _binary_control_elements(package: OOXMLPackage, sheet_part: str) -> List[Any]:
+    """
+    Control records of an .xlsb sheet, as <control> elements like those of an
+    .xlsx sheet. Each record starts with the shape id and the relationship id
+    of the control's activeX or ctrlProp part, which is all that is matched
+    on; name and anchor come from the VML drawing.
+
+    The relationship ids are looked up as raw strings instead of walking
+    every cell record. Control records follow the cell table, so the last
+    occurrence is the one taken.
+    """
+    data = package.read(sheet_part)
+    elements = []
+    for rel_id, (kind, _) in package.rels(sheet_part).items():
+        if kind not in (REL_CONTROL, REL_CTRL_PROP):
+            continue
+        found = data.rfind(struct.pack("<I", len(rel_id)) + rel_id.encode("utf-16-le"))
+        if found >= 4:
+            shape_id = struct.unpack_from("<I", data, found - 4)[0]
+            elements.append((found, ET.Element("control", id=rel_id, shapeId=str(shape_id))))
+    # In sheet order
+    return [element for _, element in sorted(elements, key=lambda item: item[0])]
+
+
+def _sheet_control_elements(package: OOXMLPackage, sheet_part: str) -> List[Any]:
+    if package.is_binary:
+        return _binary_control_elements(package, sheet_part)
+    # <controls> holds one <control> per shape, usually wrapped in mc:AlternateContent
+    # with the full definition in Choice and a stripped-down copy in Fallback
+    section = package.find_section(sheet_part, "controls")
+    if section is None:
+        return []
+    elements = []
+    for child in section:
+        if child.tag == "control":
+            elements.append(child)
+        elif child.tag == "AlternateContent":
+            control = child.find("Choice/control")
+            if control is None:
+                control = child.find("Fallback/control")
+            if control is not None:
+                elements.append(control)
+    return elements
+
+
+def _scan_sheet_controls(package: OOXMLPackage, sheet_name: str, sheet_part: str,
+                         decode_activex: bool) -> List[Dict[str, Any]]:
+    """Controls of one worksheet; see scan_package_controls."""
+    controls = []
+    rels = package.rels(sheet_part)
+    kinds = {kind for kind, _ in rels.values()}
+    if not kinds & {REL_CTRL_PROP, REL_CONTROL, REL_VML_DRAWING}:
+        return []
+
+    # Fallback anchors, keyed by shape id
+    vml_shapes = []
+    for part in package.rels_of_type(sheet_part, REL_VML_DRAWING):
+        if part in package.names:
+            vml_shapes.extend(_vml_shapes(package, part))
+    anchors = {shape["shape_id"]: shape["cell"] for shape in vml_shapes if shape["cell"]}
+    names = {shape["shape_id"]: shape["id"] for shape in vml_shapes}
+    for part in package.rels_of_type(sheet_part, REL_DRAWING):
+        if part in package.names:
+            anchors.update(_drawing_anchors(package, part))
+
+    elements = _sheet_control_elements(package, sheet_part) if kinds & {REL_CTRL_PROP, REL_CONTROL} else []
+    for element in elements:
+        kind, target = rels.get(element.get("id"), (None, None))
+        start = element.find("controlPr/anchor/from")
+        if start is not None:
+            cell = cell_address(int(start.findtext("col", "0")), int(start.findtext("row", "0")))
+        else:
+            cell = anchors.get(element.get("shapeId"))
+
+        properties = {}
+        if kind == REL_CONTROL:
+            prog_id = _activex_prog_id(package, target)
+            control_type = ACTIVEX_CONTROL_MAP.get(prog_id, 'Unknown ActiveX')
+            if decode_activex and target in package.names:
+                try:
+                    properties = read_activex_properties(package, target)
+                except Exception:
+                    # A control we cannot decode is still listed, just without its state
+                    properties = {}
+        else:
+            prog_id = None
+            object_type = None
+            if target in package.names:
+                object_type = package.parse(target).get("objectType")
+            control_type = _form_control_type(object_type)
+        controls.append({
+            'Sheet Name': sheet_name,
+            'Control Name': element.get("name") or names.get(element.get("shapeId")),
+            'Control Type': control_type,
+            'Location (Top-Left Cell)': cell,
+            'ProgID': prog_id,
+            'Caption': properties.get("Caption"),
+            'Value': properties.get("Value"),
+            'Text': properties.get("Text"),
+        })
+
+    if not elements:
+        # Workbooks written before Excel 2010 describe form controls in VML only
+        for shape in vml_shapes:
+            if shape["object_type"] in (None, "Note"):
+                continue
+            if shape["object_type"] == "Pict":
+                control_type = 'Unknown ActiveX'
+            else:
+                control_type = _form_control_type(shape["object_type"])
+            controls.append({
+                'Sheet Name': sheet_name,
+                'Control Name': shape["id"],
+                'Control Type': control_type,
+                'Location (Top-Left Cell)': shape["cell"],
+                'ProgID': None,
+                'Caption': None,
+                'Value': None,
+                'Text': None,
+            })
+
+    return controls
+
+
+def scan_package_controls(package: OOXMLPackage, decode_activex: bool = True) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Lists the Form Controls and ActiveX controls of every sheet from the
+    package parts alone. With ``decode_activex`` the Caption, Value and Text
+    of ActiveX controls are decoded from their activeX*.bin parts.
+
+    Only sheet relationships, ctrlProps, activeX, drawing and vmlDrawing parts
+    are parsed. A sheet's own XML is streamed (never parsed) to find its
+    <controls> section, and only when the sheet has control relationships.
+    """
+    all_controls = []
+    sheet_names = []
+    for sheet_name, sheet_part in package.sheets():
+        sheet_names.append(sheet_name)
+        with get_metrics().span("control_scan_sheet", sheet=sheet_name) as span:
+            controls = _scan_sheet_controls(package, sheet_name, sheet_part, decode_activex)
+            span["controls"] = len(controls)
+        all_controls.extend(controls)
+
+    return all_controls, sheet_names
+
+
+def scan_controls_ooxml(source: Union[bytes, str, IO[bytes]]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Lists the Form Controls and ActiveX controls of every sheet of an
+    .xlsx/.xlsm/.xlsb file by reading its zip parts directly.
+
+    Args:
+        source: The file content, a path or a binary file object.
+
+    Returns:
+        tuple: A list of control dicts and the list of sheet names.
+
+    Raises zipfile.BadZipFile for files that are not OOXML containers.
+    """
+    with OOXMLPackage(source) as package:
+        return scan_package_controls(package)
@@ -0,0 +1,115 @@
+"""
+Headless single-request conversion path: extract the macros of an uploaded
+workbook and convert them with one chat completion. Kept free of Streamlit
+so it can run from scripts and load tests as well as from the UI.
+"""
+import os
+import time
+
+from src.cache import conversion_key, get_conversion_cache
+from src.llm_client import DEFAULT_API_VERSION
+from src.metrics import get_metrics
+from src.providers import get_router
+from src.rate_limit import estimate_message_tokens
+from src.vba_extraction import extract_vba_modules, join_vba_modules
+
+
+def extract_vba_from_excel(file_bytes, original_filename):
+    """
+    Extract VBA macro code from an Excel file using oletools' VBA_Parser.
+    """
+    try:
+        modules = extract_vba_modules(file_bytes, original_filename)
+    except Exception as e:
+        return f"Error extracting VBA code: {e}"
+
+    if not modules:
+        return "No VBA macros found in the uploaded file."
+    return join_vba_modules(modules)
+
+
+def vba_listing_from_scan(scan):
+    """
+    The listing extract_vba_from_excel would return, built from a
+    scan_workbook result instead of a second pass over the upload.
+    """
+    for error in scan["errors"]:
+        if error.startswith(("vba:", "format:")):
+            return f"Error extracting VBA code: {error.split(': ', 1)[1]}"
+    if not scan["modules"]:
+        return "No VBA macros found in the uploaded file."
+    return join_vba_modules(scan["modules"])
+
+
+def convert_vba_to_csharp(vba_code, prompt_, api_key=None, api_endpoint=None, deployment_name=None, temperature=0.1,
+                          api_version=DEFAULT_API_VERSION, use_cache=True, stream=False, on_token=None, timings=None):
+    """
+    Use Azure OpenAI to convert VBA macro code into C#.
+
+    Successful conversions are memoized in the local conversion cache, keyed on
+    the prompt, the VBA code, the deployment, the temperature and the API version.
+
+    With ``stream=True`` the completion is requested as a token stream and
+    ``on_token`` is called with the accumulated text as it grows. If a
+    ``timings`` dict is given, it receives 'time_to_first_token' and 'total'
+    in seconds. The full text is returned either way.
+    """
+    start = time.perf_counter()
+    if not vba_code.strip() or vba_code.startswith("Error"):
+        return "No valid VBA code found for conversion."
+
+    deployment = os.getenv("DEPLOYMENT_NAME", "gpt-4o")
+
+    cache = get_conversion_cache() if use_cache else None
+    cache_key = conversion_key(prompt_, vba_code, deployment, temperature, api_version)
+    if cache is not None:
+        cached = cache.get(cache_key)
+        get_metrics().inc("vba_conversion_cache_total", result="miss" if cached is None else "hit")
+        if cached is not None:
+            if on_token is not None:
+                on_token(cached)
+            if timings is not None:
+                timings["time_to_first_token"] = timings["total"] = time.perf_counter() - start
+                timings["cached"] = True
+            return cached
+
+    # One router per endpoint/deployment (or the VBA_PROVIDERS set), reusing the pooled clients
+    router = get_router(
+        api_key=os.getenv("AZURE_OPENAI_API_KEY", api_key),
+        api_endpoint=os.getenv("ENDPOINT_URL", api_endpoint),
+        deployment=deployment,
+        api_version=api_version,
+    )
+
+    messages = [
+        {"role": "system", "content": "You are a highly skilled C# developer with expertise in VBA conversion."},
+        {"role": "user", "content": prompt_}
+    ]
+    # Reserve quota for the prompt plus a completion about as long as the code
+    estimated_tokens = estimate_message_tokens(messages) + len(vba_code) // 4
+    first_token_at = None
+    metrics = get_metrics()
+
+    def on_text(text):
+        nonlocal first_token_at
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+        if on_token is not None:
+            on_token(text)
+
+    try:
+        csharp_code = router.complete(messages, temperature, estimated_tokens, stream=stream, on_text=on_text)
+    except Exception as e:
+        return f"Error converting : {e}"
+
+    end = time.perf_counter()
+    metrics.observe("vba_llm_first_token_seconds", (first_token_at or end) - start, deployment=deployment)
+    if timings is not None:
+        timings["time_to_first_token"] = (first_token_at or end) - start
+        timings["total"] = end - start
+        timings["cached"] = False
+
+    if cache is not None and csharp_code:
+        cache.set(cache_key, csharp_code)
+
+    return csharp_code
@@ -0,0 +1,47 @@
+import streamlit as st
+
+from src.backends import import_timings
+from src.metrics import STAGE_METRIC, get_metrics
+
+
+def render_debug_panel():
+    """
+    Sidebar toggle that shows where time went: per-stage totals, the most
+    recent spans and the counters, plus a download of the Prometheus export.
+    """
+    if not st.sidebar.checkbox("Show debug metrics", value=False):
+        return
+    import pandas as pd
+
+    metrics = get_metrics()
+    snapshot = metrics.snapshot()
+
+    with st.expander("🛠 Debug: pipeline timings", expanded=True):
+        stages = [
+            {"stage": h["labels"].get("stage"), "count": h["count"], "total s": h["sum"],
+             "mean ms": h["sum"] / h["count"] * 1000 if h["count"] else 0.0}
+            for h in snapshot["histograms"] if h["name"] == STAGE_METRIC
+        ]
+        if stages:
+            st.dataframe(pd.DataFrame(stages).sort_values("total s", ascending=False), use_container_width=True)
+
+        imports = import_timings()
+        if imports:
+            st.write("**Backend imports**")
+            st.dataframe(pd.DataFrame([{"module": name, "ms": seconds * 1000} for name, seconds in imports.items()]),
+                         use_container_width=True)
+
+        spans = metrics.recent_spans()
+        if spans:
+            st.write("**Recent spans**")
+            st.dataframe(pd.DataFrame(spans[::-1][:200]), use_container_width=True)
+
+        if snapshot["counters"]:
+            st.write("**Counters**")
+            st.dataframe(pd.DataFrame([
+                {"name": c["name"], "labels": ", ".join(f"{k}={v}" for k, v in c["labels"].items()), "value": c["value"]}
+                for c in snapshot["counters"]
+            ]), use_container_width=True)
+
+        st.download_button("Download Prometheus metrics", metrics.render_prometheus(),
+                           file_name="metrics.prom", mime="text/plain")
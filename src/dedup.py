@@ -0,0 +1,443 @@
+"""
+Near-duplicate detection for VBA procedures, so code copy-pasted between
+workbooks is converted once.
+
+Every procedure is reduced to a canonical token stream: comments and layout
+are dropped, keywords are lower-cased, identifiers become positional
+placeholders ($1, $2, ... in order of first use) and literals become $s, $n
+or $d. Its fingerprint is the hash of that stream plus a MinHash signature
+over 5-token shingles. Accepted conversions are kept in a SQLite index
+(FINGERPRINT_DB_PATH, default under the cache directory), with the signature
+split into LSH bands so near matches are found without comparing against
+every stored procedure.
+
+A procedure with the same canonical stream as a stored one is answered
+without an LLM call: verbatim when the code is identical, otherwise with the
+stored C# after renaming the identifiers and string literals that differ.
+A near match (estimated Jaccard similarity of at least VBA_DEDUP_THRESHOLD,
+default 0.8) is still converted, but with the stored pair as a reference to
+adapt. Set VBA_DEDUP=0 to turn this off.
+"""
+import asyncio
+import hashlib
+import os
+import random
+import re
+import sqlite3
+import struct
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from src.cache import CACHE_DIR
+from src.metrics import get_metrics
+from src.vba_procedures import code_hash
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE = 5
+ERROR_PREFIX = "// Error converting"
+# Ways a unit can be answered, from cheapest to most expensive
+REUSE_KINDS = ("exact", "renamed", "near", "fresh")
+
+ADAPT_INSTRUCTIONS = (
+    "A previously accepted conversion of a near-identical VBA {kind} follows. Keep its structure and naming, and "
+    "change only what the differences between the two VBA versions require."
+)
+
+_REM_RE = re.compile(r"^([ \t]*)Rem\b[^\n]*", re.IGNORECASE | re.MULTILINE)
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<string>"(?:[^"\n]|"")*"?)
+    | (?P<comment>'[^\n]*)
+    | (?P<date>\#[^#\n]*\#)
+    | (?P<number>&[HhOo][0-9A-Fa-f]+&?|(?:\d+\.?\d*|\.\d+)(?:[Ee][+-]?\d+)?[%&!#@^]?)
+    | (?P<ident>[A-Za-z_]\w*[$%&!#@]?)
+    | (?P<continuation>[ \t]_[ \t]*\n)
+    | (?P<newline>\n)
+    | (?P<space>[ \t]+)
+    | (?P<op><>|<=|>=|:=|\S)
+    """,
+    re.VERBOSE,
+)
+_KEYWORDS = frozenset("""
+    and as attribute boolean byref byte byval call case const currency date debug declare dim do double each else
+    elseif empty end enum eqv erase error exit explicit false for friend function get global gosub goto if imp
+    implements in integer is let lib like long longlong longptr loop lset me mod new next not nothing null object
+    on option optional or paramarray preserve print private property ptrsafe public raiseevent redim resume return
+    rset select set single static step stop string sub then to true type typeof until variant wend while with
+    withevents xor
+""".split())
+# Excel object model and VBA runtime names: kept as written, so Range(...) and Cells(...) never canonicalize
+# alike and a rename can only touch the procedure's own names
+_BUILTINS = frozenset("""
+    abs activecell activechart activesheet activewindow activeworkbook application array asc cbool cbyte ccur
+    cdate cdbl cells chr chr$ cint clng collection columns createobject csng cstr cvar dateadd datediff
+    datepart dateserial datevalue day dictionary dir doevents environ err evaluate filecopy filedatetime
+    filelen fix format format$ freefile getobject hour iif inputbox instr instrrev int isarray isdate isempty
+    iserror ismissing isnull isnumeric isobject join kill lbound lcase lcase$ left left$ len listobject ltrim
+    mid mid$ minute month msgbox names now range replace right right$ rnd round rows rtrim second selection
+    sgn shapes sheets space split sqr str strcomp strconv string$ timer trim trim$ typename ubound ucase
+    ucase$ val weekday workbook workbooks worksheet worksheetfunction worksheets year
+""".split())
+# vbCrLf, xlUp, msoFalse, ...
+_BUILTIN_CONSTANT_RE = re.compile(r"^(?:vb|xl|mso)[A-Z]")
+# Members (after "."), types (after "As") and classes (after "New") belong to the object model or the project
+_LITERAL_AFTER = frozenset((".", "as", "new"))
+_LITERAL_CLASSES = {"string": "$s", "number": "$n", "date": "$d"}
+
+_MERSENNE = (1 << 61) - 1
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE), _rng.randrange(_MERSENNE)) for _ in range(NUM_PERM)]
+_SIGNATURE = struct.Struct(f"<{NUM_PERM}Q")
+
+
+def dedup_enabled() -> bool:
+    return os.getenv("VBA_DEDUP", "1").lower() not in ("0", "false", "no")
+
+
+def canonicalize(code: str) -> Dict[str, Any]:
+    """
+    Return {'tokens', 'identifiers', 'literals'} for a piece of VBA.
+    'identifiers' lists the names behind $1, $2, ... as first written, and
+    'literals' every literal in order as (class, text). Keywords, object
+    model and runtime names, members, and type and class names are kept as
+    (lower-case) tokens rather than numbered.
+    """
+    code = _REM_RE.sub(r"\1", code.replace("\r\n", "\n").replace("\r", "\n"))
+    tokens: List[str] = []
+    identifiers: Dict[str, str] = {}
+    numbers: Dict[str, int] = {}
+    literals = []
+    for match in _TOKEN_RE.finditer(code):
+        kind, text = match.lastgroup, match.group()
+        if kind in ("comment", "continuation", "space"):
+            continue
+        if kind == "newline":
+            # Blank lines carry no meaning
+            if tokens and tokens[-1] != "\n":
+                tokens.append("\n")
+        elif kind in _LITERAL_CLASSES:
+            tokens.append(_LITERAL_CLASSES[kind])
+            literals.append((kind, text))
+        elif kind == "ident":
+            lower = text.lower()
+            if (lower in _KEYWORDS or lower in _BUILTINS or _BUILTIN_CONSTANT_RE.match(text)
+                    or (tokens and tokens[-1] in _LITERAL_AFTER)):
+                tokens.append(lower)
+            else:
+                # VBA names are case-insensitive
+                if lower not in numbers:
+                    numbers[lower] = len(numbers) + 1
+                    identifiers[lower] = text
+                tokens.append(f"${numbers[lower]}")
+        else:
+            tokens.append(text)
+    while tokens and tokens[-1] == "\n":
+        tokens.pop()
+    return {"tokens": tokens, "identifiers": list(identifiers.values()), "literals": literals}
+
+
+def _hash64(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def minhash(tokens: List[str]) -> List[int]:
+    """MinHash signature (NUM_PERM values) of the SHINGLE-token shingles of ``tokens``."""
+    shingles = {"\x1f".join(tokens[i:i + SHINGLE]) for i in range(max(len(tokens) - SHINGLE + 1, 1))}
+    hashes = [_hash64(shingle) for shingle in shingles]
+    return [min((a * h + b) % _MERSENNE for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def similarity(a: List[int], b: List[int]) -> float:
+    """Jaccard similarity estimated from two MinHash signatures."""
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+
+def _band_buckets(signature: List[int]) -> List[int]:
+    packed = _SIGNATURE.pack(*signature)
+    width = ROWS * 8
+    return [
+        int.from_bytes(hashlib.blake2b(packed[band * width:(band + 1) * width], digest_size=8).digest(),
+                       "little", signed=True)
+        for band in range(BANDS)
+    ]
+
+
+def fingerprint(code: str) -> Dict[str, Any]:
+    """
+    Fingerprint one procedure: 'code_hash' (exact text), 'canonical_hash'
+    (canonical token stream), 'signature' (MinHash) and the 'identifiers'
+    and 'literals' of canonicalize().
+    """
+    canonical = canonicalize(code)
+    return {
+        "code_hash": code_hash(code),
+        "canonical_hash": hashlib.sha256(" ".join(canonical["tokens"]).encode("utf-8")).hexdigest(),
+        "signature": minhash(canonical["tokens"]),
+        "identifiers": canonical["identifiers"],
+        "literals": canonical["literals"],
+    }
+
+
+def dedup_scope(prompt_text: str, deployment: str) -> str:
+    """Conversions are only shared between requests with the same prompt and deployment."""
+    normalized = "\n".join(line.rstrip() for line in prompt_text.replace("\r\n", "\n").split("\n")).strip()
+    return hashlib.sha256(f"{normalized}\x00{deployment}".encode("utf-8")).hexdigest()[:16]
+
+
+def rename_conversion(csharp: str, source: Dict[str, Any], target: Dict[str, Any]) -> Optional[str]:
+    """
+    Adapt the C# converted from ``source`` to ``target``, two fingerprints
+    with the same canonical hash, by renaming identifiers and string
+    literals. Returns None when that cannot be done safely: a name or string
+    to replace does not appear in the C# as written, or a number or date
+    differs.
+    """
+    replacements = {}
+    for old, new in zip(source["identifiers"], target["identifiers"]):
+        if old != new:
+            if not re.search(rf"(?<!\w){re.escape(old)}(?!\w)", csharp):
+                # The conversion renamed it (e.g. to camelCase); a blind rename would miss
+                return None
+            replacements[old] = new
+    strings = {}
+    for (kind, old), (_, new) in zip(source["literals"], target["literals"]):
+        if old == new:
+            continue
+        # Strings with "" or backslash escapes are written differently in C#
+        if kind != "string" or any('""' in text[1:-1] or "\\" in text for text in (old, new)) or old not in csharp:
+            return None
+        strings[old] = new
+    if replacements:
+        pattern = re.compile(r"(?<!\w)(?:" + "|".join(re.escape(name) for name in replacements) + r")(?!\w)")
+        # One pass, so swapped names do not collide
+        csharp = pattern.sub(lambda m: replacements[m.group()], csharp)
+    if strings:
+        pattern = re.compile("|".join(re.escape(text) for text in strings))
+        csharp = pattern.sub(lambda m: strings[m.group()], csharp)
+    return csharp
+
+
+def reference_prompt(prompt_text: str, kind: str, match: Dict[str, Any]) -> str:
+    """Extend a unit prompt with a near-identical procedure and its accepted C# to adapt."""
+    return (f"{prompt_text}\n{ADAPT_INSTRUCTIONS.format(kind=kind)}\n"
+            f"' Previous VBA:\n{match['code']}\n// Previous C#:\n{match['csharp']}")
+
+
+class FingerprintStore:
+    """
+    SQLite index of accepted procedure conversions, looked up by canonical
+    hash or by LSH band. Same connection handling as SQLiteLRUCache; entries
+    are only added, one per (scope, exact code).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS procedures (
+                    id INTEGER PRIMARY KEY,
+                    scope TEXT NOT NULL,
+                    canonical_hash TEXT NOT NULL,
+                    code_hash TEXT NOT NULL,
+                    kind TEXT,
+                    name TEXT,
+                    code TEXT NOT NULL,
+                    signature BLOB NOT NULL,
+                    csharp TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    reused INTEGER NOT NULL DEFAULT 0,
+                    UNIQUE (scope, code_hash)
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_procedures_canonical ON procedures(scope, canonical_hash)")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS bands (
+                    band INTEGER NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    procedure_id INTEGER NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_bands_bucket ON bands(band, bucket)")
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def find_exact(self, scope: str, fp: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The stored procedure with the same canonical hash, preferring identical code."""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT id, code, csharp, code_hash = ? FROM procedures WHERE scope = ? AND canonical_hash = ? "
+                "ORDER BY code_hash = ? DESC, reused DESC LIMIT 1",
+                (fp["code_hash"], scope, fp["canonical_hash"], fp["code_hash"]),
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return {"id": row[0], "code": row[1], "csharp": row[2], "identical": bool(row[3])}
+
+    def find_near(self, scope: str, fp: Dict[str, Any], threshold: float) -> Optional[Dict[str, Any]]:
+        """The most similar stored procedure sharing an LSH band, if its similarity reaches ``threshold``."""
+        buckets = _band_buckets(fp["signature"])
+        clauses = " OR ".join(["(b.band = ? AND b.bucket = ?)"] * BANDS)
+        params = [value for band, bucket in enumerate(buckets) for value in (band, bucket)]
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT DISTINCT p.id, p.code, p.csharp, p.signature FROM bands b "
+                f"JOIN procedures p ON p.id = b.procedure_id WHERE p.scope = ? AND ({clauses})",
+                [scope] + params,
+            ).fetchall()
+        finally:
+            conn.close()
+        best = None
+        for id_, code, csharp, signature in rows:
+            score = similarity(fp["signature"], list(_SIGNATURE.unpack(signature)))
+            if score >= threshold and (best is None or score > best["similarity"]):
+                best = {"id": id_, "code": code, "csharp": csharp, "similarity": score}
+        return best
+
+    def add(self, scope: str, fp: Dict[str, Any], unit: Dict[str, Any], csharp: str) -> None:
+        """Record an accepted conversion; a second conversion of the same code is ignored."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO procedures (scope, canonical_hash, code_hash, kind, name, code, signature, "
+                "csharp, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (scope, fp["canonical_hash"], fp["code_hash"], unit.get("kind"), unit.get("name"), unit["code"],
+                 _SIGNATURE.pack(*fp["signature"]), csharp, time.time()),
+            )
+            if cursor.rowcount:
+                conn.executemany(
+                    "INSERT INTO bands (band, bucket, procedure_id) VALUES (?, ?, ?)",
+                    [(band, bucket, cursor.lastrowid) for band, bucket in enumerate(_band_buckets(fp["signature"]))],
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def mark_reused(self, procedure_id: int) -> None:
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE procedures SET reused = reused + 1 WHERE id = ?", (procedure_id,))
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict[str, int]:
+        conn = self._connect()
+        try:
+            entries, reused = conn.execute("SELECT COUNT(*), COALESCE(SUM(reused), 0) FROM procedures").fetchone()
+        finally:
+            conn.close()
+        return {"entries": entries, "reused": reused}
+
+
+_fingerprint_store = None
+
+
+def get_fingerprint_store() -> FingerprintStore:
+    """Return the process-wide fingerprint index (FINGERPRINT_DB_PATH, default under the cache directory)."""
+    global _fingerprint_store
+    if _fingerprint_store is None:
+        _fingerprint_store = FingerprintStore(
+            os.getenv("FINGERPRINT_DB_PATH", os.path.join(CACHE_DIR, "fingerprints.sqlite3"))
+        )
+    return _fingerprint_store
+
+
+class Deduplicator:
+    """
+    Routes the unit conversions of one batch through the fingerprint index
+    and counts how each unit was answered (see REUSE_KINDS). Units with the
+    same canonical code that are converted concurrently share one request:
+    later ones wait for the first and then reuse it.
+    """
+
+    def __init__(self, scope: str, store: Optional[FingerprintStore] = None, threshold: Optional[float] = None):
+        self.scope = scope
+        self.store = store or get_fingerprint_store()
+        self.threshold = threshold if threshold is not None else float(os.getenv("VBA_DEDUP_THRESHOLD", "0.8"))
+        self.counts = {kind: 0 for kind in REUSE_KINDS}
+        self.counts["failed"] = 0
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    def _count(self, unit: Dict[str, Any], kind: str) -> None:
+        unit["reuse"] = kind
+        self.counts[kind] += 1
+        get_metrics().inc("vba_dedup_units_total", result=kind)
+
+    def _reuse(self, unit: Dict[str, Any], fp: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Answer ``unit`` from an exact match if possible; otherwise return the match to adapt, if any."""
+        match = self.store.find_exact(self.scope, fp)
+        if match is None:
+            return None
+        if match["identical"]:
+            unit["csharp"] = match["csharp"]
+            self._count(unit, "exact")
+        else:
+            renamed = rename_conversion(match["csharp"], fingerprint(match["code"]), fp)
+            if renamed is None:
+                return match
+            unit["csharp"] = renamed
+            self._count(unit, "renamed")
+        self.store.mark_reused(match["id"])
+        return None
+
+    async def convert(self, unit: Dict[str, Any], prompt_text: str,
+                      convert: Callable[[str], Awaitable[str]]) -> str:
+        """
+        Return the C# for ``unit`` (a dict with 'code' and 'kind'), calling
+        ``convert(prompt)`` only when no stored conversion can be reused.
+        ``prompt_text`` is the prompt the unit would be sent with; for a near
+        match it is extended with the stored pair. Sets unit['reuse'].
+        """
+        fp = fingerprint(unit["code"])
+        key = fp["canonical_hash"]
+        unit.pop("csharp", None)
+        match = self._reuse(unit, fp)
+        if "csharp" not in unit and key in self._pending:
+            await self._pending[key]
+            match = self._reuse(unit, fp)
+        if "csharp" in unit:
+            return unit["csharp"]
+
+        owner = key not in self._pending
+        if owner:
+            self._pending[key] = asyncio.get_running_loop().create_future()
+        try:
+            match = match or self.store.find_near(self.scope, fp, self.threshold)
+            if match is not None:
+                prompt_text = reference_prompt(prompt_text, unit.get("kind", "procedure"), match)
+            csharp = await convert(prompt_text)
+            if csharp is None or csharp.startswith(ERROR_PREFIX):
+                unit["reuse"] = "failed"
+                self.counts["failed"] += 1
+            else:
+                self.store.add(self.scope, fp, unit, csharp)
+                self._count(unit, "near" if match is not None else "fresh")
+        finally:
+            if owner:
+                self._pending.pop(key).set_result(None)
+        return csharp
+
+    def stats(self) -> Dict[str, Any]:
+        """Counts per reuse kind, plus 'units' and 'dedup_ratio' (share of units answered without a request)."""
+        units = sum(self.counts.values())
+        reused = self.counts["exact"] + self.counts["renamed"]
+        return {**self.counts, "units": units, "dedup_ratio": reused / units if units else 0.0}
@@ -0,0 +1,319 @@
+"""
+Incremental reconversion: successive uploads of the same workbook (its
+"lineage") only send added or changed procedures to the LLM.
+
+Every module is split into its declarations and procedures (see
+src.vba_procedures). The C# of each unit is stored per lineage under the
+unit's content hash and the scope (prompt and deployment, see
+src.dedup.dedup_scope) it was converted under; on the next upload, units whose
+hash and scope are unchanged are reused as-is and only the rest are converted, one request per unit. Those
+requests go through the cross-workbook fingerprint index first (see
+src.dedup), so a procedure pasted from another workbook is not converted
+again.
+"""
+import asyncio
+import os
+import re
+import sqlite3
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+from src.cache import CACHE_DIR, get_conversion_cache
+from src.dedup import ERROR_PREFIX, Deduplicator, dedup_enabled, dedup_scope
+from src.llm_client import get_async_client, run_async
+from src.parallel_conversion import _convert_group
+from src.vba_index import VBAIndex
+from src.vba_procedures import DECLARATIONS, split_procedures
+
+if TYPE_CHECKING:
+    from openai import AsyncAzureOpenAI
+
+UNIT_INSTRUCTIONS = {
+    "Declarations": "Convert these module-level VBA declarations into C# fields, constants and imports only.",
+    "procedure": (
+        "Convert only the VBA {kind} below into the equivalent C# member. Return just the member, without a "
+        "surrounding class or namespace."
+    ),
+}
+
+_VERSION_SUFFIX_RE = re.compile(
+    r"[\s_.-]*(?:v\d+(?:\.\d+)*|\(\d+\)|copy|final|rev\d*|\d{4}-?\d{2}-?\d{2})$", re.IGNORECASE
+)
+_FENCE_RE = re.compile(r"^\s*```[\w#+-]*\s*\n(.*?)\n\s*```\s*$", re.S)
+
+
+def lineage_key(filename: str) -> str:
+    """
+    Derive a lineage name from an upload's file name by dropping version
+    markers, so "Budget v3.xlsm" and "budget_v4 (2).xlsm" share "budget".
+    """
+    stem = os.path.splitext(os.path.basename(filename))[0].strip().lower()
+    previous = None
+    while stem and stem != previous:
+        previous = stem
+        stem = _VERSION_SUFFIX_RE.sub("", stem)
+    return stem or os.path.basename(filename).lower()
+
+
+class LineageStore:
+    """
+    SQLite store of the last conversion of every unit in a lineage, keyed by
+    (lineage, module, unit key) with the scope each unit was converted under.
+    Same connection handling as SQLiteLRUCache, but entries never expire:
+    they are replaced or removed when a newer version of the workbook is
+    converted.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS units (
+                    lineage TEXT NOT NULL,
+                    module TEXT NOT NULL,
+                    unit_key TEXT NOT NULL,
+                    hash TEXT NOT NULL,
+                    scope TEXT NOT NULL DEFAULT '',
+                    csharp TEXT NOT NULL,
+                    updated REAL NOT NULL,
+                    PRIMARY KEY (lineage, module, unit_key)
+                )
+                """
+            )
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(units)")]
+            if "scope" not in columns:
+                # Units stored before scopes were recorded match no scope and are converted again
+                conn.execute("ALTER TABLE units ADD COLUMN scope TEXT NOT NULL DEFAULT ''")
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def load(self, lineage: str) -> Dict[tuple, Dict[str, str]]:
+        """Return {(module, unit key): {'hash', 'scope', 'csharp'}} for ``lineage``."""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT module, unit_key, hash, scope, csharp FROM units WHERE lineage = ?", (lineage,)
+            ).fetchall()
+        finally:
+            conn.close()
+        return {(module, key): {"hash": digest, "scope": scope, "csharp": csharp}
+                for module, key, digest, scope, csharp in rows}
+
+    def replace(self, lineage: str, units: List[Dict[str, Any]], scope: str = "") -> None:
+        """Make ``units`` (dicts with module, key, hash, csharp) converted under ``scope`` the state of ``lineage``."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM units WHERE lineage = ?", (lineage,))
+            conn.executemany(
+                "INSERT INTO units (lineage, module, unit_key, hash, scope, csharp, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(lineage, u["module"], u["key"], u["hash"], scope, u["csharp"], now) for u in units],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def lineages(self) -> List[Dict[str, Any]]:
+        """Every stored lineage with its unit count and last update time."""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT lineage, COUNT(*), MAX(updated) FROM units GROUP BY lineage ORDER BY MAX(updated) DESC"
+            ).fetchall()
+        finally:
+            conn.close()
+        return [{"lineage": lineage, "units": count, "updated": updated} for lineage, count, updated in rows]
+
+
+_lineage_store = None
+
+
+def get_lineage_store() -> LineageStore:
+    """Return the process-wide lineage store (LINEAGE_DB_PATH, default under the cache directory)."""
+    global _lineage_store
+    if _lineage_store is None:
+        _lineage_store = LineageStore(os.getenv("LINEAGE_DB_PATH", os.path.join(CACHE_DIR, "lineages.sqlite3")))
+    return _lineage_store
+
+
+def module_units(modules: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Split ``modules`` into units (see split_procedures) tagged with their 'module', minus empty declarations."""
+    units = []
+    for module in modules:
+        for unit in split_procedures(module["code"]):
+            if unit["key"] == DECLARATIONS and not unit["code"]:
+                continue
+            unit["module"] = module["vba_filename"]
+            units.append(unit)
+    return units
+
+
+def plan_units(modules: List[Dict[str, Any]], stored: Dict[tuple, Dict[str, str]],
+               scope: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Split ``modules`` into units and sort them against the stored lineage:
+    returns {'units': [...], 'added': n, 'changed': n, 'unchanged': n, 'removed': [...]}.
+    Each unit gets a 'status' and, when unchanged, its stored 'csharp'. With a
+    ``scope``, units stored under another prompt or deployment count as changed.
+    """
+    units = module_units(modules)
+    counts = {"added": 0, "changed": 0, "unchanged": 0}
+    for unit in units:
+        previous = stored.get((unit["module"], unit["key"]))
+        if previous is None:
+            unit["status"] = "added"
+        elif previous["hash"] != unit["hash"] or (scope is not None and previous["scope"] != scope):
+            unit["status"] = "changed"
+        else:
+            unit["status"] = "unchanged"
+            unit["csharp"] = previous["csharp"]
+        counts[unit["status"]] += 1
+    current = {(u["module"], u["key"]) for u in units}
+    removed = [f"{module}: {key}" for module, key in stored if (module, key) not in current]
+    return {"units": units, "removed": removed, **counts}
+
+
+def _strip_fences(text: str) -> str:
+    match = _FENCE_RE.match(text or "")
+    return match.group(1) if match else (text or "")
+
+
+def _unit_prompt(prompt_text: str, unit: Dict[str, Any], context: str) -> str:
+    if unit["key"] == DECLARATIONS:
+        instructions = UNIT_INSTRUCTIONS["Declarations"]
+    else:
+        instructions = UNIT_INSTRUCTIONS["procedure"].format(kind=unit["kind"])
+    return f"{prompt_text}\n{instructions}\n{context}"
+
+
+def _class_name(vba_filename: str) -> str:
+    name = re.sub(r"\W", "_", os.path.splitext(vba_filename)[0])
+    return name if name and not name[0].isdigit() else f"_{name}"
+
+
+def assemble_modules(units: List[Dict[str, Any]]) -> str:
+    """Join unit conversions into one partial class per VBA module, in source order."""
+    output = []
+    for module in dict.fromkeys(u["module"] for u in units):
+        members = [_strip_fences(u["csharp"]).strip("\n") for u in units if u["module"] == module]
+        body = "\n\n".join("\n".join("    " + line if line else line for line in m.split("\n"))
+                           for m in members if m.strip())
+        output.append(f"// Converted from {module}\npublic partial class {_class_name(module)}\n{{\n{body}\n}}\n")
+    return "\n".join(output)
+
+
+async def convert_units_async(
+    units: List[Dict[str, Any]],
+    modules: List[Dict[str, Any]],
+    prompt_text: str,
+    client: "AsyncAzureOpenAI",
+    deployment: str,
+    temperature: float = 0.1,
+    api_version: str = "2024-05-01-preview",
+    semaphore: Optional[asyncio.Semaphore] = None,
+    dedup: Optional[Deduplicator] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> None:
+    """
+    Convert each of ``units`` (from module_units over ``modules``) as its own
+    request with the signatures it references, setting unit['csharp'].
+    With ``dedup``, units already converted elsewhere are answered from the
+    fingerprint index instead (unit['reuse'] tells how).
+    """
+    if not units:
+        return
+    index = VBAIndex(modules)
+    cache = get_conversion_cache()
+    semaphore = semaphore or asyncio.Semaphore(8)
+    done = 0
+
+    async def convert(unit):
+        nonlocal done
+        group = [{"vba_filename": f"{unit['module']} {unit['key']}", "code": unit["code"]}]
+        prompt_ = _unit_prompt(prompt_text, unit, index.context_for_units([(unit["module"], unit["key"])]))
+
+        def request(unit_prompt):
+            return _convert_group(client, semaphore, group, unit_prompt, deployment, temperature, api_version, cache)
+
+        if dedup is not None:
+            unit["csharp"] = await dedup.convert(unit, prompt_, request)
+        else:
+            unit["csharp"] = await request(prompt_)
+        done += 1
+        if on_progress is not None:
+            on_progress(done, len(units))
+
+    await asyncio.gather(*[convert(unit) for unit in units])
+
+
+async def convert_incremental_async(
+    modules: List[Dict[str, Any]],
+    prompt_text: str,
+    lineage: str,
+    client: "AsyncAzureOpenAI",
+    deployment: str,
+    temperature: float = 0.1,
+    api_version: str = "2024-05-01-preview",
+    max_concurrency: int = 8,
+    store: Optional[LineageStore] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    dedup: Optional[Deduplicator] = None,
+) -> Dict[str, Any]:
+    """
+    Convert only the units of ``modules`` that are new or changed since the
+    last conversion of ``lineage``, reuse the stored C# for the rest, and
+    record the result as the lineage's new state.
+
+    Returns {'csharp': assembled C#, 'added', 'changed', 'unchanged',
+    'removed', 'failed', 'dedup'}, where 'dedup' is Deduplicator.stats() for
+    the converted units (None with VBA_DEDUP=0). Units whose conversion
+    failed are kept out of the store, so they are retried on the next upload.
+    """
+    store = store or get_lineage_store()
+    # C# converted under another prompt or deployment is not reused
+    scope = dedup_scope(prompt_text, deployment)
+    plan = plan_units(modules, store.load(lineage), scope)
+    units = plan["units"]
+    todo = [u for u in units if u["status"] != "unchanged"]
+    if dedup is None and dedup_enabled():
+        dedup = Deduplicator(scope)
+    # Each unit is sent with the signatures it references, not its whole module
+    await convert_units_async(todo, modules, prompt_text, client, deployment, temperature, api_version,
+                              asyncio.Semaphore(max_concurrency), dedup, on_progress)
+
+    failed = {(u["module"], u["key"]) for u in todo if (u["csharp"] or "").startswith(ERROR_PREFIX)}
+    store.replace(lineage, [u for u in units if (u["module"], u["key"]) not in failed], scope)
+    return {
+        "csharp": assemble_modules(units),
+        "added": plan["added"],
+        "changed": plan["changed"],
+        "unchanged": plan["unchanged"],
+        "removed": plan["removed"],
+        "failed": len(failed),
+        "dedup": dedup.stats() if dedup is not None else None,
+    }
+
+
+def convert_incremental(modules, prompt_text, lineage, api_key, api_endpoint, deployment,
+                        api_version="2024-05-01-preview", max_concurrency=8, on_progress=None):
+    """
+    Blocking wrapper around convert_incremental_async for Streamlit, running
+    on the shared event loop with the pooled async client.
+    """
+    client = get_async_client(api_key, api_endpoint, api_version)
+    return run_async(convert_incremental_async(
+        modules, prompt_text, lineage, client, deployment,
+        api_version=api_version, max_concurrency=max_concurrency, on_progress=on_progress,
+    ))
@@ -0,0 +1,89 @@
+from typing import Any, Dict, IO, List, Optional, Union
+
+from src.annotations import load_persons, scan_sheet_annotations
+from src.controls import scan_package_controls
+from src.ooxml import REL_VBA_PROJECT, OOXMLPackage
+from src.xls import XLSWorkbook, is_ole_file
+
+
+class WorkbookInspection:
+    """
+    One open handle on an .xlsx/.xlsm/.xlsb or legacy .xls workbook that
+    answers every metadata question about it.
+
+    The zip directory is read once when the object is created; the sheet list,
+    relationship graph, controls and annotations are computed on first use and
+    memoized, so asking for the sheet count, the sheet names and the controls
+    costs a single open instead of one full workbook load each. Legacy .xls
+    files are read through XLSWorkbook instead and have no part graph.
+    """
+
+    def __init__(self, source: Union[bytes, str, IO[bytes]]):
+        self.legacy = XLSWorkbook(source) if is_ole_file(source) else None
+        self.package = None if self.legacy else OOXMLPackage(source)
+        self._controls: Optional[List[Dict[str, Any]]] = None
+        self._annotations: Optional[Dict[str, List[Dict[str, Any]]]] = None
+
+    def close(self) -> None:
+        (self.legacy or self.package).close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def sheet_names(self) -> List[str]:
+        if self.legacy:
+            return self.legacy.sheet_names
+        return [name for name, _ in self.package.sheets()]
+
+    @property
+    def sheet_count(self) -> int:
+        return len(self.sheet_names)
+
+    @property
+    def has_vba(self) -> bool:
+        """True if the workbook carries a vbaProject part."""
+        if self.legacy:
+            return self.legacy.has_vba
+        workbook_part = self.package.workbook_part
+        return bool(self.package.rels_of_type(workbook_part, REL_VBA_PROJECT)) or "xl/vbaProject.bin" in self.package.names
+
+    def relationships(self) -> Dict[str, Dict[str, Any]]:
+        """Return the relationship graph of the workbook and its worksheets, keyed by part."""
+        if self.legacy:
+            return {}
+        graph = {self.package.workbook_part: self.package.rels(self.package.workbook_part)}
+        for _, sheet_part in self.package.sheets():
+            graph[sheet_part] = self.package.rels(sheet_part)
+        return graph
+
+    def controls(self) -> List[Dict[str, Any]]:
+        """Form Controls and ActiveX controls of every sheet (see scan_package_controls)."""
+        if self._controls is None and self.legacy:
+            self._controls = self.legacy.controls()
+        elif self._controls is None:
+            self._controls, _ = scan_package_controls(self.package)
+        return self._controls
+
+    def annotations(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Data validations, hyperlinks and comments, keyed by sheet name."""
+        if self._annotations is None and self.legacy:
+            # Notes, validations and hyperlinks of BIFF8 sheets are not decoded
+            self._annotations = {sheet_name: [] for sheet_name in self.legacy.sheet_names}
+        elif self._annotations is None:
+            persons = load_persons(self.package)
+            self._annotations = {
+                sheet_name: scan_sheet_annotations(self.package, sheet_part, persons)
+                for sheet_name, sheet_part in self.package.sheets()
+            }
+        return self._annotations
+
+    def validations(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Only the data validations of each sheet."""
+        return {
+            sheet_name: [entry for entry in entries if entry['type'] == 'Data Validation/Dropdown']
+            for sheet_name, entries in self.annotations().items()
+        }
@@ -0,0 +1,359 @@
+"""
+Portfolio-wide inventory of what has been scanned: one row per control, per
+VBA module and per procedure, keyed by the SHA-256 of the workbook, so that
+questions across thousands of workbooks are answered from an indexed SQLite
+file instead of by re-scanning them.
+
+    python -m src.inventory add path/to/workbooks
+    python -m src.inventory using Forms.ComboBox.1
+    python -m src.inventory largest-modules -n 20
+    python -m src.inventory sql "SELECT control_type, COUNT(*) FROM controls GROUP BY 1"
+
+The store is append-only: a workbook's controls and its modules are each
+recorded once per content hash, and later scans of the same bytes are
+skipped.
+"""
+import argparse
+import hashlib
+import logging
+import os
+import sqlite3
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from src.cache import CACHE_DIR, content_hash
+from src.vba_procedures import DECLARATIONS, split_procedures
+
+logger = logging.getLogger("vba_converter.inventory")
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS workbooks (
+        file_hash TEXT PRIMARY KEY,
+        filename TEXT NOT NULL,
+        bytes INTEGER,
+        first_seen REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS scans (
+        file_hash TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        scanned REAL NOT NULL,
+        PRIMARY KEY (file_hash, kind)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS controls (
+        file_hash TEXT NOT NULL,
+        sheet TEXT,
+        name TEXT,
+        control_type TEXT,
+        prog_id TEXT,
+        anchor TEXT,
+        caption TEXT,
+        value TEXT,
+        text TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS modules (
+        file_hash TEXT NOT NULL,
+        module TEXT NOT NULL,
+        stream_path TEXT,
+        lines INTEGER NOT NULL,
+        bytes INTEGER NOT NULL,
+        procedures INTEGER NOT NULL,
+        code_hash TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS procedures (
+        file_hash TEXT NOT NULL,
+        module TEXT NOT NULL,
+        proc_key TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        name TEXT NOT NULL,
+        start_line INTEGER NOT NULL,
+        lines INTEGER NOT NULL,
+        bytes INTEGER NOT NULL,
+        code_hash TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_controls_file ON controls(file_hash)",
+    "CREATE INDEX IF NOT EXISTS idx_controls_prog_id ON controls(prog_id)",
+    "CREATE INDEX IF NOT EXISTS idx_controls_type ON controls(control_type)",
+    "CREATE INDEX IF NOT EXISTS idx_modules_file ON modules(file_hash)",
+    "CREATE INDEX IF NOT EXISTS idx_modules_bytes ON modules(bytes)",
+    "CREATE INDEX IF NOT EXISTS idx_modules_code_hash ON modules(code_hash)",
+    "CREATE INDEX IF NOT EXISTS idx_procedures_file ON procedures(file_hash)",
+    "CREATE INDEX IF NOT EXISTS idx_procedures_bytes ON procedures(bytes)",
+    "CREATE INDEX IF NOT EXISTS idx_procedures_code_hash ON procedures(code_hash)",
+]
+
+
+def _rows(cursor: sqlite3.Cursor) -> List[Dict[str, Any]]:
+    columns = [c[0] for c in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+class InventoryStore:
+    """
+    Append-only SQLite inventory of controls, modules and procedures. Uses
+    the same connection handling as SQLiteLRUCache (WAL, one connection per
+    operation), so pages, the batch CLI and ad-hoc queries can share a file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def has(self, file_hash: str, kind: Optional[str] = None) -> bool:
+        """Whether the workbook (or its ``kind`` scan: 'controls' or 'modules') is already recorded."""
+        conn = self._connect()
+        try:
+            if kind is None:
+                row = conn.execute("SELECT 1 FROM workbooks WHERE file_hash = ?", (file_hash,)).fetchone()
+            else:
+                row = conn.execute("SELECT 1 FROM scans WHERE file_hash = ? AND kind = ?", (file_hash, kind)).fetchone()
+            return row is not None
+        finally:
+            conn.close()
+
+    def _append(self, file_hash: str, filename: str, size: Optional[int], kind: str,
+                rows: Dict[str, Sequence[tuple]]) -> bool:
+        """Insert ``rows`` ({table: rows}) for one scan in a single transaction, unless it was recorded before."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM scans WHERE file_hash = ? AND kind = ?", (file_hash, kind)).fetchone():
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute("INSERT OR IGNORE INTO workbooks (file_hash, filename, bytes, first_seen) VALUES (?, ?, ?, ?)",
+                         (file_hash, filename, size, now))
+            conn.execute("INSERT INTO scans (file_hash, kind, scanned) VALUES (?, ?, ?)", (file_hash, kind, now))
+            for table, table_rows in rows.items():
+                if table_rows:
+                    placeholders = ", ".join("?" * len(table_rows[0]))
+                    conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})", table_rows)
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def record_controls(self, file_hash: str, filename: str, controls: List[Dict[str, Any]],
+                        size: Optional[int] = None) -> bool:
+        """
+        Record the controls found by scan_workbook (or scan_controls_ooxml) for one workbook.
+        Returns False (and writes nothing) if they were recorded before.
+        """
+        rows = [(
+            file_hash, c.get("Sheet Name"), c.get("Control Name"), c.get("Control Type"), c.get("ProgID"),
+            c.get("Location (Top-Left Cell)"), *(None if c.get(k) is None else str(c.get(k))
+                                                 for k in ("Caption", "Value", "Text")),
+        ) for c in controls]
+        return self._append(file_hash, filename, size, "controls", {"controls": rows})
+
+    def record_modules(self, file_hash: str, filename: str, modules: List[Dict[str, Any]],
+                       size: Optional[int] = None) -> bool:
+        """
+        Record the VBA modules of one workbook (as returned by
+        extract_vba_modules) and the procedures in them. Returns False if
+        they were recorded before.
+        """
+        module_rows = []
+        procedure_rows = []
+        for module in modules:
+            code = module["code"]
+            units = [u for u in split_procedures(code) if u["key"] != DECLARATIONS]
+            module_rows.append((
+                file_hash, module["vba_filename"], module.get("stream_path"), code.count("\n") + 1, len(code),
+                len(units), hashlib.sha256(code.encode("utf-8")).hexdigest(),
+            ))
+            procedure_rows.extend((
+                file_hash, module["vba_filename"], u["key"], u["kind"], u["name"], u["start_line"],
+                u["code"].count("\n") + 1, len(u["code"]), u["hash"],
+            ) for u in units)
+        return self._append(file_hash, filename, size, "modules", {"modules": module_rows, "procedures": procedure_rows})
+
+    def query(self, sql: str, params: Sequence[Any] = ()) -> List[Dict[str, Any]]:
+        """Run a read-only query and return the rows as dicts."""
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=30)
+        try:
+            return _rows(conn.execute(sql, tuple(params)))
+        finally:
+            conn.close()
+
+    def workbooks_using(self, prog_id: Optional[str] = None, control_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Workbooks with at least one control of this ProgID (or control type), with the count per workbook."""
+        column, value = ("prog_id", prog_id) if prog_id else ("control_type", control_type)
+        return self.query(
+            f"""
+            SELECT w.file_hash, w.filename, COUNT(*) AS controls, GROUP_CONCAT(DISTINCT c.sheet) AS sheets
+            FROM controls c JOIN workbooks w ON w.file_hash = c.file_hash
+            WHERE c.{column} = ?
+            GROUP BY w.file_hash ORDER BY controls DESC
+            """,
+            (value,),
+        )
+
+    def largest_modules(self, limit: int = 20) -> List[Dict[str, Any]]:
+        return self.query(
+            """
+            SELECT w.filename, m.module, m.lines, m.bytes, m.procedures, m.file_hash
+            FROM modules m JOIN workbooks w ON w.file_hash = m.file_hash
+            ORDER BY m.bytes DESC LIMIT ?
+            """,
+            (limit,),
+        )
+
+    def largest_procedures(self, limit: int = 20) -> List[Dict[str, Any]]:
+        return self.query(
+            """
+            SELECT w.filename, p.module, p.proc_key, p.lines, p.bytes, p.file_hash
+            FROM procedures p JOIN workbooks w ON w.file_hash = p.file_hash
+            ORDER BY p.bytes DESC LIMIT ?
+            """,
+            (limit,),
+        )
+
+    def control_counts(self) -> List[Dict[str, Any]]:
+        """Controls per type and ProgID across the portfolio, with the number of workbooks using each."""
+        return self.query(
+            """
+            SELECT control_type, prog_id, COUNT(*) AS controls, COUNT(DISTINCT file_hash) AS workbooks
+            FROM controls GROUP BY control_type, prog_id ORDER BY controls DESC
+            """
+        )
+
+    def stats(self) -> Dict[str, int]:
+        counts = {}
+        for table in ("workbooks", "controls", "modules", "procedures"):
+            counts[table] = self.query(f"SELECT COUNT(*) AS n FROM {table}")[0]["n"]
+        return counts
+
+
+_inventory_store = None
+
+
+def get_inventory_store() -> InventoryStore:
+    """Return the process-wide inventory (INVENTORY_DB_PATH, default under the cache directory)."""
+    global _inventory_store
+    if _inventory_store is None:
+        _inventory_store = InventoryStore(os.getenv("INVENTORY_DB_PATH", os.path.join(CACHE_DIR, "inventory.sqlite3")))
+    return _inventory_store
+
+
+def record_upload(file_bytes: bytes, filename: str, modules: Optional[List[Dict[str, Any]]] = None,
+                  controls: Optional[List[Dict[str, Any]]] = None) -> None:
+    """
+    Add what a page has just extracted from an upload to the inventory.
+    Never raises: the inventory must not get in the way of the page.
+    """
+    try:
+        store = get_inventory_store()
+        file_hash = content_hash(file_bytes)
+        if controls is not None:
+            store.record_controls(file_hash, filename, controls, size=len(file_bytes))
+        if modules is not None:
+            store.record_modules(file_hash, filename, modules, size=len(file_bytes))
+    except Exception as e:
+        logger.warning("Could not record %s in the inventory: %s", filename, e)
+
+
+def add_files(store: InventoryStore, paths: Iterable[str]) -> Dict[str, int]:
+    """Scan workbooks (files or directories) into ``store``, skipping content already recorded."""
+    from src.cli import find_workbooks
+    from src.scanner import scan_workbook
+
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, p) for p in find_workbooks(path))
+        else:
+            files.append(path)
+    counts = {"scanned": 0, "skipped": 0, "errors": 0}
+    for path in files:
+        with open(path, "rb") as f:
+            file_bytes = f.read()
+        file_hash = content_hash(file_bytes)
+        if store.has(file_hash, "controls") and store.has(file_hash, "modules"):
+            counts["skipped"] += 1
+            continue
+        name = os.path.basename(path)
+        scan = scan_workbook(file_bytes, name)
+        failed = {error.split(":", 1)[0] for error in scan["errors"]}
+        if "format" not in failed and "vba" not in failed:
+            store.record_modules(file_hash, name, scan["modules"], size=len(file_bytes))
+        if "format" not in failed and "controls" not in failed:
+            store.record_controls(file_hash, name, scan["controls"], size=len(file_bytes))
+        for error in scan["errors"]:
+            print(f"{path}: {error}", file=sys.stderr)
+        counts["errors" if scan["errors"] else "scanned"] += 1
+    return counts
+
+
+def _print_rows(rows: List[Dict[str, Any]]) -> None:
+    if not rows:
+        print("(no rows)")
+        return
+    columns = list(rows[0])
+    widths = {c: min(60, max(len(c), *(len(str(r[c])) for r in rows))) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(str(row[c])[:widths[c]].ljust(widths[c]) for c in columns))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.inventory", description="Query the macro and control inventory.")
+    parser.add_argument("--db", default=None, help="Inventory file (default: INVENTORY_DB_PATH or the cache directory)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="Scan workbooks or directories into the inventory")
+    add.add_argument("paths", nargs="+")
+    using = commands.add_parser("using", help="Workbooks with controls of a ProgID (e.g. Forms.ComboBox.1)")
+    using.add_argument("prog_id")
+    using.add_argument("--type", action="store_true", help="Match the control type instead of the ProgID")
+    for name in ("largest-modules", "largest-procedures"):
+        command = commands.add_parser(name)
+        command.add_argument("-n", "--limit", type=int, default=20)
+    commands.add_parser("counts", help="Controls per type across the portfolio")
+    commands.add_parser("stats", help="Row counts")
+    sql = commands.add_parser("sql", help="Run a read-only SQL query")
+    sql.add_argument("query")
+    args = parser.parse_args(argv)
+
+    store = InventoryStore(args.db) if args.db else get_inventory_store()
+    if args.command == "add":
+        print(add_files(store, args.paths))
+    elif args.command == "using":
+        _print_rows(store.workbooks_using(control_type=args.prog_id) if args.type else store.workbooks_using(args.prog_id))
+    elif args.command == "largest-modules":
+        _print_rows(store.largest_modules(args.limit))
+    elif args.command == "largest-procedures":
+        _print_rows(store.largest_procedures(args.limit))
+    elif args.command == "counts":
+        _print_rows(store.control_counts())
+    elif args.command == "stats":
+        print(store.stats())
+    else:
+        _print_rows(store.query(args.query))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
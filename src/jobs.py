@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def job_key(kind: str, **fields: Any) -> str:
+    """
+    Key for a job of ``kind`` computed from ``fields`` (JSON-serializable).
+    Submissions with the same key share one job.
+    """
+    payload = json.dumps({"kind": kind, **fields}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Job:
+    """
+    One unit of background work. Workers report through update(); the UI only
+    reads the attributes, so a rerun can pick up a job at any point.
+    """
+
+    def __init__(self, key: str, description: str = ""):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.description = description
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = "Queued"
+        self.partial: Any = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.updated = self.created
+        self._lock = threading.Lock()
+
+    def update(self, progress: Optional[float] = None, message: Optional[str] = None, partial: Any = None) -> None:
+        """Record progress from inside the job function."""
+        with self._lock:
+            if progress is not None:
+                self.progress = max(0.0, min(1.0, progress))
+            if message is not None:
+                self.message = message
+            if partial is not None:
+                self.partial = partial
+            self.updated = time.time()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "id": self.id, "key": self.key, "description": self.description, "status": self.status,
+                "progress": self.progress, "message": self.message, "error": self.error,
+                "created": self.created, "updated": self.updated,
+            }
+
+
+class JobManager:
+    """
+    Worker pool plus a registry of jobs keyed by what they compute.
+
+    Submitting a key that already has a queued, running or finished job
+    returns that job instead of starting a duplicate; only failed jobs are
+    retried. Finished jobs are kept for ``retention`` seconds.
+    """
+
+    def __init__(self, max_workers: int = 4, retention: float = 3600):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="conversion-job")
+        self.retention = retention
+        self._jobs: Dict[str, Job] = {}
+        self._by_key: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, fn: Callable[..., Any], *args, description: str = "", **kwargs) -> Job:
+        """
+        Run ``fn(job, *args, **kwargs)`` in the pool, or return the existing job for ``key``.
+        """
+        with self._lock:
+            self._expire()
+            existing = self._jobs.get(self._by_key.get(key))
+            if existing is not None and existing.status != FAILED:
+                return existing
+            job = Job(key, description)
+            self._jobs[job.id] = job
+            self._by_key[key] = job.id
+        self.executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job: Job, fn, args, kwargs) -> None:
+        job.status = RUNNING
+        job.update(message="Running")
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.status = DONE
+            job.update(progress=1.0, message="Done")
+        except Exception as e:
+            job.error = f"{e}\n{traceback.format_exc()}"
+            job.status = FAILED
+            job.update(message=f"Failed: {e}")
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def find(self, key: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(self._by_key.get(key))
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.retention
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and job.updated < cutoff:
+                del self._jobs[job_id]
+                if self._by_key.get(job.key) == job_id:
+                    del self._by_key[job.key]
+
+
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """Return the process-wide job manager, shared by every Streamlit session."""
+    global _job_manager
+    with _job_manager_lock:
+        if _job_manager is None:
+            _job_manager = JobManager(max_workers=int(os.getenv("CONVERSION_JOB_WORKERS", "4")))
+    return _job_manager
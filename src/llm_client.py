@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+from src.metrics import get_metrics
+
+# openai and httpx take most of a second to import, so they are only loaded
+# when the first client is built (or ahead of time by src.backends.prewarm)
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncAzureOpenAI, AzureOpenAI
+
+DEFAULT_API_VERSION = "2024-05-01-preview"
+
+# Connection pool settings, shared by every session in the process
+MAX_CONNECTIONS = int(os.getenv("AZURE_OPENAI_MAX_CONNECTIONS", "50"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("AZURE_OPENAI_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("AZURE_OPENAI_KEEPALIVE_SECONDS", "120"))
+REQUEST_TIMEOUT = float(os.getenv("AZURE_OPENAI_TIMEOUT_SECONDS", "300"))
+
+_clients: Dict[Tuple[str, str, str], "AzureOpenAI"] = {}
+_async_clients: Dict[Tuple[str, str, str], "AsyncAzureOpenAI"] = {}
+_provider_clients: Dict[Tuple[str, bool, Tuple[str, str, str]], Any] = {}
+_lock = threading.Lock()
+_loop = None
+_loop_thread = None
+
+
+def _client_key(api_key: str, api_endpoint: str, api_version: str) -> Tuple[str, str, str]:
+    # Only a digest of the key is kept in the registry
+    return (api_endpoint.rstrip("/"), hashlib.sha256(api_key.encode("utf-8")).hexdigest(), api_version)
+
+
+def _limits() -> "httpx.Limits":
+    import httpx
+
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+
+def get_client(api_key: str, api_endpoint: str, api_version: str = DEFAULT_API_VERSION) -> "AzureOpenAI":
+    """
+    Return the process-wide AzureOpenAI client for this endpoint/key/api_version.
+
+    Clients are created once and share a keep-alive connection pool, so
+    conversions after the first one skip the TLS handshake.
+    """
+    key = _client_key(api_key, api_endpoint, api_version)
+    with _lock:
+        client = _clients.get(key)
+        get_metrics().inc("vba_llm_clients_total", kind="sync", result="reused" if client else "created")
+        if client is None:
+            import httpx
+            from openai import AzureOpenAI
+
+            with get_metrics().span("client_construction", kind="sync"):
+                client = AzureOpenAI(
+                    api_key=api_key,
+                    azure_endpoint=api_endpoint,
+                    api_version=api_version,
+                    # Retries are handled by src.rate_limit so they respect the shared quota
+                    max_retries=0,
+                    http_client=httpx.Client(limits=_limits(), timeout=REQUEST_TIMEOUT),
+                )
+            _clients[key] = client
+    return client
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return the background event loop that owns every async client.
+
+    httpx async connections are bound to the loop that opened them, so async
+    clients are only reusable across Streamlit reruns if they always run on
+    the same long-lived loop.
+    """
+    global _loop, _loop_thread
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="azure-openai-loop", daemon=True)
+            _loop_thread.start()
+    return _loop
+
+
+def run_async(coro):
+    """Run a coroutine on the shared event loop and block until it completes."""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+
+def get_async_client(api_key: str, api_endpoint: str, api_version: str = DEFAULT_API_VERSION) -> "AsyncAzureOpenAI":
+    """
+    Return the process-wide AsyncAzureOpenAI client for this endpoint/key/api_version.
+
+    The client must only be awaited on the loop returned by get_event_loop(),
+    e.g. through run_async().
+    """
+    key = _client_key(api_key, api_endpoint, api_version)
+    with _lock:
+        client = _async_clients.get(key)
+        get_metrics().inc("vba_llm_clients_total", kind="async", result="reused" if client else "created")
+        if client is None:
+            client = create_async_client(api_key, api_endpoint, api_version)
+            _async_clients[key] = client
+    return client
+
+
+def create_async_client(api_key: str, api_endpoint: str, api_version: str = DEFAULT_API_VERSION) -> "AsyncAzureOpenAI":
+    """
+    Return a new AsyncAzureOpenAI client with the configured connection pool,
+    for callers that own their event loop (e.g. the batch CLI).
+    """
+    import httpx
+    from openai import AsyncAzureOpenAI
+
+    with get_metrics().span("client_construction", kind="async"):
+        return AsyncAzureOpenAI(
+            api_key=api_key,
+            azure_endpoint=api_endpoint,
+            api_version=api_version,
+            max_retries=0,
+            http_client=httpx.AsyncClient(limits=_limits(), timeout=REQUEST_TIMEOUT),
+        )
+
+
+def get_provider_client(provider: str, api_key: str, endpoint: Optional[str] = None, async_: bool = False) -> Any:
+    """
+    Return the process-wide client of a non-Azure provider ("openai" or
+    "anthropic"), with the same connection pool settings as the Azure
+    clients. Async clients follow the same rule as get_async_client().
+    """
+    key = (provider, async_, _client_key(api_key, endpoint or "", ""))
+    with _lock:
+        client = _provider_clients.get(key)
+        get_metrics().inc("vba_llm_clients_total", kind=f"{provider}-{'async' if async_ else 'sync'}",
+                          result="reused" if client else "created")
+        if client is None:
+            import httpx
+
+            if provider == "openai":
+                import openai as sdk
+
+                cls = sdk.AsyncOpenAI if async_ else sdk.OpenAI
+            elif provider == "anthropic":
+                import anthropic as sdk
+
+                cls = sdk.AsyncAnthropic if async_ else sdk.Anthropic
+            else:
+                raise ValueError(f"Unknown provider: {provider!r} (expected openai or anthropic)")
+            http_client = (httpx.AsyncClient if async_ else httpx.Client)(limits=_limits(), timeout=REQUEST_TIMEOUT)
+            with get_metrics().span("client_construction", kind=provider):
+                client = cls(api_key=api_key, base_url=endpoint, max_retries=0, http_client=http_client)
+            _provider_clients[key] = client
+    return client
@@ -1,90 +1,214 @@
 
 
 import streamlit as st
-import tempfile
+import time
 import os
-from openai import AzureOpenAI  # Changed from OpenAI to AzureOpenAI
-from oletools.olevba import VBA_Parser
-from azure.identity import DefaultAzureCredential, get_bearer_token_provider
+from src.backends import get_converter, get_extractor
+from src.cache import content_hash, get_conversion_cache
+from src.conversion import vba_listing_from_scan
+from src.debug_panel import render_debug_panel
+from src.dedup import ERROR_PREFIX
+from src.incremental import lineage_key
+from src.inventory import record_upload
+from src.jobs import DONE, FAILED, get_job_manager, job_key
+from src.metrics import get_metrics
+from src.parallel_conversion import DEFAULT_PROMPT, join_converted_groups
+from src.providers import router_stats
+from src.rate_limit import get_rate_limiter
+from src.result_view import archive_bytes, module_results, page_count, text_page
+from src.vba_compact import compact_vba, restore_line_numbers
 
 # Set page configuration to wide layout
 
 
-def extract_vba_from_excel(file_bytes, original_filename):
+def run_conversion_job(job, file_bytes, original_filename, prompt_text, conversion_mode, max_concurrency, stream_output, settings):
     """
-    Extract VBA macro code from an Excel file using oletools' VBA_Parser.
+    Extract and convert one workbook in a background worker, reporting progress
+    through ``job``. Returns a dict with 'vba_code', 'csharp_code', 'timings'
+    and 'modules' (src.result_view.module_results).
+
+    Raises RuntimeError when the request, or any module group or procedure,
+    failed to convert, so the job ends FAILED and converting again retries it.
     """
-    # This function remains unchanged
-    ext = os.path.splitext(original_filename)[1]
-    vba_code = ""
-
-    # Save the uploaded file temporarily
-    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-        tmp.write(file_bytes)
-        tmp_path = tmp.name
-
-    # Extract VBA macros
-    try:
-        vba_parser = VBA_Parser(tmp_path)
-        if vba_parser.detect_vba_macros():
-            for (filename, stream_path, vba_filename, code) in vba_parser.extract_all_macros():
-                vba_code += f"' Macro from {vba_filename} in {filename}\n" + code + "\n\n"
-        else:
-            vba_code = "No VBA macros found in the uploaded file."
-        vba_parser.close()
-    except Exception as e:
-        vba_code = f"Error extracting VBA code: {e}"
-    finally:
-        os.remove(tmp_path)
+    job.update(progress=0.05, message="Extracting VBA code...")
+    # Macros and controls come out of one pass over the upload, for .xlsm, .xlsb and .xls alike
+    scan = get_extractor("scan")(file_bytes, original_filename)
+    vba_code = vba_listing_from_scan(scan)
+    failed = {error.split(":", 1)[0] for error in scan["errors"]}
+    if "format" not in failed:
+        record_upload(file_bytes, original_filename,
+                      modules=None if "vba" in failed else scan["modules"],
+                      controls=None if "controls" in failed else scan["controls"])
+    partial = {"vba_code": vba_code, "csharp_code": "", "vba_modules": scan["modules"]}
+    job.update(progress=0.1, message="Converting VBA code...", partial=partial)
+
+    timings = {}
+    compaction = None
+    incremental = None
+    if conversion_mode == "Single request" or vba_code.startswith("Error") or vba_code.startswith("No VBA"):
+        # The model gets the compacted listing; line references in its answer are mapped back to vba_code
+        compacted = compact_vba(vba_code) if scan["modules"] else {"code": vba_code, "line_map": []}
+        csharp_code = get_converter("single")(
+            compacted["code"],
+            prompt_=f"{prompt_text} VBA Code:{compacted['code']}",
+            api_key=settings["api_key"],
+            api_endpoint=settings["api_endpoint"],
+            deployment_name=settings["deployment"],
+            stream=stream_output,
+            on_token=lambda text: job.update(partial=dict(partial, csharp_code=text)),
+            timings=timings,
+        )
+        if csharp_code.startswith("Error converting"):
+            raise RuntimeError(csharp_code)
+        csharp_code = restore_line_numbers(csharp_code, compacted["line_map"])
+        if "tokens_before" in compacted:
+            compaction = {"tokens_before": compacted["tokens_before"], "tokens_after": compacted["tokens_after"]}
+    elif conversion_mode == "Incremental (changed procedures only)":
+        summary = get_converter("incremental")(
+            scan["modules"],
+            prompt_text,
+            settings["lineage"],
+            api_key=settings["api_key"],
+            api_endpoint=settings["api_endpoint"],
+            deployment=settings["deployment"],
+            max_concurrency=max_concurrency,
+            on_progress=lambda done, total: job.update(
+                progress=0.1 + 0.9 * done / total, message=f"Converted {done} of {total} changed procedures"
+            ),
+        )
+        if summary["failed"]:
+            # Failed procedures are kept out of the lineage store, so the retry converts only those
+            raise RuntimeError(f"{summary['failed']} procedures failed to convert")
+        csharp_code = summary.pop("csharp")
+        incremental = summary
+    else:
+        results = get_converter("parallel")(
+            scan["modules"],
+            prompt_text,
+            api_key=settings["api_key"],
+            api_endpoint=settings["api_endpoint"],
+            deployment=settings["deployment"],
+            max_concurrency=max_concurrency,
+            on_progress=lambda done, total: job.update(
+                progress=0.1 + 0.9 * done / total, message=f"Converted {done} of {total} module groups"
+            ),
+        )
+        errors = [r["csharp"] for r in results if (r["csharp"] or "").startswith(ERROR_PREFIX)]
+        if errors:
+            # Groups that did convert are in the conversion cache, so the retry only requests the others
+            raise RuntimeError(f"{len(errors)} of {len(results)} module groups failed to convert: {errors[0][3:]}")
+        csharp_code = join_converted_groups(results)
+
+    return {"vba_code": vba_code, "csharp_code": csharp_code, "timings": timings, "compaction": compaction,
+            "incremental": incremental, "modules": module_results(scan["modules"], csharp_code)}
 
-    return vba_code
 
-def convert_vba_to_csharp(vba_code,prompt_ ,api_key=st.secrets['api_key'], api_endpoint=st.secrets['api_endpoint'], deployment_name=st.secrets['deployment_name']):
+def render_code_page(code, key, language=None, first_line=1, line_numbers=False):
     """
-    Use Azure OpenAI to convert VBA macro code into C#.
+    Show ``code`` one page at a time, so a large module costs one page of
+    payload per rerun. ``first_line`` is where ``code`` starts in the listing
+    the line numbers refer to.
     """
-    if not vba_code.strip() or vba_code.startswith("Error"):
-        return "No valid VBA code found for conversion."
-    # print(api_key)
-    # print(api_endpoint)
-    # print(deployment_name)
-     
-    deployment = os.getenv("DEPLOYMENT_NAME", "gpt-4o")  
-      
-# Initialize Azure OpenAI Service client with Entra ID authentication
-   
-    # Initialize Azure OpenAI client
-    client = AzureOpenAI(
-        api_key= os.getenv("AZURE_OPENAI_API_KEY", api_key),  
-        # api_version="2024-11-20",  # Using a standard Azure OpenAI API version
-        azure_endpoint=os.getenv("ENDPOINT_URL",api_endpoint),
-        # azure_ad_token_provider=token_provider,  
-        api_version="2024-05-01-preview",
-    )
+    pages = page_count(code)
+    page = 1
+    if pages > 1:
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, key=key)
+    chunk, first, last = text_page(code, page)
+    if pages > 1 or first_line > 1:
+        st.caption(f"Lines {first_line + first - 1}–{first_line + last - 1}")
+    st.code(chunk, language=language, line_numbers=line_numbers)
 
-    # prompt = f"""
-    # You are an expert in converting VBA (Visual Basic for Applications) macros to C#.
-    # Convert the following VBA code into C# with appropriate syntax and best practices:
+def render_conversion_job(job, original_filename):
+    """
+    Show the current state of a conversion job: progress while it runs, the
+    side-by-side result (partial while streaming) and the download when done.
+    """
+    if job.status == FAILED:
+        st.error(job.message)
+        return
+    data = job.result if job.status == DONE else (job.partial or {})
+    if not job.finished:
+        st.progress(job.progress, text=job.message)
 
-    # VBA CODE:
-    # {vba_code}
+    csharp_code = data.get("csharp_code", "")
+    results = data.get("modules")
+    if results is None:
+        results = module_results(data.get("vba_modules") or [], csharp_code)
 
-    # """
-    
-    try:
-        response = client.chat.completions.create(
-            model=deployment,  # Use the deployment name instead of model name
-            messages=[
-                {"role": "system", "content": "You are a highly skilled C# developer with expertise in VBA conversion."},
-                {"role": "user", "content": prompt_}
-            ],
-            temperature=0.1
+    # One module at a time, side by side; the whole listing is only in the downloads
+    module = None
+    if results:
+        index = st.selectbox(
+            "Module",
+            range(len(results)),
+            format_func=lambda i: f"{results[i]['name']} ({results[i]['lines']} lines)",
+            key=f"module_{job.id}",
         )
-        csharp_code = response.choices[0].message.content
-    except Exception as e:
-        csharp_code = f"Error converting : {e}"
+        module = results[index]
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Extracted VBA Code")
+        if module is None:
+            st.code(data.get("vba_code", ""), language="vb")
+        else:
+            # The caption gives the page's lines in the full listing, which line references in the C# point at
+            render_code_page(module["vba"], f"vba_page_{job.id}_{index}", "vb", module["first_line"], line_numbers=True)
+    with col2:
+        st.subheader("Converted Code")
+        if module is not None and module["csharp"] is not None:
+            if len(module["group"]) > 1:
+                st.caption(f"Converted together with {', '.join(n for n in module['group'] if n != module['name'])}")
+            render_code_page(module["csharp"], f"cs_page_{job.id}_{index}", "csharp")
+        elif module is not None and any(m["csharp"] is not None for m in results):
+            st.info("No C# was produced for this module.")
+        else:
+            if module is not None and csharp_code:
+                st.caption("Converted in one request for the whole workbook")
+            render_code_page(csharp_code, f"cs_page_{job.id}", "csharp")
 
-    return csharp_code
+    if job.status == DONE:
+        timings = data.get("timings")
+        if timings:
+            col2.caption(
+                f"Time to first token: {timings['time_to_first_token']:.2f}s, "
+                f"total: {timings['total']:.2f}s" + (" (cached)" if timings.get("cached") else "")
+            )
+        compaction = data.get("compaction")
+        if compaction:
+            col2.caption(
+                f"Prompt code: ~{compaction['tokens_before']} tokens, ~{compaction['tokens_after']} after compaction"
+            )
+        incremental = data.get("incremental")
+        if incremental:
+            col2.caption(
+                f"Reused {incremental['unchanged']}, converted {incremental['added'] + incremental['changed']} "
+                f"(added {incremental['added']}, changed {incremental['changed']}), "
+                f"removed {len(incremental['removed'])}"
+                + (f", {incremental['failed']} failed" if incremental["failed"] else "")
+            )
+        dedup = (incremental or {}).get("dedup")
+        if dedup and dedup["units"]:
+            col2.caption(
+                f"Fingerprint index: {dedup['exact'] + dedup['renamed']} of {dedup['units']} converted procedures "
+                f"reused from earlier conversions, {dedup['near']} adapted from near matches "
+                f"(dedup ratio {dedup['dedup_ratio']:.0%})"
+            )
+        col2.download_button(
+            "Download C#",
+            data=data["csharp_code"],
+            file_name=f"{os.path.splitext(original_filename)[0]}.cs",
+            mime="text/plain"
+        )
+        if results:
+            # Built once when first shown and kept on the finished job, so later reruns reuse the bytes
+            if "archive" not in data:
+                data["archive"] = archive_bytes(results, data["csharp_code"], original_filename)
+            col2.download_button(
+                "Download modules (.zip)",
+                data=data["archive"],
+                file_name=f"{os.path.splitext(original_filename)[0]}_modules.zip",
+                mime="application/zip"
+            )
 
 def main_vba_code_converter():
     st.set_page_config(layout="wide", page_title="Excel VBA to C# Converter", initial_sidebar_state="expanded")
@@ -112,32 +236,76 @@ def main_vba_code_converter():
     uploaded_file = st.file_uploader("Upload an Excel file with VBA macros", type=["xlsm", "xlsb", "xls"])
 
     if uploaded_file is not None:
-        file_bytes = uploaded_file.read()
+        with get_metrics().span("upload_read", file=uploaded_file.name) as span:
+            file_bytes = uploaded_file.read()
+            span["bytes"] = len(file_bytes)
         original_filename = uploaded_file.name
         
 
 # Let the user edit the prompt
         prompt_text = st.text_area(
             "Prompt for Conversion",
-            value=(
-    "You are an expert in converting VBA (Visual Basic for Applications) macros to C#.\n"
-    "Convert the following VBA code into C# with appropriate syntax and best practices:\n"
-),
+            value=DEFAULT_PROMPT,
             height=120
         )           
+        conversion_mode = st.radio(
+            "Conversion mode",
+            ["Single request", "Per module (parallel)", "Incremental (changed procedures only)"],
+            horizontal=True,
+            help="Per module mode converts each module (or a small group of modules) as its own concurrent request. "
+                 "Incremental mode converts only the procedures that changed since the last conversion of the same "
+                 "workbook lineage and reuses the earlier C# for the rest."
+        )
+        lineage = lineage_key(original_filename)
+        if conversion_mode == "Incremental (changed procedures only)":
+            lineage = st.text_input(
+                "Workbook lineage",
+                value=lineage,
+                help="Uploads with the same lineage are treated as versions of one workbook."
+            )
+        max_concurrency = st.sidebar.number_input("Max concurrent requests", min_value=1, max_value=32, value=8)
+
+        stream_output = st.sidebar.checkbox("Stream output as it is generated", value=True)
+
+        settings = {
+            "api_key": os.getenv("AZURE_OPENAI_API_KEY", st.secrets['api_key']),
+            "api_endpoint": os.getenv("ENDPOINT_URL", st.secrets['api_endpoint']),
+            "deployment": os.getenv("DEPLOYMENT_NAME", "gpt-4o"),
+            "lineage": lineage,
+        }
+        manager = get_job_manager()
+
         if st.button("Convert VBA"):
-            with st.spinner("Extracting VBA code..."):
-                vba_code = extract_vba_from_excel(file_bytes, original_filename)
-                csharp_code = convert_vba_to_csharp(vba_code, prompt_=f"{prompt_text} VBA Code:{vba_code}")
-
-                # Display results in two columns
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.subheader("Extracted VBA Code")
-                    st.code(vba_code, language="vb")
-                with col2:
-                    st.subheader("Converted Code")
-                    st.code(csharp_code)
+            # Identical submissions (same file, prompt and mode) share one job
+            key = job_key("conversion", file=content_hash(file_bytes), prompt=prompt_text,
+                          deployment=settings["deployment"], mode=conversion_mode,
+                          lineage=lineage if conversion_mode == "Incremental (changed procedures only)" else None)
+            job = manager.submit(
+                key, run_conversion_job,
+                file_bytes, original_filename, prompt_text, conversion_mode, int(max_concurrency), stream_output, settings,
+                description=original_filename,
+            )
+            st.session_state.conversion_job = job.id
+
+        job = manager.get(st.session_state.get("conversion_job", ""))
+        if job is not None:
+            render_conversion_job(job, original_filename)
+            if not job.finished:
+                # Poll until the job finishes; the job keeps running across reruns
+                time.sleep(0.5)
+                st.rerun()
+
+    stats = get_conversion_cache().stats()
+    st.sidebar.caption(f"Conversion cache: {stats['hits']} hits / {stats['misses']} misses, {stats['entries']} entries")
+    limits = get_rate_limiter(os.getenv("DEPLOYMENT_NAME", "gpt-4o")).stats()
+    st.sidebar.caption(f"Rate limiter: {limits['in_flight']} in flight, concurrency {limits['concurrency']}, {limits['throttled']} throttled")
+    for backend in router_stats():
+        if backend["requests"]:
+            st.sidebar.caption(
+                f"{backend['backend']} ({backend['provider']}): {backend['requests']} requests, {backend['errors']} errors, "
+                f"p50 {backend['p50'] or 0:.2f}s per 1k tokens" + ("" if backend["healthy"] else ", cooling down")
+            )
+    render_debug_panel()
 
 
 
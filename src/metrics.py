@@ -0,0 +1,194 @@
+"""
+Lightweight in-process instrumentation: timed spans and counters for each
+stage of the extraction and conversion pipeline.
+
+Span durations feed a histogram per stage and a ring buffer of recent spans
+(for the debug panel). Everything can be exported as Prometheus text, served
+on METRICS_PORT, or written as one JSON log line per span when
+METRICS_JSON_LOG is set.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Tuple
+
+# Histogram buckets in seconds, from a cached lookup up to a long completion
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+STAGE_METRIC = "vba_stage_seconds"
+_INF = 'le="+Inf"'
+
+logger = logging.getLogger("vba_converter.metrics")
+
+_LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict[str, Any]) -> _LabelKey:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{k}="{v}"'.replace("\n", " ") for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters and duration histograms.
+
+    span() times a block of code; inc() adds to a counter. Only the span
+    stage and explicit counter labels become Prometheus labels; the extra
+    fields given to a span (sheet names, sizes, ...) only go to the recent
+    span buffer and the JSON logs, so label cardinality stays bounded.
+    """
+
+    def __init__(self, recent: int = 500, json_logs: bool = False):
+        self.json_logs = json_logs
+        self.recent: deque = deque(maxlen=recent)
+        self._counters: Dict[_LabelKey, float] = {}
+        self._histograms: Dict[_LabelKey, List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        """Add ``value`` to the counter ``name`` with ``labels``."""
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        """Record one duration in the histogram ``name``."""
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    @contextmanager
+    def span(self, stage: str, **fields) -> Iterator[Dict[str, Any]]:
+        """
+        Time the enclosed block as ``stage``. Yields the span record, so the
+        block can attach fields it only learns while running (e.g. a size).
+        """
+        record: Dict[str, Any] = {"stage": stage, **fields}
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record["error"] = type(e).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            self.observe(STAGE_METRIC, duration, stage=stage)
+            record.update(duration_s=duration, ts=time.time(), thread=threading.current_thread().name)
+            with self._lock:
+                self.recent.append(record)
+            if self.json_logs:
+                logger.info(json.dumps(record, default=str))
+
+    def recent_spans(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self.recent)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters and per-stage totals as plain data, e.g. for a JSON dump."""
+        with self._lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self._counters.items())]
+            histograms = [{"name": name, "labels": dict(labels), "count": h[2], "sum": h[1]}
+                          for (name, labels), h in sorted(self._histograms.items())]
+        return {"counters": counters, "histograms": histograms}
+
+    def render_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, [list(h[0]), h[1], h[2]]) for key, h in self._histograms.items())
+        declared = set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                lines.append(f"# TYPE {name} counter")
+                declared.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for (name, labels), (buckets, total, count) in histograms:
+            if name not in declared:
+                lines.append(f"# TYPE {name} histogram")
+                declared.add(name)
+            for bound, bucket_count in zip(BUCKETS, buckets):
+                le = 'le="%g"' % bound
+                lines.append(f"{name}_bucket{_format_labels(labels, le)} {bucket_count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, _INF)} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:g}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.recent.clear()
+
+
+def serve_metrics(metrics: Metrics, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve ``metrics`` as Prometheus text on http://host:port/metrics from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> Metrics:
+    """
+    Return the process-wide metrics registry. METRICS_JSON_LOG=1 logs every
+    span as JSON to stderr; METRICS_PORT starts the Prometheus endpoint.
+    """
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            json_logs = os.getenv("METRICS_JSON_LOG", "").lower() in ("1", "true", "yes")
+            _metrics = Metrics(recent=int(os.getenv("METRICS_RECENT_SPANS", "500")), json_logs=json_logs)
+            if json_logs and not logger.handlers:
+                handler = logging.StreamHandler(sys.stderr)
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger.addHandler(handler)
+                logger.setLevel(logging.INFO)
+            port = os.getenv("METRICS_PORT")
+            if port:
+                try:
+                    serve_metrics(_metrics, int(port))
+                except OSError as e:
+                    # Another process (e.g. a second Streamlit worker) already serves this port
+                    logger.warning("Metrics endpoint not started on port %s: %s", port, e)
+    return _metrics
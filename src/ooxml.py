@@ -0,0 +1,263 @@
+import io
+import posixpath
+import re
+import struct
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import Dict, IO, Iterator, List, Optional, Tuple, Union
+
+NS = {
+    "main": "http://schemas.openxmlformats.org/spreadsheetml/2006/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+    "xdr": "http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing",
+    "mc": "http://schemas.openxmlformats.org/markup-compatibility/2006",
+    "x14": "http://schemas.microsoft.com/office/spreadsheetml/2009/9/main",
+    "ax": "http://schemas.microsoft.com/office/2006/activeX",
+}
+
+# Relationship types, matched on their last path segment
+REL_WORKSHEET = "worksheet"
+REL_CTRL_PROP = "ctrlProp"
+REL_CONTROL = "control"
+REL_DRAWING = "drawing"
+REL_VML_DRAWING = "vmlDrawing"
+REL_COMMENTS = "comments"
+REL_THREADED_COMMENT = "threadedComment"
+REL_HYPERLINK = "hyperlink"
+REL_VBA_PROJECT = "vbaProject"
+
+CHUNK_SIZE = 1024 * 1024
+
+# BIFF12 (.xlsb) record types
+BRT_BUNDLE_SH = 0x9C
+
+
+def column_letter(index: int) -> str:
+    """Convert a 1-based column index to its letter, e.g. 28 -> 'AB'."""
+    letters = ""
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def cell_address(col: int, row: int) -> str:
+    """Convert 0-based column/row numbers (as stored in anchors) to 'A1' form."""
+    return f"{column_letter(col + 1)}{row + 1}"
+
+
+def iter_biff12_records(data: bytes) -> Iterator[Tuple[int, bytes]]:
+    """
+    Yield (record type, payload) for each record of a BIFF12 part (the .bin
+    parts of an .xlsb). Type and size are variable-length integers of 7 bits
+    per byte, with the high bit flagging a continuation byte.
+    """
+    pos, end = 0, len(data)
+    while pos < end:
+        record_type = data[pos] & 0x7F
+        if data[pos] & 0x80 and pos + 1 < end:
+            pos += 1
+            record_type |= (data[pos] & 0x7F) << 7
+        pos += 1
+        size = shift = 0
+        for _ in range(4):
+            if pos >= end:
+                return
+            size |= (data[pos] & 0x7F) << shift
+            shift += 7
+            pos += 1
+            if not data[pos - 1] & 0x80:
+                break
+        yield record_type, data[pos:pos + size]
+        pos += size
+
+
+def read_wide_string(data: bytes, offset: int) -> Tuple[Optional[str], int]:
+    """Read a BIFF12 XLWideString (a uint32 character count, then UTF-16); 0xFFFFFFFF stands for null."""
+    count = struct.unpack_from("<I", data, offset)[0]
+    offset += 4
+    if count == 0xFFFFFFFF:
+        return None, offset
+    end = offset + 2 * count
+    if end > len(data):
+        raise ValueError("String runs past the end of the record")
+    return data[offset:end].decode("utf-16-le", errors="replace"), end
+
+
+class OOXMLPackage:
+    """
+    Thin reader over the zip container of an .xlsx/.xlsm/.xlsb workbook.
+
+    Parts are only decompressed on demand, and relationship files are parsed
+    once and memoized, so callers can walk the part graph without loading
+    any cell data.
+    """
+
+    def __init__(self, source: Union[bytes, str, IO[bytes]]):
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+        self.zip = zipfile.ZipFile(source)
+        self.names = set(self.zip.namelist())
+        self._rels: Dict[str, Dict[str, Tuple[str, str]]] = {}
+        self._sheets: Optional[List[Tuple[str, str]]] = None
+        # .xlsb packages have the same part graph, but binary workbook and sheet parts
+        self.workbook_part = "xl/workbook.bin" if "xl/workbook.bin" in self.names else "xl/workbook.xml"
+        self.is_binary = self.workbook_part.endswith(".bin")
+
+    def close(self) -> None:
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def read(self, part: str) -> bytes:
+        return self.zip.read(part)
+
+    def open(self, part: str) -> IO[bytes]:
+        return self.zip.open(part)
+
+    def parse(self, part: str) -> ET.Element:
+        return ET.fromstring(self.zip.read(part))
+
+    def rels(self, part: str) -> Dict[str, Tuple[str, str]]:
+        """
+        Return the relationships of ``part`` as {rId: (type, target_part)}.
+        Types are reduced to their last path segment, e.g. 'ctrlProp'. External
+        targets (hyperlinks) keep their raw target.
+        """
+        if part in self._rels:
+            return self._rels[part]
+        rels_part = posixpath.join(posixpath.dirname(part), "_rels", posixpath.basename(part) + ".rels")
+        result = {}
+        if rels_part in self.names:
+            for rel in self.parse(rels_part).findall("rel:Relationship", NS):
+                rel_type = rel.get("Type", "").rsplit("/", 1)[-1]
+                target = rel.get("Target", "")
+                if rel.get("TargetMode") != "External":
+                    target = resolve_target(part, target)
+                result[rel.get("Id")] = (rel_type, target)
+        self._rels[part] = result
+        return result
+
+    def rels_of_type(self, part: str, rel_type: str) -> List[str]:
+        return [target for kind, target in self.rels(part).values() if kind == rel_type]
+
+    def sheets(self) -> List[Tuple[str, str]]:
+        """Return [(sheet name, worksheet part)] in workbook order."""
+        if self._sheets is None:
+            workbook_rels = self.rels(self.workbook_part)
+            sheets = []
+            for name, rel_id in self._sheet_entries():
+                rel = workbook_rels.get(rel_id)
+                # Chart sheets and dialog sheets are listed too; only worksheets carry controls
+                if rel and rel[0] == REL_WORKSHEET:
+                    sheets.append((name, rel[1]))
+            self._sheets = sheets
+        return self._sheets
+
+    def _sheet_entries(self) -> List[Tuple[str, str]]:
+        # (sheet name, relationship id) as listed by the workbook part
+        if not self.is_binary:
+            return [(sheet.get("name"), sheet.get(f"{{{NS['r']}}}id"))
+                    for sheet in self.parse(self.workbook_part).iter(f"{{{NS['main']}}}sheet")]
+        entries = []
+        for record_type, payload in iter_biff12_records(self.read(self.workbook_part)):
+            if record_type == BRT_BUNDLE_SH:
+                # hsState, iTabID, then the relationship id and the sheet name
+                rel_id, offset = read_wide_string(payload, 8)
+                name, _ = read_wide_string(payload, offset)
+                entries.append((name, rel_id))
+        return entries
+
+    def find_section(self, part: str, tag: str) -> Optional[ET.Element]:
+        """
+        Stream ``part`` and return the first ``<tag>...</tag>`` section parsed
+        as namespace-free XML, or None.
+
+        Only the raw bytes are scanned for the section; everything around it
+        (e.g. sheetData) is decompressed in chunks but never parsed, so memory
+        stays flat regardless of the part's size.
+        """
+        for _, element in self.iter_sections(part, [tag]):
+            return element
+        return None
+
+    def iter_sections(self, part: str, tags: List[str]) -> Iterator[Tuple[str, ET.Element]]:
+        """
+        Yield (tag, element) for each ``<tag>`` section of ``part`` named in
+        ``tags``, in document order. Sections must not nest inside each other.
+        """
+        alternation = "|".join(re.escape(t) for t in tags).encode()
+        start_re = re.compile(rb"<(?:[\w.-]+:)?(" + alternation + rb")(?=[\s/>])")
+        names = [t.encode() for t in tags]
+        buffer = b""
+        with self.open(part) as stream:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                buffer += chunk
+                pos = 0
+                while True:
+                    start = _find_start_tag(buffer, pos, names, start_re)
+                    if start is None:
+                        # Keep a short tail in case a start tag straddles two chunks
+                        buffer = buffer[max(pos, len(buffer) - 256):]
+                        break
+                    tag = start.group(1).decode()
+                    tag_end = buffer.find(b">", start.end())
+                    if tag_end == -1:
+                        buffer = buffer[start.start():]
+                        break
+                    if buffer[tag_end - 1:tag_end] == b"/":
+                        end = tag_end + 1
+                    else:
+                        end_match = re.compile(rb"</(?:[\w.-]+:)?" + re.escape(tag.encode()) + rb"\s*>").search(buffer, tag_end)
+                        if end_match is None:
+                            # The section continues in the next chunk
+                            buffer = buffer[start.start():]
+                            break
+                        end = end_match.end()
+                    yield tag, parse_fragment(buffer[start.start():end])
+                    pos = end
+                if not chunk:
+                    return
+
+
+def _find_start_tag(buffer: bytes, pos: int, names: List[bytes], start_re: "re.Pattern") -> Optional["re.Match"]:
+    # Equivalent to start_re.search(buffer, pos), but the tag names are located with bytes.find
+    # first: a regex starting at every "<" of a sheet costs several times the decompression
+    while True:
+        hits = [i for i in (buffer.find(name, pos) for name in names) if i != -1]
+        if not hits:
+            return None
+        hit = min(hits)
+        bracket = buffer.rfind(b"<", max(pos, hit - 64), hit)
+        if bracket != -1:
+            match = start_re.match(buffer, bracket)
+            if match is not None and match.start(1) == hit:
+                return match
+        pos = hit + 1
+
+
+def parse_fragment(fragment: bytes) -> ET.Element:
+    """
+    Parse an XML fragment cut out of a larger part, dropping namespaces.
+
+    Prefixes such as ``mc:`` or ``xdr:`` are often declared on ancestors that
+    are not part of the fragment, so they are removed rather than resolved.
+    Attributes keep their local names (``r:id`` becomes ``id``).
+    """
+    fragment = re.sub(rb"\sxmlns(?::[\w.-]+)?=\"[^\"]*\"", b"", fragment)
+    fragment = re.sub(rb"<(/?)[\w.-]+:", rb"<\1", fragment)
+    fragment = re.sub(rb"(\s)[\w.-]+:([\w.-]+\s*=)", rb"\1\2", fragment)
+    return ET.fromstring(fragment)
+
+
+def resolve_target(source_part: str, target: str) -> str:
+    """Resolve a relationship target relative to the part that declares it."""
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source_part), target))
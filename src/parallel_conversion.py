@@ -0,0 +1,170 @@
+import asyncio
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+from src.cache import conversion_key, get_conversion_cache
+from src.llm_client import get_async_client, run_async
+from src.metrics import get_metrics
+from src.providers import get_router
+from src.rate_limit import estimate_message_tokens, estimate_tokens
+from src.vba_compact import compact_passes, compact_vba
+from src.vba_index import VBAIndex
+
+if TYPE_CHECKING:
+    from openai import AsyncAzureOpenAI
+
+SYSTEM_PROMPT = "You are a highly skilled C# developer with expertise in VBA conversion."
+
+DEFAULT_PROMPT = (
+    "You are an expert in converting VBA (Visual Basic for Applications) macros to C#.\n"
+    "Convert the following VBA code into C# with appropriate syntax and best practices:\n"
+)
+
+
+def group_modules(modules: List[Dict[str, Any]], max_tokens: int = 6000) -> List[List[Dict[str, Any]]]:
+    """
+    Split modules into consecutive groups whose combined code stays under
+    ``max_tokens``. A module larger than the budget gets a group of its own.
+    Module order is preserved both within and across groups.
+    """
+    groups = []
+    current = []
+    current_tokens = 0
+    for module in modules:
+        tokens = estimate_tokens(module["code"])
+        if current and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current = []
+            current_tokens = 0
+        current.append(module)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _group_code(group: List[Dict[str, Any]]) -> str:
+    return "\n\n".join(f"' Module {m['vba_filename']}\n{m['code']}" for m in group)
+
+
+async def _convert_group(client, semaphore, group, prompt_text, deployment, temperature, api_version, cache):
+    # Keyed on the extracted code and the compaction passes, so a hit skips compaction altogether
+    passes = compact_passes()
+    key = conversion_key(f"{prompt_text}\ncompact: {','.join(passes)}", _group_code(group), deployment, temperature,
+                         api_version)
+    if cache is not None:
+        cached = cache.get(key)
+        get_metrics().inc("vba_conversion_cache_total", result="miss" if cached is None else "hit")
+        if cached is not None:
+            return cached
+
+    # Attribute headers, blank lines and empty event stubs are billed but change nothing in the C#
+    group = [dict(m, code=compact_vba(m["code"], passes)["code"]) for m in group]
+    if not any(m["code"] for m in group):
+        return ""
+    vba_code = _group_code(group)
+    prompt_ = f"{prompt_text} VBA Code:{vba_code}"
+
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt_}
+    ]
+    # The completion is roughly as long as the code it converts
+    estimated_tokens = estimate_message_tokens(messages) + estimate_tokens(vba_code)
+    # The caller's client is the default backend; VBA_PROVIDERS replaces it with the configured set
+    router = get_router(deployment=deployment, api_version=api_version, client=client)
+    async with semaphore:
+        try:
+            csharp_code = await router.acomplete(messages, temperature, estimated_tokens)
+        except Exception as e:
+            return f"// Error converting {', '.join(m['vba_filename'] for m in group)}: {e}"
+
+    if cache is not None and csharp_code:
+        cache.set(key, csharp_code)
+    return csharp_code
+
+
+async def convert_modules_async(
+    modules: List[Dict[str, Any]],
+    prompt_text: str,
+    client: "AsyncAzureOpenAI",
+    deployment: str,
+    temperature: float = 0.1,
+    api_version: str = "2024-05-01-preview",
+    max_concurrency: int = 8,
+    max_group_tokens: int = 6000,
+    use_cache: bool = True,
+    semaphore: Optional[asyncio.Semaphore] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    with_context: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    Convert each token-bounded group of modules as its own request, running at
+    most ``max_concurrency`` requests at once. Pass a shared ``semaphore`` to
+    bound requests across several workbooks instead. ``on_progress`` is called
+    with (groups done, total groups) as each group finishes.
+
+    When the modules are split over several groups and ``with_context`` is
+    set, each request also carries the signatures of the types, globals and
+    procedures its group uses from the other groups (see src.vba_index).
+
+    Returns one dict per group, in the original module order, with the keys
+    'modules' (list of vba_filename) and 'csharp'.
+    """
+    cache = get_conversion_cache() if use_cache else None
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max_concurrency)
+    groups = group_modules(modules, max_group_tokens)
+    index = VBAIndex(modules) if with_context and len(groups) > 1 else None
+    done = 0
+
+    async def convert(group):
+        nonlocal done
+        group_prompt = prompt_text
+        if index is not None:
+            context = index.context_for_modules(m["vba_filename"] for m in group)
+            if context:
+                group_prompt = f"{prompt_text}\n{context}"
+        csharp = await _convert_group(client, semaphore, group, group_prompt, deployment, temperature, api_version, cache)
+        done += 1
+        if on_progress is not None:
+            on_progress(done, len(groups))
+        return csharp
+
+    results = await asyncio.gather(*[convert(group) for group in groups])
+    return [
+        {"modules": [m["vba_filename"] for m in group], "csharp": csharp}
+        for group, csharp in zip(groups, results)
+    ]
+
+
+def join_converted_groups(results: List[Dict[str, Any]]) -> str:
+    """Reassemble per-group C# output into one listing, in module order."""
+    return "\n\n".join(f"// Converted from {', '.join(r['modules'])}\n{r['csharp']}" for r in results)
+
+
+def convert_modules_parallel(
+    modules: List[Dict[str, Any]],
+    prompt_text: str,
+    api_key: str,
+    api_endpoint: str,
+    deployment: str,
+    temperature: float = 0.1,
+    api_version: str = "2024-05-01-preview",
+    max_concurrency: int = 8,
+    max_group_tokens: int = 6000,
+    client: Optional["AsyncAzureOpenAI"] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Synchronous entry point for the fan-out conversion, usable from a Streamlit script.
+
+    Requests run on the shared event loop with the pooled async client unless
+    a ``client`` is passed in.
+    """
+    async_client = client or get_async_client(api_key, api_endpoint, api_version)
+    return run_async(convert_modules_async(
+        modules, prompt_text, async_client, deployment,
+        temperature=temperature, api_version=api_version,
+        max_concurrency=max_concurrency, max_group_tokens=max_group_tokens,
+        on_progress=on_progress,
+    ))
@@ -0,0 +1,414 @@
+"""
+Conversion backends and the router that picks between them.
+
+A backend is one model behind one API: an Azure OpenAI deployment, an OpenAI
+model or an Anthropic model. The router keeps the recent latency of every
+backend (seconds per thousand estimated request tokens, so large and small
+requests compare), sends each request to the fastest healthy one and fails
+over to the next one on an error. A backend that fails three times in a row
+is skipped for VBA_ROUTER_COOLDOWN_SECONDS (default 30).
+
+With VBA_HEDGE=1 a non-streamed request that is still running when it passes
+the p95 latency of its backend gets a duplicate on the next best backend (or
+the same one when there is no other). The first answer wins and the other
+request is cancelled. Streamed requests are routed but never hedged.
+
+Backends come from VBA_PROVIDERS, either "provider:model" pairs or a JSON
+list for full control:
+
+    VBA_PROVIDERS=azure:gpt-4o,azure:gpt-4o-mini,anthropic:claude-sonnet-4-5
+    VBA_PROVIDERS='[{"name": "eu", "provider": "azure", "model": "gpt-4o",
+                     "endpoint": "https://eu.openai.azure.com", "api_key_env": "AZURE_EU_KEY"}]'
+
+Without it, every request goes to the single Azure deployment passed by the
+caller, as before. Keys default to AZURE_OPENAI_API_KEY (with ENDPOINT_URL),
+OPENAI_API_KEY and ANTHROPIC_API_KEY.
+"""
+import asyncio
+import collections
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from src.llm_client import DEFAULT_API_VERSION, get_async_client, get_client, get_provider_client, run_async
+from src.metrics import get_metrics
+from src.rate_limit import (async_call_with_retry, call_with_retry, estimate_message_tokens, get_rate_limiter,
+                            record_token_usage)
+
+PROVIDERS = ("azure", "openai", "anthropic")
+DEFAULT_KEY_ENV = {"azure": "AZURE_OPENAI_API_KEY", "openai": "OPENAI_API_KEY", "anthropic": "ANTHROPIC_API_KEY"}
+DEFAULT_ENDPOINT_ENV = {"azure": "ENDPOINT_URL", "openai": "OPENAI_BASE_URL", "anthropic": "ANTHROPIC_BASE_URL"}
+
+FAILURES_BEFORE_COOLDOWN = 3
+# Samples a backend needs before its p95 is trusted as a hedging deadline
+MIN_HEDGE_SAMPLES = 10
+LATENCY_WINDOW = 200
+
+
+class Backend:
+    """
+    One model behind one API. complete() and acomplete() send a chat request
+    through the backend's rate limiter and return the completion text.
+    """
+
+    def __init__(self, name: str, provider: str, model: str, api_key: Optional[str] = None,
+                 endpoint: Optional[str] = None, api_version: str = DEFAULT_API_VERSION, max_tokens: int = 8192,
+                 client: Any = None):
+        if provider not in PROVIDERS:
+            raise ValueError(f"Unknown provider: {provider!r} (expected one of {', '.join(PROVIDERS)})")
+        self.name = name
+        self.provider = provider
+        self.model = model
+        self.api_key = api_key
+        self.endpoint = endpoint
+        self.api_version = api_version
+        self.max_tokens = max_tokens
+        # An async client owned by the caller (e.g. the batch CLI's), used instead of the pooled one
+        self.client = client
+
+    def _sync_client(self):
+        if self.provider == "azure":
+            return get_client(self.api_key, self.endpoint, self.api_version)
+        return get_provider_client(self.provider, self.api_key, self.endpoint)
+
+    def _async_client(self):
+        if self.client is not None:
+            return self.client
+        if self.provider == "azure":
+            return get_async_client(self.api_key, self.endpoint, self.api_version)
+        return get_provider_client(self.provider, self.api_key, self.endpoint, async_=True)
+
+    def _request(self, client, messages: List[Dict[str, str]], temperature: float, stream: bool) -> Callable:
+        if self.provider == "anthropic":
+            # Anthropic takes the system prompt apart from the conversation
+            system = "\n".join(m["content"] for m in messages if m["role"] == "system")
+            return lambda: client.messages.create(
+                model=self.model, max_tokens=self.max_tokens, system=system, temperature=temperature,
+                messages=[m for m in messages if m["role"] != "system"], stream=stream,
+            )
+        extra = {"stream": True} if stream else {}
+        return lambda: client.chat.completions.create(model=self.model, messages=messages, temperature=temperature,
+                                                      **extra)
+
+    def _text(self, response) -> str:
+        if self.provider == "anthropic":
+            return "".join(block.text for block in response.content if getattr(block, "type", "") == "text")
+        return response.choices[0].message.content
+
+    def _delta(self, chunk) -> Optional[str]:
+        if self.provider == "anthropic":
+            delta = getattr(chunk, "delta", None) if getattr(chunk, "type", "") == "content_block_delta" else None
+            return getattr(delta, "text", None)
+        # Azure sends a leading chunk with prompt filter results and no choices
+        return chunk.choices[0].delta.content if chunk.choices else None
+
+    def complete(self, messages: List[Dict[str, str]], temperature: float, estimated_tokens: int,
+                 stream: bool = False, on_text: Optional[Callable[[str], None]] = None) -> str:
+        """Blocking request; with ``stream`` the accumulated text is passed to ``on_text`` as it grows."""
+        limiter = get_rate_limiter(self.name)
+        request = self._request(self._sync_client(), messages, temperature, stream)
+        if not stream:
+            return self._text(call_with_retry(request, limiter, estimated_tokens))
+
+        def read(response) -> str:
+            text = ""
+            for chunk in response:
+                delta = self._delta(chunk)
+                if not delta:
+                    continue
+                text += delta
+                if on_text is not None:
+                    on_text(text)
+            return text
+
+        # The stream is read under the limiter, so its slot is held until the last chunk
+        text = call_with_retry(request, limiter, estimated_tokens, consume=read)
+        # Streamed responses carry no usage block, so the counts are estimates
+        record_token_usage(self.name, estimate_message_tokens(messages), len(text) // 4, "estimate")
+        return text
+
+    async def acomplete(self, messages: List[Dict[str, str]], temperature: float, estimated_tokens: int) -> str:
+        limiter = get_rate_limiter(self.name)
+        request = self._request(self._async_client(), messages, temperature, False)
+        response = await async_call_with_retry(request, limiter, estimated_tokens)
+        return self._text(response)
+
+
+class LatencyTracker:
+    """
+    Recent latencies of one backend, normalized to seconds per thousand
+    estimated tokens, plus its failure streak for the health check.
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW, cooldown: float = 30.0):
+        self.samples: collections.deque = collections.deque(maxlen=window)
+        self.cooldown = cooldown
+        self.failures = 0
+        self.down_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.cancelled = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, estimated_tokens: int) -> None:
+        with self._lock:
+            self.samples.append(seconds * 1000 / max(estimated_tokens, 1))
+            self.requests += 1
+            self.failures = 0
+
+    def record_cancelled(self) -> None:
+        # A cancelled request says nothing about how long it would have taken, nor about health
+        with self._lock:
+            self.requests += 1
+            self.cancelled += 1
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.requests += 1
+            self.errors += 1
+            self.failures += 1
+            if self.failures >= FAILURES_BEFORE_COOLDOWN:
+                self.down_until = time.monotonic() + self.cooldown
+
+    def healthy(self) -> bool:
+        with self._lock:
+            return time.monotonic() >= self.down_until
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            ordered = sorted(self.samples)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self.samples)
+
+
+class ProviderRouter:
+    """
+    Routes requests over ``backends`` by recent latency and health, with
+    optional hedging (see the module docstring). ``explore`` is the share of
+    requests sent to a random healthy backend, so a backend that was slow
+    once is measured again.
+    """
+
+    def __init__(self, backends: Iterable[Backend], hedge: bool = False, hedge_min_seconds: float = 2.0,
+                 explore: float = 0.05, cooldown: float = 30.0):
+        self.backends = list(backends)
+        if not self.backends:
+            raise ValueError("A router needs at least one backend")
+        self.hedge = hedge
+        self.hedge_min_seconds = hedge_min_seconds
+        self.explore = explore
+        self.trackers = {b.name: LatencyTracker(cooldown=cooldown) for b in self.backends}
+
+    def ranked(self, exclude: Iterable[str] = ()) -> List[Backend]:
+        """Healthy backends, fastest median first; backends without samples come first so they get measured."""
+        excluded = set(exclude)
+        candidates = [b for b in self.backends if b.name not in excluded and self.trackers[b.name].healthy()]
+        if not candidates:
+            # Everything is cooling down: try the one that comes back first rather than failing outright
+            candidates = sorted((b for b in self.backends if b.name not in excluded),
+                                key=lambda b: self.trackers[b.name].down_until)[:1]
+
+        def median(backend):
+            value = self.trackers[backend.name].percentile(0.5)
+            return -1.0 if value is None else value
+
+        return sorted(candidates, key=median)
+
+    def choose(self, exclude: Iterable[str] = ()) -> Optional[Backend]:
+        ranked = self.ranked(exclude)
+        if len(ranked) > 1 and random.random() < self.explore:
+            return random.choice(ranked[1:])
+        return ranked[0] if ranked else None
+
+    def hedge_delay(self, backend: Backend, estimated_tokens: int) -> Optional[float]:
+        """Seconds after which a request to ``backend`` gets a duplicate, or None when not hedging."""
+        tracker = self.trackers[backend.name]
+        if not self.hedge or tracker.count() < MIN_HEDGE_SAMPLES:
+            return None
+        return max(self.hedge_min_seconds, tracker.percentile(0.95) * max(estimated_tokens, 1) / 1000)
+
+    def _finish(self, backend: Backend, start: float, estimated_tokens: int, error: Optional[BaseException]) -> None:
+        elapsed = time.perf_counter() - start
+        if error is None:
+            self.trackers[backend.name].record(elapsed, estimated_tokens)
+            get_metrics().observe("vba_llm_backend_seconds", elapsed, backend=backend.name)
+        elif isinstance(error, asyncio.CancelledError):
+            # Hedge losers and stalled primaries cut short: only a lower bound, kept out of the
+            # samples hedge_delay() reads so hedging cannot feed on its own cancellations
+            self.trackers[backend.name].record_cancelled()
+            get_metrics().observe("vba_llm_backend_cancelled_seconds", elapsed, backend=backend.name)
+        else:
+            self.trackers[backend.name].record_failure()
+        result = "ok" if error is None else "cancelled" if isinstance(error, asyncio.CancelledError) else "error"
+        get_metrics().inc("vba_llm_backend_requests_total", backend=backend.name, result=result)
+
+    def complete(self, messages: List[Dict[str, str]], temperature: float, estimated_tokens: int,
+                 stream: bool = False, on_text: Optional[Callable[[str], None]] = None) -> str:
+        """
+        Blocking request on the best backend, failing over once to the next
+        one. Non-streamed requests are hedged when hedging is on.
+        """
+        if self.hedge and not stream:
+            return run_async(self.acomplete(messages, temperature, estimated_tokens))
+        tried = []
+        while True:
+            backend = self.choose(exclude=tried)
+            start = time.perf_counter()
+            try:
+                with get_metrics().span("llm_request", deployment=backend.model, backend=backend.name, stream=stream):
+                    text = backend.complete(messages, temperature, estimated_tokens, stream, on_text)
+            except Exception as e:
+                self._finish(backend, start, estimated_tokens, e)
+                tried.append(backend.name)
+                # One failover; a failed stream starts over on the next backend
+                if len(tried) > 1 or not self.ranked(exclude=tried):
+                    raise
+                continue
+            self._finish(backend, start, estimated_tokens, None)
+            return text
+
+    async def _attempt(self, backend: Backend, messages, temperature, estimated_tokens) -> str:
+        start = time.perf_counter()
+        try:
+            with get_metrics().span("llm_request", deployment=backend.model, backend=backend.name):
+                text = await backend.acomplete(messages, temperature, estimated_tokens)
+        except BaseException as e:
+            self._finish(backend, start, estimated_tokens, e)
+            raise
+        self._finish(backend, start, estimated_tokens, None)
+        return text
+
+    async def acomplete(self, messages: List[Dict[str, str]], temperature: float, estimated_tokens: int) -> str:
+        """
+        Send the request to the best backend. If it is still running after
+        hedge_delay(), send a duplicate to the next best one and return
+        whichever answers first, cancelling the other.
+        """
+        primary = self.choose()
+        tasks = {asyncio.ensure_future(self._attempt(primary, messages, temperature, estimated_tokens)): primary}
+        try:
+            delay = self.hedge_delay(primary, estimated_tokens)
+            done, _ = await asyncio.wait(set(tasks), timeout=delay)
+            if not done:
+                secondary = self.choose(exclude=[primary.name]) or primary
+                get_metrics().inc("vba_llm_hedges_total", backend=secondary.name)
+                tasks[asyncio.ensure_future(self._attempt(secondary, messages, temperature, estimated_tokens))] = \
+                    secondary
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if len(tasks) > 1:
+                            get_metrics().inc("vba_llm_hedge_wins_total", backend=tasks[task].name,
+                                              role="primary" if tasks[task] is primary else "hedge")
+                        return task.result()
+                    error = task.exception()
+            if len(tasks) == 1 and self.ranked(exclude=[primary.name]):
+                # Fail over once, as complete() does
+                return await self._attempt(self.choose(exclude=[primary.name]), messages, temperature,
+                                           estimated_tokens)
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per backend: healthy, requests, errors, cancelled, p50 and p95 in seconds per thousand tokens."""
+        return [
+            {
+                "backend": b.name, "provider": b.provider, "model": b.model,
+                "healthy": self.trackers[b.name].healthy(), "requests": self.trackers[b.name].requests,
+                "errors": self.trackers[b.name].errors, "cancelled": self.trackers[b.name].cancelled,
+                "p50": self.trackers[b.name].percentile(0.5), "p95": self.trackers[b.name].percentile(0.95),
+            }
+            for b in self.backends
+        ]
+
+
+def parse_providers(value: str, api_version: str = DEFAULT_API_VERSION) -> List[Backend]:
+    """Build the backends described by a VBA_PROVIDERS value."""
+    if value.lstrip().startswith("["):
+        specs = json.loads(value)
+    else:
+        specs = []
+        for item in value.split(","):
+            provider, _, model = item.strip().partition(":")
+            specs.append({"provider": provider.strip().lower(), "model": model.strip()})
+    backends = []
+    for spec in specs:
+        provider = spec["provider"]
+        model = spec.get("model") or spec.get("deployment")
+        if provider not in PROVIDERS or not model:
+            raise ValueError(f"Invalid VBA_PROVIDERS entry: {spec!r}")
+        backends.append(Backend(
+            name=spec.get("name") or model,
+            provider=provider,
+            model=model,
+            api_key=os.getenv(spec.get("api_key_env") or DEFAULT_KEY_ENV[provider]),
+            endpoint=spec.get("endpoint") or os.getenv(DEFAULT_ENDPOINT_ENV[provider]),
+            api_version=spec.get("api_version") or api_version,
+            max_tokens=int(spec.get("max_tokens", 8192)),
+        ))
+    names = [b.name for b in backends]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate backend names in VBA_PROVIDERS: {', '.join(names)}")
+    return backends
+
+
+def _router_options() -> Dict[str, Any]:
+    return {
+        "hedge": os.getenv("VBA_HEDGE", "0").lower() in ("1", "true", "yes"),
+        "hedge_min_seconds": float(os.getenv("VBA_HEDGE_MIN_SECONDS", "2")),
+        "explore": float(os.getenv("VBA_ROUTER_EXPLORE", "0.05")),
+        "cooldown": float(os.getenv("VBA_ROUTER_COOLDOWN_SECONDS", "30")),
+    }
+
+
+_routers: Dict[tuple, ProviderRouter] = {}
+_lock = threading.Lock()
+
+
+def get_router(api_key: Optional[str] = None, api_endpoint: Optional[str] = None, deployment: Optional[str] = None,
+               api_version: str = DEFAULT_API_VERSION, client: Any = None) -> ProviderRouter:
+    """
+    Return the process-wide router: the VBA_PROVIDERS backends when that is
+    set, otherwise a single-backend router for the given Azure deployment
+    (through ``client`` when the caller owns one).
+    """
+    configured = os.getenv("VBA_PROVIDERS")
+    if configured:
+        key = ("providers", configured, api_version)
+    elif client is not None:
+        key = ("client", id(client), deployment)
+    else:
+        key = ("azure", api_endpoint, hashlib.sha256((api_key or "").encode("utf-8")).hexdigest(), deployment,
+               api_version)
+    with _lock:
+        router = _routers.get(key)
+        if router is None:
+            if configured:
+                backends = parse_providers(configured, api_version)
+            else:
+                backends = [Backend(deployment, "azure", deployment, api_key, api_endpoint, api_version,
+                                    client=client)]
+            router = _routers[key] = ProviderRouter(backends, **_router_options())
+    return router
+
+
+def router_stats() -> List[Dict[str, Any]]:
+    """stats() of every router built in this process."""
+    with _lock:
+        routers = list(_routers.values())
+    return [row for router in routers for row in router.stats()]
@@ -0,0 +1,286 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.metrics import get_metrics
+
+MAX_RETRIES = int(os.getenv("AZURE_OPENAI_MAX_RETRIES", "6"))
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+
+
+def retryable_errors() -> tuple:
+    """
+    Errors worth retrying: throttling, timeouts, dropped connections and 5xx
+    responses. openai is imported on first use so importing this module
+    (e.g. for the sidebar stats) stays cheap.
+    """
+    import openai
+
+    errors = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+    try:
+        import anthropic
+    except ImportError:
+        return errors
+    return errors + (anthropic.RateLimitError, anthropic.APITimeoutError, anthropic.APIConnectionError,
+                     anthropic.InternalServerError)
+
+
+def _is_throttled(error: Exception) -> bool:
+    import openai
+
+    if isinstance(error, openai.RateLimitError):
+        return True
+    try:
+        import anthropic
+    except ImportError:
+        return False
+    return isinstance(error, anthropic.RateLimitError)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (about four characters per token for code)."""
+    return len(text) // 4 + 1
+
+
+def estimate_message_tokens(messages: List[Dict[str, str]]) -> int:
+    """Rough prompt size: about four characters per token plus a few per message."""
+    return sum(len(m.get("content") or "") // 4 + 4 for m in messages) + 3
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that refills ``per_minute`` units per minute.
+
+    reserve() never blocks: it takes the units immediately (letting the
+    balance go negative) and returns how long the caller must wait before
+    sending, so reservations are served in arrival order.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # A single request larger than the whole quota still gets through, one per window
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+    def refund(self, amount: float) -> None:
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """
+    Client-side limiter for one deployment's RPM/TPM quota, shared by every
+    session in the process.
+
+    Concurrency adapts AIMD-style: each throttled response halves the number
+    of requests allowed in flight, and successful responses grow it back by
+    one per window of successes, up to ``max_concurrency``. Other failures
+    and cancellations leave it unchanged.
+    """
+
+    def __init__(self, rpm: float, tpm: float, max_concurrency: int = 32, name: str = ""):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(max_concurrency)
+        self.in_flight = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        """Take an in-flight slot if the current concurrency limit allows it."""
+        with self._lock:
+            if self.in_flight < max(1, int(self.concurrency)):
+                self.in_flight += 1
+                return True
+            return False
+
+    def release(self, throttled: bool, succeeded: bool = False) -> None:
+        """Return an in-flight slot and adapt the concurrency limit to how the request ended."""
+        with self._lock:
+            self.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                self.concurrency = max(1.0, self.concurrency / 2)
+            elif succeeded:
+                self.concurrency = min(float(self.max_concurrency), self.concurrency + 1.0 / self.concurrency)
+
+    def reserve(self, tokens: int) -> float:
+        """Reserve one request and ``tokens`` tokens; returns the seconds to wait before sending."""
+        return max(self.requests.reserve(1), self.tokens.reserve(tokens))
+
+    def refund(self, tokens: int) -> None:
+        """Give back a reservation whose request failed or was cancelled."""
+        self.tokens.refund(tokens)
+
+    def record_usage(self, reserved: int, used: Optional[int]) -> None:
+        """Give back the part of a reservation the response did not use."""
+        if used is not None and used < reserved:
+            self.tokens.refund(reserved - used)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"concurrency": int(self.concurrency), "in_flight": self.in_flight, "throttled": self.throttled}
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(header)
+        if value:
+            try:
+                return float(value) * scale
+            except ValueError:
+                continue
+    return None
+
+
+def backoff_delay(attempt: int, error: Exception) -> float:
+    """Honor Retry-After when the service sends it, else full-jitter exponential backoff."""
+    retry_after = _retry_after(error)
+    if retry_after is not None:
+        return retry_after + random.uniform(0, 1)
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def _usage_counts(usage) -> Tuple[Optional[int], Optional[int]]:
+    # OpenAI reports prompt/completion tokens, Anthropic input/output tokens
+    prompt = getattr(usage, "prompt_tokens", None)
+    completion = getattr(usage, "completion_tokens", None)
+    if prompt is None:
+        prompt, completion = getattr(usage, "input_tokens", None), getattr(usage, "output_tokens", None)
+    return prompt, completion
+
+
+def _usage_tokens(response) -> Optional[int]:
+    usage = getattr(response, "usage", None)
+    total = getattr(usage, "total_tokens", None)
+    if total is None and usage is not None:
+        prompt, completion = _usage_counts(usage)
+        if prompt is not None and completion is not None:
+            total = prompt + completion
+    return total
+
+
+def record_token_usage(deployment: str, prompt_tokens: int, completion_tokens: int, source: str = "usage") -> None:
+    """Count tokens in the metrics registry; ``source`` is "usage" or "estimate" (streams report no usage)."""
+    metrics = get_metrics()
+    metrics.inc("vba_llm_tokens_total", prompt_tokens, deployment=deployment, kind="prompt", source=source)
+    metrics.inc("vba_llm_tokens_total", completion_tokens, deployment=deployment, kind="completion", source=source)
+
+
+def _on_response(limiter: RateLimiter, estimated_tokens: int, response) -> None:
+    limiter.record_usage(estimated_tokens, _usage_tokens(response))
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        prompt, completion = _usage_counts(usage)
+        if prompt is not None:
+            record_token_usage(limiter.name, prompt, completion or 0)
+
+
+def _on_retryable_error(limiter: RateLimiter, error: Exception) -> None:
+    get_metrics().inc("vba_llm_retries_total", deployment=limiter.name, error=type(error).__name__)
+
+
+def call_with_retry(fn: Callable[[], Any], limiter: RateLimiter, estimated_tokens: int, max_retries: int = MAX_RETRIES,
+                    consume: Optional[Callable[[Any], Any]] = None):
+    """
+    Call ``fn`` (one API request) under ``limiter``, retrying throttled and
+    transient failures. The last error is re-raised once retries run out.
+
+    A streamed response is only finished once it has been read: pass
+    ``consume`` to read it while the in-flight slot is still held, and its
+    return value is returned instead. The token reservation of an attempt
+    that fails is given back.
+    """
+    for attempt in range(max_retries + 1):
+        while not limiter.try_acquire():
+            time.sleep(0.05)
+        throttled = succeeded = False
+        try:
+            time.sleep(limiter.reserve(estimated_tokens))
+            response = fn()
+            if consume is not None:
+                response = consume(response)
+            _on_response(limiter, estimated_tokens, response)
+            succeeded = True
+            return response
+        except retryable_errors() as e:
+            throttled = _is_throttled(e)
+            _on_retryable_error(limiter, e)
+            if attempt == max_retries:
+                raise
+            delay = backoff_delay(attempt, e)
+        finally:
+            if not succeeded:
+                limiter.refund(estimated_tokens)
+            limiter.release(throttled, succeeded)
+        time.sleep(delay)
+
+
+async def async_call_with_retry(fn: Callable[[], Awaitable[Any]], limiter: RateLimiter, estimated_tokens: int,
+                                max_retries: int = MAX_RETRIES,
+                                consume: Optional[Callable[[Any], Awaitable[Any]]] = None):
+    """Async counterpart of call_with_retry."""
+    for attempt in range(max_retries + 1):
+        while not limiter.try_acquire():
+            await asyncio.sleep(0.05)
+        throttled = succeeded = False
+        try:
+            await asyncio.sleep(limiter.reserve(estimated_tokens))
+            response = await fn()
+            if consume is not None:
+                response = await consume(response)
+            _on_response(limiter, estimated_tokens, response)
+            succeeded = True
+            return response
+        except retryable_errors() as e:
+            throttled = _is_throttled(e)
+            _on_retryable_error(limiter, e)
+            if attempt == max_retries:
+                raise
+            delay = backoff_delay(attempt, e)
+        finally:
+            if not succeeded:
+                # Cancelled hedges give their reservation back too
+                limiter.refund(estimated_tokens)
+            limiter.release(throttled, succeeded)
+        await asyncio.sleep(delay)
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(deployment: str) -> RateLimiter:
+    """
+    Return the process-wide limiter for ``deployment``. Quotas come from
+    AZURE_OPENAI_RPM and AZURE_OPENAI_TPM (per deployment overrides use the
+    deployment name as suffix, e.g. AZURE_OPENAI_TPM_GPT_4O).
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(deployment)
+        if limiter is None:
+            suffix = deployment.upper().replace("-", "_").replace(".", "_")
+            rpm = float(os.getenv(f"AZURE_OPENAI_RPM_{suffix}", os.getenv("AZURE_OPENAI_RPM", "300")))
+            tpm = float(os.getenv(f"AZURE_OPENAI_TPM_{suffix}", os.getenv("AZURE_OPENAI_TPM", "50000")))
+            limiter = RateLimiter(rpm, tpm, max_concurrency=int(os.getenv("AZURE_OPENAI_MAX_CONCURRENCY", "32")),
+                                  name=deployment)
+            _limiters[deployment] = limiter
+    return limiter
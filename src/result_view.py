@@ -0,0 +1,116 @@
+"""
+Per-module view of a conversion result, so the page can show one module and
+one page of code at a time instead of the whole listing on every rerun, and
+a zip of per-module .vb/.cs files for download.
+
+Page length: VBA_PAGE_LINES (default 400).
+"""
+import io
+import os
+import re
+import zipfile
+from typing import IO, Any, Dict, List, Optional, Tuple
+
+from src.metrics import get_metrics
+
+PAGE_LINES = int(os.getenv("VBA_PAGE_LINES", "400"))
+
+# join_converted_groups and assemble_modules start every section with this header
+_SECTION_RE = re.compile(r"^// Converted from (.+)$", re.MULTILINE)
+
+
+def split_converted(csharp_code: str) -> Optional[List[Tuple[List[str], str]]]:
+    """
+    Split per-module or per-group C# output into (module names, code)
+    sections on its "// Converted from" headers. Returns None for output
+    without them (a single request), which only exists as a whole.
+    """
+    if not csharp_code.startswith("// Converted from "):
+        return None
+    starts = list(_SECTION_RE.finditer(csharp_code))
+    sections = []
+    for match, end in zip(starts, [m.start() for m in starts[1:]] + [len(csharp_code)]):
+        sections.append(([name.strip() for name in match.group(1).split(",")],
+                         csharp_code[match.start():end].rstrip("\n") + "\n"))
+    return sections
+
+
+def module_results(modules: List[Dict[str, Any]], csharp_code: str) -> List[Dict[str, Any]]:
+    """
+    One entry per extracted module (scan_workbook modules, in listing order):
+    {'name', 'vba', 'lines', 'first_line', 'csharp', 'group'}. 'first_line' is the
+    line of the module's code in the joined VBA listing; 'csharp' is the C#
+    section the module was converted in, or None when the conversion is only
+    available as a whole, and 'group' names every module in that section.
+    """
+    sections = {}
+    for names, code in split_converted(csharp_code) or []:
+        for name in names:
+            sections[name] = (names, code)
+    results = []
+    line = 1
+    for module in modules:
+        names, code = sections.get(module["vba_filename"], ([], None))
+        results.append({
+            "name": module["vba_filename"],
+            "vba": module["code"],
+            "lines": module["code"].count("\n") + 1,
+            # Mirrors join_vba_modules: a banner line, the code, then a blank line
+            "first_line": line + 1,
+            "csharp": code,
+            "group": names,
+        })
+        line += results[-1]["lines"] + 2
+    return results
+
+
+def page_count(text: str, page_lines: int = PAGE_LINES) -> int:
+    return max(1, -(-(text.count("\n") + 1) // page_lines))
+
+
+def text_page(text: str, page: int, page_lines: int = PAGE_LINES) -> Tuple[str, int, int]:
+    """Page ``page`` (1-based) of ``text``: (code, first line, last line)."""
+    lines = text.split("\n")
+    first = (min(max(page, 1), page_count(text, page_lines)) - 1) * page_lines
+    chunk = lines[first:first + page_lines]
+    return "\n".join(chunk), first + 1, first + len(chunk)
+
+
+def _stem(name: str) -> str:
+    return re.sub(r"[^\w.-]", "_", os.path.splitext(name)[0]) or "module"
+
+
+def write_archive(results: List[Dict[str, Any]], fileobj: IO[bytes], csharp_code: str = "",
+                  workbook: str = "workbook") -> Dict[str, int]:
+    """
+    Write vba/<module>.vb for every module and cs/<module>.cs for every C#
+    section into a zip on ``fileobj``, one entry at a time. Sections shared
+    by a group of modules are written once, named after all of them; a
+    conversion without sections is written whole as cs/<workbook>.cs.
+    Returns {'files', 'bytes'} (uncompressed).
+    """
+    files = size = 0
+    written = set()
+    with zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED) as archive:
+        for module in results:
+            entries = [(f"vba/{_stem(module['name'])}.vb", module["vba"])]
+            if module["csharp"] is not None and tuple(module["group"]) not in written:
+                written.add(tuple(module["group"]))
+                entries.append((f"cs/{'+'.join(_stem(name) for name in module['group'])}.cs", module["csharp"]))
+            for path, text in entries:
+                data = text.encode("utf-8")
+                archive.writestr(path, data)
+                files, size = files + 1, size + len(data)
+        if csharp_code and not written:
+            data = csharp_code.encode("utf-8")
+            archive.writestr(f"cs/{_stem(workbook)}.cs", data)
+            files, size = files + 1, size + len(data)
+    return {"files": files, "bytes": size}
+
+
+def archive_bytes(results: List[Dict[str, Any]], csharp_code: str = "", workbook: str = "workbook") -> bytes:
+    """The zip of write_archive() as bytes; build it once per finished conversion and keep it."""
+    buffer = io.BytesIO()
+    with get_metrics().span("result_archive", modules=len(results)) as span:
+        span.update(write_archive(results, buffer, csharp_code, workbook))
+    return buffer.getvalue()
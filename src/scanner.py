@@ -0,0 +1,147 @@
+"""
+Single-pass workbook scanner: one open of the upload's container yields both
+its VBA modules and its Form/ActiveX control inventory, for .xlsx/.xlsm,
+.xlsb and legacy .xls files alike.
+
+    python -m src.scanner book.xlsb other.xls    # summary per file, --json for the full result
+
+The separate extractors each open the upload on their own, and oletools
+additionally reads every part of a zip package while looking for the VBA
+project. Here the zip directory (or OLE directory) is read once, the VBA
+project part is handed straight to the macro parser, and the control scan
+reuses the same open package.
+"""
+import argparse
+import io
+import json
+import os
+import zipfile
+from typing import Any, Dict
+
+import olefile
+
+from src.controls import scan_package_controls
+from src.metrics import get_metrics
+from src.ooxml import OOXMLPackage
+from src.vba_extraction import VBA_PROJECT_PART, extract_vba_modules
+from src.xls import XLSWorkbook
+
+ZIP_MAGIC = b"PK\x03\x04"
+OLE_MAGIC = olefile.MAGIC
+
+
+def detect_format(file_bytes: bytes) -> str:
+    """
+    Return 'xlsx', 'xlsm', 'xlsb', 'xls' or 'unknown' from the content of a
+    file; the extension of an upload is not trusted.
+    """
+    if file_bytes[:8] == OLE_MAGIC:
+        return "xls"
+    if file_bytes[:4] == ZIP_MAGIC:
+        try:
+            with zipfile.ZipFile(io.BytesIO(file_bytes)) as z:
+                names = set(z.namelist())
+        except zipfile.BadZipFile:
+            return "unknown"
+        return _package_format(names)
+    return "unknown"
+
+
+def _package_format(names) -> str:
+    if "xl/workbook.bin" in names:
+        return "xlsb"
+    if "xl/workbook.xml" in names:
+        return "xlsm" if VBA_PROJECT_PART in names else "xlsx"
+    return "unknown"
+
+
+def scan_workbook(file_bytes: bytes, filename: str, decode_activex: bool = True, cache=None) -> Dict[str, Any]:
+    """
+    Scan a workbook once for its macros and controls.
+
+    Returns a dict with 'format' (see detect_format), 'modules' (as
+    extract_vba_modules returns them, so the macro cache is shared), 'controls'
+    and 'sheets' (as scan_controls_ooxml returns them) and 'errors', a list of
+    "vba: ..." / "controls: ..." / "format: ..." messages. Never raises: a
+    part that cannot be read is reported in 'errors' and the rest is still
+    returned, and a file that is not a workbook yields a "format" error
+    rather than an empty result.
+    """
+    result = {"format": "unknown", "modules": [], "controls": [], "sheets": [], "errors": []}
+    with get_metrics().span("workbook_scan", bytes=len(file_bytes)) as span:
+        if file_bytes[:8] == OLE_MAGIC:
+            _scan_ole(file_bytes, filename, decode_activex, cache, result)
+        elif file_bytes[:4] == ZIP_MAGIC:
+            _scan_package(file_bytes, filename, decode_activex, cache, result)
+        else:
+            result["errors"].append(f"format: {filename} is neither a zip package nor an OLE file")
+        span.update(format=result["format"], modules=len(result["modules"]), controls=len(result["controls"]))
+    get_metrics().inc("vba_workbook_scans_total", format=result["format"])
+    return result
+
+
+def _scan_package(file_bytes, filename, decode_activex, cache, result) -> None:
+    try:
+        package = OOXMLPackage(file_bytes)
+    except zipfile.BadZipFile as e:
+        result["errors"].append(f"format: {e}")
+        return
+    with package:
+        result["format"] = _package_format(package.names)
+        if result["format"] == "unknown":
+            result["errors"].append("format: zip package without an Excel workbook part")
+            return
+        try:
+            vba_project = package.read(VBA_PROJECT_PART) if VBA_PROJECT_PART in package.names else None
+            if vba_project is not None:
+                result["modules"] = extract_vba_modules(file_bytes, filename, cache=cache, vba_project=vba_project)
+        except Exception as e:
+            result["errors"].append(f"vba: {e}")
+        try:
+            result["controls"], result["sheets"] = scan_package_controls(package, decode_activex)
+        except Exception as e:
+            result["errors"].append(f"controls: {e}")
+
+
+def _scan_ole(file_bytes, filename, decode_activex, cache, result) -> None:
+    result["format"] = "xls"
+    try:
+        workbook = XLSWorkbook(file_bytes)
+    except Exception as e:
+        result["errors"].append(f"format: {e}")
+        return
+    with workbook:
+        try:
+            if workbook.has_vba:
+                result["modules"] = extract_vba_modules(file_bytes, filename, cache=cache)
+        except Exception as e:
+            result["errors"].append(f"vba: {e}")
+        try:
+            result["sheets"] = workbook.sheet_names
+            result["controls"] = workbook.controls(decode_activex)
+        except Exception as e:
+            result["errors"].append(f"controls: {e}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Scan workbooks for VBA modules and controls in one pass.")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--json", action="store_true", help="Print the full results as JSON lines")
+    args = parser.parse_args(argv)
+    status = 0
+    for path in args.paths:
+        with open(path, "rb") as f:
+            result = scan_workbook(f.read(), os.path.basename(path))
+        if args.json:
+            print(json.dumps(dict(result, path=path), default=str))
+        else:
+            print(f"{path}: {result['format']}, {len(result['sheets'])} sheets, {len(result['modules'])} modules, "
+                  f"{len(result['controls'])} controls")
+            for error in result["errors"]:
+                print(f"  {error}")
+        status = status or int(bool(result["errors"]))
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
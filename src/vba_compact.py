@@ -0,0 +1,197 @@
+"""
+Prompt-side normalization of VBA: strips what the model does not need to
+convert the code before it is billed as prompt tokens.
+
+Passes (VBA_COMPACT, comma-separated; default all but "comments", "none" to
+turn the stage off):
+
+    attributes    Attribute VB_* header lines
+    banners       "' Macro from X in Y" listing banners, shortened to "' X"
+    empty_stubs   event handlers (Private Sub Object_Event, for a known Excel,
+                  UserForm or control event) with an empty body that nothing calls
+    comments      whole-line and trailing comments
+    blank_lines   blank lines and trailing whitespace
+
+The code shown to the user is never changed. compact_vba() returns a line map
+from every compacted line back to the line of the original code, which
+restore_line_numbers() uses to point "line N" references in the model's
+output back at the code the user sees.
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from src.metrics import get_metrics
+from src.rate_limit import estimate_tokens
+
+PASSES = ("attributes", "banners", "empty_stubs", "comments", "blank_lines")
+DEFAULT_PASSES = ("attributes", "banners", "empty_stubs", "blank_lines")
+
+_ATTRIBUTE_RE = re.compile(r"^\s*Attribute\s+VB_\w+\s*=", re.IGNORECASE)
+_BANNER_RE = re.compile(r"^' Macro from (.+?) in (.*)$")
+# Event handlers are named Object_Event; the VBA editor inserts them with an empty body
+_STUB_START_RE = re.compile(r"^\s*Private\s+Sub\s+([A-Za-z]\w*_(\w+))\s*\(.*\)\s*$", re.IGNORECASE)
+# Workbook, Worksheet, UserForm, class and control events; "Private Sub Do_Nothing()" is not one
+_EVENTS = {
+    "open", "beforeclose", "beforesave", "aftersave", "beforeprint", "newsheet", "newchart", "activate",
+    "deactivate", "sheetactivate", "sheetdeactivate", "sheetchange", "sheetselectionchange", "sheetcalculate",
+    "sheetbeforedoubleclick", "sheetbeforerightclick", "sheetfollowhyperlink", "windowactivate",
+    "windowdeactivate", "windowresize", "addininstall", "addinuninstall", "change", "selectionchange",
+    "calculate", "beforedoubleclick", "beforerightclick", "followhyperlink", "pivottableupdate", "initialize",
+    "terminate", "queryclose", "resize", "click", "dblclick", "afterupdate", "beforeupdate", "enter", "exit",
+    "gotfocus", "lostfocus", "keydown", "keyup", "keypress", "mousedown", "mouseup", "mousemove",
+    "dropbuttonclick", "spinup", "spindown", "scroll", "error", "layout", "addcontrol", "removecontrol",
+}
+_STUB_END_RE = re.compile(r"^\s*End\s+Sub\s*$", re.IGNORECASE)
+_REM_RE = re.compile(r"^\s*Rem(\s|$)", re.IGNORECASE)
+_LINE_REF_RE = re.compile(r"\b([Ll]ines?)(\s+)(\d+)(?:(\s*(?:-|–|to|and)\s*)(\d+))?")
+_FENCE_RE = re.compile(r"^[ \t]*```.*$", re.MULTILINE)
+# In C#: comments (group 1) and string or char literals, which are left alone
+_CSHARP_TOKEN_RE = re.compile(
+    r'(//[^\n]*|/\*.*?(?:\*/|$))'
+    r'|(?:\$@|@\$|@)"(?:[^"]|"")*(?:"|$)'
+    r'|\$?"(?:[^"\\\n]|\\.)*(?:"|$)'
+    r"|'(?:[^'\\\n]|\\.)*'",
+    re.DOTALL,
+)
+
+
+def compact_passes(value: Optional[str] = None) -> Tuple[str, ...]:
+    """Parse a VBA_COMPACT value (default: the environment) into the passes to run."""
+    value = os.getenv("VBA_COMPACT") if value is None else value
+    if value is None:
+        return DEFAULT_PASSES
+    if value.strip().lower() in ("", "0", "none", "off"):
+        return ()
+    passes = tuple(p.strip().lower() for p in value.split(",") if p.strip())
+    unknown = [p for p in passes if p not in PASSES]
+    if unknown:
+        raise ValueError(f"Unknown VBA_COMPACT pass: {', '.join(unknown)} (expected one of {', '.join(PASSES)})")
+    return passes
+
+
+def _strip_trailing_comment(line: str) -> str:
+    in_string = False
+    for i, char in enumerate(line):
+        if char == '"':
+            in_string = not in_string
+        elif char == "'" and not in_string:
+            return line[:i].rstrip()
+    return line
+
+
+def _drop_empty_stubs(lines: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+    kept = []
+    i = 0
+    while i < len(lines):
+        match = _STUB_START_RE.match(lines[i][1])
+        if match and match.group(2).lower() in _EVENTS:
+            j = i + 1
+            while j < len(lines) and not lines[j][1].strip():
+                j += 1
+            # A handler that is also called directly stays, or the call would point at nothing
+            name = re.compile(rf"(?<!\w){re.escape(match.group(1))}(?!\w)", re.IGNORECASE)
+            called = any(name.search(line) for k, (_, line) in enumerate(lines) if k != i)
+            if j < len(lines) and _STUB_END_RE.match(lines[j][1]) and not called:
+                i = j + 1
+                continue
+        kept.append(lines[i])
+        i += 1
+    return kept
+
+
+def compact_vba(code: str, passes: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """
+    Run ``passes`` (default: compact_passes()) over ``code``. Returns
+    {'code', 'line_map', 'tokens_before', 'tokens_after', 'removed'}:
+    line_map[i] is the 1-based original line of compacted line i + 1 and
+    'removed' counts the lines each pass dropped.
+    """
+    passes = compact_passes() if passes is None else tuple(passes)
+    lines = list(enumerate(code.replace("\r\n", "\n").replace("\r", "\n").split("\n"), 1))
+    # Banners stay, shortened or not, so the model still sees where each module starts
+    banners = {n for n, line in lines if _BANNER_RE.match(line)}
+    removed = {}
+    with get_metrics().span("vba_compact", passes=",".join(passes), lines=len(lines)) as span:
+        if "attributes" in passes:
+            kept = [(n, line) for n, line in lines if not _ATTRIBUTE_RE.match(line)]
+            removed["attributes"], lines = len(lines) - len(kept), kept
+        if "banners" in passes:
+            lines = [(n, _BANNER_RE.sub(r"' \1", line)) for n, line in lines]
+        if "comments" in passes:
+            kept = []
+            for n, line in lines:
+                stripped = line.strip()
+                if n in banners:
+                    kept.append((n, line))
+                elif stripped.startswith("'") or _REM_RE.match(stripped):
+                    continue
+                else:
+                    kept.append((n, _strip_trailing_comment(line)))
+            removed["comments"], lines = len(lines) - len(kept), kept
+        if "empty_stubs" in passes:
+            kept = _drop_empty_stubs(lines)
+            removed["empty_stubs"], lines = len(lines) - len(kept), kept
+        if "blank_lines" in passes:
+            kept = [(n, line.rstrip()) for n, line in lines if line.strip()]
+            removed["blank_lines"], lines = len(lines) - len(kept), kept
+
+        compacted = "\n".join(line for _, line in lines)
+        result = {
+            "code": compacted,
+            "line_map": [n for n, _ in lines],
+            "tokens_before": estimate_tokens(code),
+            "tokens_after": estimate_tokens(compacted),
+            "removed": removed,
+        }
+        span.update(tokens_before=result["tokens_before"], tokens_after=result["tokens_after"])
+    get_metrics().inc("vba_prompt_code_tokens_total", result["tokens_before"], stage="original")
+    get_metrics().inc("vba_prompt_code_tokens_total", result["tokens_after"], stage="compacted")
+    return result
+
+
+def original_line(line_map: List[int], line: int) -> int:
+    """The original line of compacted ``line`` (1-based); lines outside the map are returned unchanged."""
+    return line_map[line - 1] if 1 <= line <= len(line_map) else line
+
+
+def _restore_in_comments(code: str, replace) -> str:
+    # Only comments are rewritten: "line 2" in a string literal or identifier is program text
+    def comment(match):
+        return _LINE_REF_RE.sub(replace, match.group(0)) if match.group(1) else match.group(0)
+
+    return _CSHARP_TOKEN_RE.sub(comment, code)
+
+
+def restore_line_numbers(text: str, line_map: List[int]) -> str:
+    """
+    Rewrite "line N" and "lines N-M" references to compacted code in ``text``
+    to the original lines. References are rewritten in prose outside
+    ``` fences and in C# comments; string literals and other code are
+    left as they are. Text without fences is treated as code.
+    """
+    if not text or line_map == list(range(1, len(line_map) + 1)):
+        return text
+
+    def replace(match):
+        restored = f"{match.group(1)}{match.group(2)}{original_line(line_map, int(match.group(3)))}"
+        if match.group(5):
+            restored += f"{match.group(4)}{original_line(line_map, int(match.group(5)))}"
+        return restored
+
+    fences = list(_FENCE_RE.finditer(text))
+    if not fences:
+        return _restore_in_comments(text, replace)
+    # Fences alternate: prose, code, prose, ...; an unclosed fence runs to the end
+    parts = []
+    position = 0
+    in_code = False
+    for fence in fences + [None]:
+        end = fence.start() if fence is not None else len(text)
+        segment = text[position:end]
+        parts.append(_restore_in_comments(segment, replace) if in_code else _LINE_REF_RE.sub(replace, segment))
+        if fence is not None:
+            parts.append(fence.group(0))
+            position = fence.end()
+            in_code = not in_code
+    return "".join(parts)
@@ -0,0 +1,70 @@
+from src.cache import content_hash, get_macro_cache
+from src.metrics import get_metrics
+
+# Where .xlsm and .xlsb packages keep the VBA project, and the container name oletools reports for it
+VBA_PROJECT_PART = "xl/vbaProject.bin"
+
+
+def extract_vba_modules(file_bytes, original_filename, cache=None, vba_project=None):
+    """
+    Extract the VBA modules of an Excel file as a list of dicts with the keys
+    'filename', 'stream_path', 'vba_filename' and 'code'.
+
+    Results are cached on disk under the SHA-256 of the uploaded bytes, so a
+    repeated upload of the same workbook skips the OLE parse entirely.
+    Callers that already opened the zip container can pass the bytes of its
+    xl/vbaProject.bin part as ``vba_project``; only that part is parsed then,
+    instead of oletools opening the container again and probing every part.
+    Raises on parse errors; an empty list means the file has no macros.
+    """
+    if cache is None:
+        cache = get_macro_cache()
+    digest = content_hash(file_bytes)
+    modules = cache.get(digest)
+    get_metrics().inc("vba_macro_cache_total", result="miss" if modules is None else "hit")
+    if modules is None:
+        with get_metrics().span("vba_parse", bytes=len(file_bytes)) as span:
+            if vba_project is not None:
+                modules = _parse_vba_modules(vba_project, original_filename, container=VBA_PROJECT_PART)
+            else:
+                modules = _parse_vba_modules(file_bytes, original_filename)
+            span["modules"] = len(modules)
+        cache.set(digest, modules)
+
+    # The container name is stored as None so that cached entries follow the current upload's name
+    return [dict(m, filename=m["filename"] or original_filename) for m in modules]
+
+
+def _parse_vba_modules(file_bytes, original_filename, container=None):
+    # oletools is only needed on a cache miss, so it is imported here.
+    # VBA_Parser reads the container straight from memory when given data,
+    # so the upload never touches the disk
+    from oletools.olevba import VBA_Parser
+
+    modules = []
+    vba_parser = VBA_Parser(container or original_filename, data=bytes(file_bytes))
+    try:
+        # extract_all_macros locates the VBA projects itself; a detect_vba_macros() call first
+        # would read every stream of an OLE container (the whole .xls Workbook stream) once more
+        for (filename, stream_path, vba_filename, code) in vba_parser.extract_all_macros():
+            modules.append({
+                "filename": None if filename == original_filename else filename,
+                "stream_path": stream_path,
+                "vba_filename": vba_filename,
+                "code": code,
+            })
+    finally:
+        vba_parser.close()
+
+    return modules
+
+
+def join_vba_modules(modules):
+    """
+    Concatenate extracted modules into a single listing, one banner per module.
+    """
+    with get_metrics().span("macro_join", modules=len(modules)):
+        vba_code = ""
+        for module in modules:
+            vba_code += f"' Macro from {module['vba_filename']} in {module['filename']}\n" + module["code"] + "\n\n"
+    return vba_code
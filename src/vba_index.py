@@ -0,0 +1,405 @@
+"""
+Symbol index and call graph over a VBA project, used to give each
+conversion chunk the signatures it depends on instead of the whole project.
+
+The index records module-level declarations (variables, constants, Declare
+statements), Type and Enum blocks, procedure signatures and, per procedure,
+the symbols its body references. context_for_units() then renders just the
+dependencies of a set of procedures, callees before callers, so a prompt
+grows with the code it converts rather than with the project.
+"""
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from src.metrics import get_metrics
+from src.vba_procedures import _PROC_START_RE, DECLARATIONS, split_procedures
+
+_BANNER_RE = re.compile(r"^' Macro from (.+?) in (.*)$")
+_IDENT_RE = re.compile(r"[A-Za-z_]\w*")
+_STRING_RE = re.compile(r'"(?:[^"]|"")*"')
+_BLOCK_START_RE = re.compile(r"^(?:(Public|Private)\s+)?(Type|Enum)\s+(\w+)", re.IGNORECASE)
+_BLOCK_END_RE = re.compile(r"^End\s+(Type|Enum)\b", re.IGNORECASE)
+_DECLARE_RE = re.compile(
+    r"^(?:(Public|Private)\s+)?Declare\s+(?:PtrSafe\s+)?(?:Sub|Function)\s+(\w+)", re.IGNORECASE
+)
+_CONST_RE = re.compile(r"^(?:(Public|Private|Global)\s+)?Const\s+(.+)$", re.IGNORECASE)
+_VARIABLE_RE = re.compile(r"^(Public|Private|Dim|Global)\s+(?:WithEvents\s+)?(.+)$", re.IGNORECASE)
+_LOCAL_RE = re.compile(r"^\s*(?:Dim|Static|ReDim(?:\s+Preserve)?|Const)\s+(.+)$", re.IGNORECASE)
+_QUALIFIER_RE = re.compile(r"(\w+)\s*$")
+_PARAMS_RE = re.compile(r"\((.*)\)")
+_PARAM_NAME_RE = re.compile(r"^(?:Optional\s+)?(?:ByVal\s+|ByRef\s+)?(?:ParamArray\s+)?(\w+)", re.IGNORECASE)
+
+# Emit order for symbols that do not depend on each other
+_KIND_RANK = {"Enum": 0, "Type": 1, "Const": 2, "Declare": 3, "Variable": 4, "Module": 5}
+
+CONTEXT_HEADER = "' Declarations referenced by this code (signatures only, for reference):"
+
+
+def split_listing(vba_code: str) -> List[Dict[str, str]]:
+    """
+    Split the joined listing returned by extract_vba_from_excel back into
+    modules ({'vba_filename', 'filename', 'code'}) using its per-module banners.
+    """
+    modules: List[Dict[str, Any]] = []
+    for line in vba_code.split("\n"):
+        match = _BANNER_RE.match(line)
+        if match:
+            modules.append({"vba_filename": match.group(1), "filename": match.group(2), "lines": []})
+        elif modules:
+            modules[-1]["lines"].append(line)
+    return [
+        {"vba_filename": m["vba_filename"], "filename": m["filename"], "code": "\n".join(m["lines"]).strip("\n")}
+        for m in modules
+    ]
+
+
+def _logical_lines(code: str) -> List[str]:
+    """Join " _" line continuations so every statement sits on one line."""
+    lines = []
+    buffer = ""
+    for line in code.split("\n"):
+        stripped = line.rstrip()
+        # A comment can end in " _" too; only code carries on onto the next line
+        if _strip_comment(stripped).rstrip().endswith(" _"):
+            buffer += stripped[:-1].strip() + " "
+            continue
+        lines.append(buffer + stripped.strip() if buffer else stripped)
+        buffer = ""
+    if buffer:
+        lines.append(buffer.rstrip())
+    return lines
+
+
+def _strip_comment(line: str) -> str:
+    """Remove string literals and the trailing comment from one line of VBA."""
+    line = _STRING_RE.sub('""', line)
+    quote = line.find("'")
+    if quote >= 0:
+        line = line[:quote]
+    if line.strip().lower().startswith("rem "):
+        return ""
+    return line
+
+
+def _split_top_level(text: str) -> List[str]:
+    """Split on commas that are not inside parentheses."""
+    parts = []
+    depth = 0
+    current = ""
+    for char in text:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        current += char
+    parts.append(current)
+    return [p.strip() for p in parts if p.strip()]
+
+
+def _is_standard_module(vba_filename: str) -> bool:
+    return os.path.splitext(vba_filename)[1].lower() == ".bas"
+
+
+def _module_name(vba_filename: str) -> str:
+    return os.path.splitext(vba_filename)[0]
+
+
+class VBAIndex:
+    """
+    Index of the symbols defined in a set of VBA modules, and of what every
+    procedure references.
+
+    Symbols are dicts with 'id', 'name', 'kind' (Sub, Function, Property Get,
+    ..., Type, Enum, Const, Variable, Declare, Module), 'module', 'public',
+    'text' (the signature or declaration) and 'line'. Names are resolved the
+    way VBA does: the procedure's own module first, then public members of
+    standard modules; class and form members only through their module name.
+    """
+
+    def __init__(self, modules: List[Dict[str, Any]]):
+        self.modules = [m["vba_filename"] for m in modules]
+        self.symbols: Dict[str, Dict[str, Any]] = {}
+        self.units: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.references: Dict[str, Set[str]] = {}
+        self._by_module: Dict[Tuple[str, str], List[str]] = {}
+        self._global: Dict[str, List[str]] = {}
+        self._module_ids: Dict[str, str] = {}
+        with get_metrics().span("vba_index", modules=len(modules)) as span:
+            for module in modules:
+                self._index_module(module)
+            self._add_module_outlines()
+            for symbol_id, symbol in self.symbols.items():
+                self.references[symbol_id] = self._resolve_all(symbol["module"], _IDENT_RE.findall(
+                    _strip_comment(symbol["text"]) if symbol["kind"] != "Module" else ""), exclude={symbol_id})
+            self.calls: Dict[str, Set[str]] = {}
+            for (module, key), unit in self.units.items():
+                if key != DECLARATIONS:
+                    self.calls[unit["symbol"]] = self._body_references(module, unit)
+            span["symbols"] = len(self.symbols)
+
+    # -- indexing --------------------------------------------------------
+
+    def _add(self, module: str, name: str, kind: str, public: bool, text: str, line: int,
+             symbol_id: Optional[str] = None) -> str:
+        symbol_id = symbol_id or f"{module}:{kind}:{name}"
+        self.symbols[symbol_id] = {"id": symbol_id, "name": name, "kind": kind, "module": module,
+                                   "public": public, "text": text, "line": line}
+        self._by_module.setdefault((module, name.lower()), []).append(symbol_id)
+        if public and _is_standard_module(module):
+            self._global.setdefault(name.lower(), []).append(symbol_id)
+        return symbol_id
+
+    def _index_module(self, module: Dict[str, Any]) -> None:
+        vba_filename = module["vba_filename"]
+        standard = _is_standard_module(vba_filename)
+        for unit in split_procedures(module["code"]):
+            unit["module"] = vba_filename
+            self.units[(vba_filename, unit["key"])] = unit
+            if unit["key"] == DECLARATIONS:
+                self._index_declarations(vba_filename, unit["code"], standard)
+                continue
+            raw_lines = unit["code"].split("\n")
+            signature = next((l for l in _logical_lines(unit["code"]) if _PROC_START_RE.match(l)), None)
+            if signature is None:
+                # Unusual continuations: fall back to the raw line the procedure starts on
+                signature = next((l for l in raw_lines if _PROC_START_RE.match(l)), raw_lines[0])
+            signature = _strip_comment(signature).strip()
+            unit["signature"] = signature
+            public = not signature.lower().startswith("private ")
+            unit["symbol"] = self._add(vba_filename, unit["name"], unit["kind"], public, signature,
+                                       unit["start_line"], symbol_id=f"{vba_filename}:{unit['key']}")
+
+    def _index_declarations(self, module: str, code: str, standard: bool) -> None:
+        block: Optional[Dict[str, Any]] = None
+        for number, raw in enumerate(_logical_lines(code), 1):
+            line = _strip_comment(raw).strip()
+            if block is not None:
+                block["lines"].append(raw.rstrip())
+                if _BLOCK_END_RE.match(line):
+                    symbol_id = self._add(module, block["name"], block["kind"], block["public"],
+                                          "\n".join(block["lines"]), block["line"])
+                    if block["kind"] == "Enum":
+                        # Enum members are global names of their own in VBA
+                        for member in block["members"]:
+                            self._by_module.setdefault((module, member.lower()), []).append(symbol_id)
+                            if block["public"] and standard:
+                                self._global.setdefault(member.lower(), []).append(symbol_id)
+                    block = None
+                elif block["kind"] == "Enum" and line:
+                    block["members"].append(_IDENT_RE.match(line).group(0) if _IDENT_RE.match(line) else "")
+                continue
+            if not line or line.lower().startswith(("option ", "attribute ", "implements ")):
+                continue
+            match = _BLOCK_START_RE.match(line)
+            if match:
+                block = {"kind": match.group(2).capitalize(), "name": match.group(3), "line": number,
+                         "public": (match.group(1) or "").lower() != "private",
+                         "lines": [raw.strip()], "members": []}
+                continue
+            match = _DECLARE_RE.match(line)
+            if match:
+                self._add(module, match.group(2), "Declare", (match.group(1) or "").lower() != "private", line, number)
+                continue
+            match = _CONST_RE.match(line)
+            if match:
+                public = (match.group(1) or "").lower() in ("public", "global")
+                for part in _split_top_level(match.group(2)):
+                    self._add(module, _IDENT_RE.match(part).group(0), "Const", public, line, number)
+                continue
+            match = _VARIABLE_RE.match(line)
+            if match:
+                public = match.group(1).lower() in ("public", "global")
+                for part in _split_top_level(match.group(2)):
+                    name = _IDENT_RE.match(part)
+                    if name:
+                        self._add(module, name.group(0), "Variable", public, line, number)
+
+    def _add_module_outlines(self) -> None:
+        """One 'Module' symbol per module: the public signatures, for Class.Member and As Class references."""
+        for module in self.modules:
+            members = sorted((s for s in self.symbols.values() if s["module"] == module and s["public"]
+                              and s["kind"] not in ("Type", "Enum")), key=lambda s: s["line"])
+            name = _module_name(module)
+            text = "\n".join([f"' Members of {name}"] + [s["text"] for s in members])
+            self._module_ids[name.lower()] = self._add(module, name, "Module", False, text, 0,
+                                                       symbol_id=f"{module}:Module")
+
+    # -- resolution ------------------------------------------------------
+
+    def resolve(self, module: str, name: str) -> List[str]:
+        """Ids of the symbols ``name`` refers to from code in ``module``."""
+        lowered = name.lower()
+        found = self._by_module.get((module, lowered))
+        if found:
+            return [s for s in found if self.symbols[s]["kind"] != "Module"] or found
+        found = self._global.get(lowered)
+        if found:
+            # Property Get/Let/Set pairs share a name; keep every accessor of the first module
+            owner = self.symbols[found[0]]["module"]
+            return [s for s in found if self.symbols[s]["module"] == owner]
+        module_id = self._module_ids.get(lowered)
+        return [module_id] if module_id else []
+
+    def _resolve_all(self, module: str, names: Iterable[str], exclude: Set[str] = frozenset()) -> Set[str]:
+        resolved: Set[str] = set()
+        for name in set(names):
+            resolved.update(s for s in self.resolve(module, name) if s not in exclude)
+        return resolved
+
+    def _body_references(self, module: str, unit: Dict[str, Any]) -> Set[str]:
+        lines = [_strip_comment(l) for l in _logical_lines(unit["code"])]
+        locals_ = {unit["name"].lower()}
+        params = _PARAMS_RE.search(unit["signature"])
+        if params:
+            for part in _split_top_level(params.group(1)):
+                match = _PARAM_NAME_RE.match(part)
+                if match:
+                    locals_.add(match.group(1).lower())
+        for line in lines:
+            match = _LOCAL_RE.match(line)
+            if match:
+                for part in _split_top_level(match.group(1)):
+                    name = _IDENT_RE.match(part)
+                    if name:
+                        locals_.add(name.group(0).lower())
+
+        references: Set[str] = set()
+        for line in lines:
+            for match in _IDENT_RE.finditer(line):
+                name = match.group(0)
+                before = line[:match.start()].rstrip()
+                if before.endswith("."):
+                    # Member access: only resolvable when qualified by a module name (Module1.Proc)
+                    qualifier = _QUALIFIER_RE.search(before[:-1])
+                    owner = qualifier.group(1).lower() if qualifier else ""
+                    module_id = self._module_ids.get(owner)
+                    if module_id:
+                        owner_module = self.symbols[module_id]["module"]
+                        references.update(s for s in self._by_module.get((owner_module, name.lower()), [])
+                                          if self.symbols[s]["public"])
+                    continue
+                if name.lower() in locals_:
+                    continue
+                references.update(self.resolve(module, name))
+        references.discard(unit["symbol"])
+        return references
+
+    # -- context ---------------------------------------------------------
+
+    def unit_symbols(self, units: Iterable[Tuple[str, str]]) -> Set[str]:
+        """Symbol ids defined by the given (module, unit key) pairs, declarations included."""
+        ids: Set[str] = set()
+        for module, key in units:
+            unit = self.units.get((module, key))
+            if unit is None:
+                continue
+            if key == DECLARATIONS:
+                ids.update(s for s, sym in self.symbols.items() if sym["module"] == module
+                           and sym["kind"] in ("Type", "Enum", "Const", "Variable", "Declare"))
+            else:
+                ids.add(unit["symbol"])
+        return ids
+
+    def dependencies(self, units: Iterable[Tuple[str, str]]) -> List[str]:
+        """
+        Symbols referenced by the given units but defined outside them, plus
+        whatever their signatures need in turn (e.g. a Type used as a
+        parameter), in dependency order.
+        """
+        units = list(units)
+        inside = self.unit_symbols(units)
+        needed: Set[str] = set()
+        for module, key in units:
+            unit = self.units.get((module, key))
+            if unit is None:
+                continue
+            if key == DECLARATIONS:
+                for symbol_id in inside:
+                    if self.symbols[symbol_id]["module"] == module:
+                        needed.update(self.references[symbol_id])
+            else:
+                needed.update(self.calls[unit["symbol"]])
+        pending = list(needed)
+        while pending:
+            for reference in self.references[pending.pop()]:
+                if reference not in needed:
+                    needed.add(reference)
+                    pending.append(reference)
+        needed -= inside
+        # A module outline already lists the public members of its module
+        outlined = {self.symbols[s]["module"] for s in needed if self.symbols[s]["kind"] == "Module"}
+        needed = {s for s in needed if self.symbols[s]["kind"] == "Module" or not (
+            self.symbols[s]["module"] in outlined and self.symbols[s]["public"]
+            and self.symbols[s]["kind"] not in ("Type", "Enum"))}
+        return self._topological(needed)
+
+    def _topological(self, ids: Set[str]) -> List[str]:
+        order: List[str] = []
+        seen: Set[str] = set()
+        module_order = {m: i for i, m in enumerate(self.modules)}
+
+        def rank(symbol_id):
+            symbol = self.symbols[symbol_id]
+            return _KIND_RANK.get(symbol["kind"], 6), module_order.get(symbol["module"], 0), symbol["line"]
+
+        def visit(symbol_id):
+            if symbol_id in seen:
+                return
+            seen.add(symbol_id)
+            edges = self.references[symbol_id] | self.calls.get(symbol_id, set())
+            for dependency in sorted(edges & ids, key=rank):
+                visit(dependency)
+            order.append(symbol_id)
+
+        for symbol_id in sorted(ids, key=rank):
+            visit(symbol_id)
+        return order
+
+    def render(self, symbol_ids: List[str]) -> str:
+        """Render symbols as VBA signatures, one comment line per change of module."""
+        lines: List[str] = []
+        emitted: Set[str] = set()
+        current = None
+        for symbol_id in symbol_ids:
+            symbol = self.symbols[symbol_id]
+            # Several names declared in one statement share its text
+            if (symbol["module"], symbol["text"]) in emitted:
+                continue
+            emitted.add((symbol["module"], symbol["text"]))
+            if symbol["module"] != current:
+                current = symbol["module"]
+                lines.append(f"' {current}")
+            lines.append(symbol["text"])
+        return "\n".join(lines)
+
+    def context_for_units(self, units: Iterable[Tuple[str, str]]) -> str:
+        """The dependency signatures of ``units`` ready to prepend to a prompt, or "" if there are none."""
+        dependencies = self.dependencies(units)
+        if not dependencies:
+            return ""
+        return f"{CONTEXT_HEADER}\n{self.render(dependencies)}\n"
+
+    def context_for_modules(self, module_names: Iterable[str]) -> str:
+        """Context for a chunk made of whole modules: what they use from every other module."""
+        module_names = set(module_names)
+        return self.context_for_units((module, key) for module, key in self.units if module in module_names)
+
+    def call_graph(self) -> Dict[str, List[str]]:
+        """{procedure id: [ids of the procedures it calls]}, for inspection and debugging."""
+        procedures = {s for s, sym in self.symbols.items() if sym["kind"] in
+                      ("Sub", "Function", "Property Get", "Property Let", "Property Set", "Declare")}
+        return {caller: sorted(callees & procedures) for caller, callees in self.calls.items()}
+
+
+def build_index(vba: Any) -> VBAIndex:
+    """
+    Index either a list of modules (as returned by extract_vba_modules) or
+    the joined listing returned by extract_vba_from_excel.
+    """
+    modules = split_listing(vba) if isinstance(vba, str) else vba
+    return VBAIndex(modules)
@@ -0,0 +1,91 @@
+import hashlib
+import re
+from typing import Any, Dict, List
+
+DECLARATIONS = "(Declarations)"
+
+_PROC_START_RE = re.compile(
+    r"^\s*(?:(?:Public|Private|Friend)\s+)?(?:Static\s+)?(Sub|Function|Property\s+(?:Get|Let|Set))\s+(\w+)",
+    re.IGNORECASE,
+)
+_PROC_END_RE = re.compile(r"^\s*End\s+(?:Sub|Function|Property)\b", re.IGNORECASE)
+
+
+def normalize_code(code: str) -> str:
+    """Unify line endings and drop trailing whitespace and surrounding blank lines."""
+    lines = code.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip("\n")
+
+
+def code_hash(code: str) -> str:
+    """Stable hash of a piece of VBA, insensitive to line endings and trailing whitespace."""
+    return hashlib.sha256(normalize_code(code).encode("utf-8")).hexdigest()
+
+
+def _is_comment_or_blank(line: str) -> bool:
+    stripped = line.strip()
+    return not stripped or stripped.startswith("'") or stripped.lower().startswith("rem ")
+
+
+def split_procedures(code: str) -> List[Dict[str, Any]]:
+    """
+    Split the source of one VBA module into units: the module-level
+    declarations first, then one unit per Sub, Function or Property.
+
+    Each unit is a dict with 'key' (e.g. "Function Total", unique within the
+    module), 'kind', 'name', 'code', 'start_line' and 'hash'. Comment lines
+    directly above a procedure belong to that procedure.
+    """
+    lines = code.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    declarations: List[str] = []
+    pending: List[str] = []
+    procedures: List[Dict[str, Any]] = []
+    current = None
+    for number, line in enumerate(lines, 1):
+        if current is not None:
+            current["lines"].append(line)
+            if _PROC_END_RE.match(line):
+                procedures.append(current)
+                current = None
+            continue
+        match = _PROC_START_RE.match(line)
+        if match:
+            # Blank lines between procedures belong to neither, so spacing edits change no hash
+            while pending and not pending[0].strip():
+                pending.pop(0)
+            current = {
+                "kind": " ".join(word.capitalize() for word in match.group(1).split()),
+                "name": match.group(2),
+                "lines": pending + [line],
+                "start_line": number - len(pending),
+            }
+            pending = []
+        elif _is_comment_or_blank(line):
+            pending.append(line)
+        else:
+            declarations.extend(pending)
+            declarations.append(line)
+            pending = []
+    if current is not None:
+        # A procedure without its End line still gets a unit of its own
+        procedures.append(current)
+    declarations.extend(pending)
+
+    units = [{
+        "key": DECLARATIONS, "kind": "Declarations", "name": DECLARATIONS,
+        "code": normalize_code("\n".join(declarations)), "start_line": 1,
+    }]
+    seen: Dict[str, int] = {}
+    for procedure in procedures:
+        key = f"{procedure['kind']} {procedure['name']}"
+        seen[key] = seen.get(key, 0) + 1
+        if seen[key] > 1:
+            # Duplicate definitions do not compile, but keep them apart anyway
+            key = f"{key} #{seen[key]}"
+        units.append({
+            "key": key, "kind": procedure["kind"], "name": procedure["name"],
+            "code": normalize_code("\n".join(procedure["lines"])), "start_line": procedure["start_line"],
+        })
+    for unit in units:
+        unit["hash"] = code_hash(unit["code"])
+    return units
@@ -0,0 +1,324 @@
+"""
+Excel-free reader for legacy .xls workbooks (BIFF8 in an OLE compound file):
+sheet names, Form Controls and ActiveX controls, following [MS-XLS] and the
+OfficeArt drawing records of [MS-ODRAW].
+
+Controls are OBJ records in the sheet substreams of the Workbook stream. The
+drawing record just before each OBJ holds the shape's anchor and name, and
+ActiveX controls keep their persisted state in the workbook's "Ctls" stream.
+"""
+import struct
+from typing import Any, Dict, IO, Iterator, List, Optional, Tuple, Union
+
+import olefile
+
+from src.activex import decode_control_stream, split_clsid, summarize_properties
+from src.controls import ACTIVEX_CONTROL_MAP, _form_control_type
+from src.metrics import get_metrics
+from src.ooxml import cell_address
+
+# BIFF8 record types
+BOF = 0x0809
+EOF = 0x000A
+FILEPASS = 0x002F
+BOUNDSHEET = 0x0085
+INDEX = 0x020B
+DBCELL = 0x00D7
+MSODRAWING = 0x00EC
+OBJ = 0x005D
+CONTINUE = 0x003C
+
+# OBJ sub-records
+FT_END = 0x00
+FT_PIO_GRBIT = 0x08
+FT_PICT_FMLA = 0x09
+FT_CMO = 0x15
+PIO_CONTROL = 0x0010
+
+# ftCmo object types of form controls, as the objectType names used in .xlsx
+OBJECT_TYPES = {
+    0x07: 'Button',
+    0x0B: 'Checkbox',
+    0x0C: 'Radio',
+    0x0D: 'EditBox',
+    0x0E: 'Label',
+    0x10: 'Spin',
+    0x11: 'Scroll',
+    0x12: 'List',
+    0x13: 'GBox',
+    0x14: 'Drop',
+}
+OT_PICTURE = 0x08
+
+# OfficeArt records and shape properties
+_CONTAINER_VERSION = 0xF
+_CLIENT_ANCHOR = 0xF010
+_FOPT = 0xF00B
+_PROP_NAME = 0x0380
+
+
+def iter_records(stream: bytes, offset: int = 0) -> Iterator[Tuple[int, bytes]]:
+    """Yield (record type, payload) for the BIFF records of ``stream`` from ``offset`` on."""
+    end = len(stream)
+    while offset + 4 <= end:
+        record_type, size = struct.unpack_from("<HH", stream, offset)
+        yield record_type, stream[offset + 4:offset + 4 + size]
+        offset += 4 + size
+
+
+def is_ole_file(source: Union[bytes, str, IO[bytes]]) -> bool:
+    """Whether ``source`` (content, path or binary file object) starts with the OLE signature."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source[:8]) == olefile.MAGIC
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return f.read(8) == olefile.MAGIC
+    position = source.tell()
+    header = source.read(8)
+    source.seek(position)
+    return header == olefile.MAGIC
+
+
+def _short_string(data: bytes, offset: int) -> str:
+    # ShortXLUnicodeString: character count, fHighByte flag, then 1- or 2-byte characters
+    count, flags = data[offset], data[offset + 1]
+    raw = data[offset + 2:offset + 2 + count * (2 if flags & 1 else 1)]
+    return raw.decode("utf-16-le" if flags & 1 else "latin-1", errors="replace")
+
+
+def _drawing_shape(drawing: bytes) -> Dict[str, Any]:
+    """
+    Return the 'cell' and 'name' of the last shape described in one
+    MSODRAWING record. Containers are stepped into rather than skipped,
+    because the first record of a sheet opens containers that span all of
+    the sheet's drawing records.
+    """
+    shape: Dict[str, Any] = {"cell": None, "name": None}
+    pos, end = 0, len(drawing)
+    while pos + 8 <= end:
+        ver_inst, record_type, size = struct.unpack_from("<HHI", drawing, pos)
+        pos += 8
+        if ver_inst & 0xF == _CONTAINER_VERSION:
+            continue
+        body = drawing[pos:pos + size]
+        if record_type == _CLIENT_ANCHOR and len(body) >= 10:
+            # Flags, then column, column offset, row, row offset of the top-left corner
+            col, _, row = struct.unpack_from("<HHH", body, 2)
+            shape["cell"] = cell_address(col, row)
+        elif record_type == _FOPT:
+            shape["name"] = _shape_name(body, ver_inst >> 4) or shape["name"]
+        pos += size
+    return shape
+
+
+def _shape_name(body: bytes, count: int) -> Optional[str]:
+    # Property table: (id and flags, value) pairs; complex values follow the table in order
+    complex_offset = 6 * count
+    for i in range(count):
+        if 6 * i + 6 > len(body):
+            return None
+        opid, value = struct.unpack_from("<HI", body, 6 * i)
+        if not opid & 0x8000:
+            continue
+        if opid & 0x3FFF == _PROP_NAME:
+            raw = body[complex_offset:complex_offset + value]
+            return raw.decode("utf-16-le", errors="replace").split("\x00", 1)[0] or None
+        complex_offset += value
+    return None
+
+
+def parse_obj(payload: bytes) -> Dict[str, Any]:
+    """
+    Decode the sub-records of an OBJ record that matter for controls: the
+    object type and id, whether it is an ActiveX control, its ProgID and the
+    location of its persisted state in the Ctls stream.
+    """
+    obj: Dict[str, Any] = {"type": None, "id": None, "control": False, "prog_id": None, "ctl_pos": None, "ctl_size": None}
+    pos = 0
+    while pos + 4 <= len(payload):
+        ft, size = struct.unpack_from("<HH", payload, pos)
+        body = payload[pos + 4:pos + 4 + size]
+        if ft == FT_END:
+            break
+        if ft == FT_CMO and len(body) >= 4:
+            obj["type"], obj["id"] = struct.unpack_from("<HH", body, 0)
+            if obj["type"] != OT_PICTURE:
+                # ftCmo comes first and is all a form control needs; the sub-records of
+                # lists and dropdowns do not always state their true size
+                break
+        elif ft == FT_PIO_GRBIT and len(body) >= 2:
+            obj["control"] = bool(struct.unpack_from("<H", body, 0)[0] & PIO_CONTROL)
+        elif ft == FT_PICT_FMLA and len(body) >= 8:
+            _parse_pict_fmla(body, obj)
+        pos += 4 + size
+    return obj
+
+
+def _parse_pict_fmla(body: bytes, obj: Dict[str, Any]) -> None:
+    # ObjFmla: formula size, then the parsed formula (size, 4 unused bytes, tokens) and,
+    # for embedded objects, the class name (the ProgID)
+    formula_size = struct.unpack_from("<H", body, 0)[0]
+    token_size = struct.unpack_from("<H", body, 2)[0] & 0x7FFF
+    pos = 8 + token_size
+    if body[8:9] == b"\x02" and body[pos:pos + 1] == b"\x03" and pos + 4 <= len(body):
+        count, flags = body[pos + 1], body[pos + 3]
+        raw = body[pos + 4:pos + 4 + count * (2 if flags & 1 else 1)]
+        obj["prog_id"] = raw.decode("utf-16-le" if flags & 1 else "latin-1", errors="replace")
+    # The Ctls stream position and size follow the formula
+    after = 2 + formula_size
+    if after + 8 <= len(body):
+        obj["ctl_pos"], obj["ctl_size"] = struct.unpack_from("<II", body, after)
+
+
+class XLSWorkbook:
+    """
+    One open handle on a legacy .xls workbook.
+
+    The OLE directory and the Workbook stream are read once, and the sheet
+    list is parsed on first use and memoized.
+    """
+
+    def __init__(self, source: Union[bytes, str, IO[bytes], olefile.OleFileIO]):
+        self.ole = source if isinstance(source, olefile.OleFileIO) else olefile.OleFileIO(source)
+        if not self.ole.exists("Workbook"):
+            self.ole.close()
+            if self.ole.exists("Book"):
+                raise ValueError("Excel 5.0/95 (BIFF5) workbooks are not supported")
+            if self.ole.exists("EncryptedPackage"):
+                raise ValueError("The workbook is encrypted")
+            raise ValueError("Not an Excel workbook: the OLE file has no Workbook stream")
+        self.stream = self.ole.openstream("Workbook").read()
+        self._sheets: Optional[List[Tuple[str, int]]] = None
+
+    def close(self) -> None:
+        self.ole.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def has_vba(self) -> bool:
+        return self.ole.exists("_VBA_PROJECT_CUR")
+
+    def sheets(self) -> List[Tuple[str, int]]:
+        """Return [(sheet name, offset of its BOF in the Workbook stream)] for the worksheets, in order."""
+        if self._sheets is None:
+            sheets = []
+            for record_type, payload in iter_records(self.stream):
+                if record_type == FILEPASS:
+                    raise ValueError("The workbook is encrypted")
+                if record_type == BOUNDSHEET:
+                    position, _, sheet_type = struct.unpack_from("<IBB", payload, 0)
+                    # Chart, macro and VB module sheets are listed too; only worksheets carry controls
+                    if sheet_type == 0:
+                        sheets.append((_short_string(payload, 6), position))
+                elif record_type == EOF:
+                    break
+            self._sheets = sheets
+        return self._sheets
+
+    @property
+    def sheet_names(self) -> List[str]:
+        return [name for name, _ in self.sheets()]
+
+    def _skip_cell_table(self, offset: int) -> int:
+        """
+        Offset of the last DBCELL record of the sheet substream at ``offset``,
+        i.e. the end of its cell table, or ``offset`` itself. The INDEX record
+        right after BOF lists where the DBCELL record closing each block of
+        rows is; drawings and OBJ records only come after the cells, so the
+        bulk of the substream is never walked.
+        """
+        pos = offset
+        for _ in range(4):
+            if pos + 4 > len(self.stream):
+                break
+            record_type, size = struct.unpack_from("<HH", self.stream, pos)
+            if record_type == INDEX and size >= 16:
+                positions = struct.unpack_from(f"<{(size - 16) // 4}I", self.stream, pos + 20)
+                last = max(positions, default=0)
+                # Trust the position only if it lands on a DBCELL record of this substream
+                if pos < last <= len(self.stream) - 4 and struct.unpack_from("<H", self.stream, last)[0] == DBCELL:
+                    return last
+                break
+            pos += 4 + size
+        return offset
+
+    def _sheet_objects(self, offset: int) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        # (OBJ fields, drawing shape) per object of one sheet substream
+        drawing = b""
+        previous = None
+        for record_type, payload in iter_records(self.stream, self._skip_cell_table(offset)):
+            if record_type == MSODRAWING:
+                drawing = payload
+            elif record_type == CONTINUE and previous == MSODRAWING:
+                drawing += payload
+            elif record_type == OBJ:
+                yield parse_obj(payload), _drawing_shape(drawing)
+                drawing = b""
+            elif record_type == EOF:
+                return
+            if record_type != CONTINUE:
+                previous = record_type
+
+    def controls(self, decode_activex: bool = True) -> List[Dict[str, Any]]:
+        """
+        Form Controls and ActiveX controls of every worksheet, as the same
+        dicts scan_package_controls returns for .xlsx files. With
+        ``decode_activex`` the Caption, Value and Text of ActiveX controls
+        are decoded from the Ctls stream.
+        """
+        ctls = self.ole.openstream("Ctls").read() if decode_activex and self.ole.exists("Ctls") else b""
+        controls = []
+        for sheet_name, offset in self.sheets():
+            with get_metrics().span("control_scan_sheet", sheet=sheet_name) as span:
+                before = len(controls)
+                for obj, shape in self._sheet_objects(offset):
+                    if obj["type"] == OT_PICTURE and obj["control"]:
+                        control_type = ACTIVEX_CONTROL_MAP.get(obj["prog_id"], 'Unknown ActiveX')
+                        properties = self._activex_properties(obj, ctls)
+                    elif obj["type"] in OBJECT_TYPES:
+                        control_type = _form_control_type(OBJECT_TYPES[obj["type"]])
+                        properties = {}
+                    else:
+                        # Pictures, charts, comments and drawing shapes
+                        continue
+                    controls.append({
+                        'Sheet Name': sheet_name,
+                        'Control Name': shape["name"],
+                        'Control Type': control_type,
+                        'Location (Top-Left Cell)': shape["cell"],
+                        'ProgID': obj["prog_id"] if obj["control"] else None,
+                        'Caption': properties.get("Caption"),
+                        'Value': properties.get("Value"),
+                        'Text': properties.get("Text"),
+                    })
+                span["controls"] = len(controls) - before
+        return controls
+
+    @staticmethod
+    def _activex_properties(obj: Dict[str, Any], ctls: bytes) -> Dict[str, Any]:
+        if not ctls or obj["ctl_pos"] is None or not obj["ctl_size"]:
+            return {}
+        data = ctls[obj["ctl_pos"]:obj["ctl_pos"] + obj["ctl_size"]]
+        try:
+            # Each control in Ctls is its CLSID followed by the persisted stream
+            prog_id, stream = split_clsid(data, obj["prog_id"])
+            return summarize_properties(prog_id, decode_control_stream(prog_id, stream))
+        except Exception:
+            # A control we cannot decode is still listed, just without its state
+            return {}
+
+
+def scan_controls_xls(source: Union[bytes, str, IO[bytes]]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Lists the Form Controls and ActiveX controls of every sheet of a legacy
+    .xls file, like scan_controls_ooxml does for .xlsx/.xlsm/.xlsb.
+
+    Raises ValueError for OLE files that are not readable BIFF8 workbooks.
+    """
+    with XLSWorkbook(source) as workbook:
+        return workbook.controls(), workbook.sheet_names
@@ -1,10 +1,13 @@
 import streamlit as st
-import pandas as pd
-import xlwings as xw
 # import openpyxl
-from openpyxl import load_workbook
+from src.backends import is_available, load_module
+from src.debug_panel import render_debug_panel
+from src.inspection import WorkbookInspection
+from src.inventory import record_upload
+from src.metrics import get_metrics
 import tempfile
 import os
+import io
 from typing import Dict, List, Any
 # import win32com.client as win32
 # import pythoncom
@@ -14,24 +17,18 @@ class ExcelControlsExtractor:
         self.workbook = None
         self.xl_app = None
         
-    def get_sheet_count(self, file_path: str) -> int:
-        """Get the number of sheets in the Excel file using openpyxl"""
+    def get_sheet_count(self, inspection: WorkbookInspection) -> int:
+        """Get the number of sheets from an open workbook inspection"""
         try:
-            workbook = load_workbook(file_path, read_only=True)
-            sheet_count = len(workbook.sheetnames)
-            workbook.close()
-            return sheet_count
+            return inspection.sheet_count
         except Exception as e:
             st.error(f"Error reading Excel file: {str(e)}")
             return 0
     
-    def get_sheet_names(self, file_path: str) -> List[str]:
-        """Get all sheet names from the Excel file"""
+    def get_sheet_names(self, inspection: WorkbookInspection) -> List[str]:
+        """Get all sheet names from an open workbook inspection"""
         try:
-            workbook = load_workbook(file_path, read_only=True)
-            sheet_names = workbook.sheetnames
-            workbook.close()
-            return sheet_names
+            return inspection.sheet_names
         except Exception as e:
             st.error(f"Error getting sheet names: {str(e)}")
             return []
@@ -41,7 +38,8 @@ class ExcelControlsExtractor:
         controls_data = {}
         
         try:
-            # Initialize xlwings app
+            # xlwings drives a local Excel, so it is only imported when this method is chosen
+            xw = load_module("xlwings")
             self.xl_app = xw.App(visible=False)
             self.workbook = xw.Book(file_path)
             
@@ -106,60 +104,26 @@ class ExcelControlsExtractor:
             
         return controls_data
     
-    def extract_controls_openpyxl(self, file_path: str) -> Dict[str, List[Dict[str, Any]]]:
-        """Extract basic information using openpyxl (limited control support)"""
+    def extract_controls_openpyxl(self, inspection: WorkbookInspection) -> Dict[str, List[Dict[str, Any]]]:
+        """Extract form/ActiveX controls, data validations, hyperlinks and comments straight from the workbook parts (no Excel needed)"""
         controls_data = {}
         
         try:
-            workbook = load_workbook(file_path, keep_vba=True)
-            
-            for sheet_name in workbook.sheetnames:
-                sheet = workbook[sheet_name]
-                sheet_controls = []
-                
-                # Extract data validation (dropdowns)
-                if hasattr(sheet, 'data_validations') and sheet.data_validations:
-                    for dv in sheet.data_validations.dataValidation:
-                        for cell_range in dv.cells:
-                            control_info = {
-                                'type': 'Data Validation/Dropdown',
-                                'cell_range': str(cell_range),
-                                'validation_type': dv.type,
-                                'formula1': dv.formula1,
-                                'formula2': dv.formula2,
-                                'allow_blank': dv.allowBlank
-                            }
-                            sheet_controls.append(control_info)
-                
-                # Extract hyperlinks
-                if hasattr(sheet, '_hyperlinks'):
-                    for hyperlink in sheet._hyperlinks:
-                        control_info = {
-                            'type': 'Hyperlink',
-                            'cell': hyperlink.ref,
-                            'target': hyperlink.target,
-                            'display': hyperlink.display
-                        }
-                        sheet_controls.append(control_info)
-                
-                # Check for comments
-                for row in sheet.iter_rows():
-                    for cell in row:
-                        if cell.comment:
-                            control_info = {
-                                'type': 'Comment',
-                                'cell': cell.coordinate,
-                                'text': cell.comment.text,
-                                'author': cell.comment.author
-                            }
-                            sheet_controls.append(control_info)
-                
-                controls_data[sheet_name] = sheet_controls
-            
-            workbook.close()
-            
+            controls_data = {sheet_name: [] for sheet_name in inspection.sheet_names}
+            for control in inspection.controls():
+                controls_data[control['Sheet Name']].append({
+                    'type': control['Control Type'],
+                    'name': control['Control Name'],
+                    'cell': control['Location (Top-Left Cell)'],
+                    'prog_id': control['ProgID'],
+                    'caption': control['Caption'],
+                    'value': control['Value'],
+                    'text': control['Text']
+                })
+            for sheet_name, annotations in inspection.annotations().items():
+                controls_data[sheet_name].extend(annotations)
         except Exception as e:
-            st.error(f"Error extracting controls with openpyxl: {str(e)}")
+            st.error(f"Error extracting controls: {str(e)}")
             
         return controls_data
     
@@ -186,15 +150,15 @@ def main():
     # File upload
     uploaded_file = st.file_uploader(
         "Choose an Excel file",
-        type=['xlsx', 'xlsm', 'xls'],
+        type=['xlsx', 'xlsm', 'xlsb', 'xls'],
         help="Upload an Excel file containing form controls, ActiveX controls, or data validation"
     )
     
     if uploaded_file is not None:
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            temp_file_path = tmp_file.name
+        # The workbook is read straight from memory; only the xlwings path needs a file on disk
+        with get_metrics().span("upload_read", file=uploaded_file.name):
+            file_bytes = uploaded_file.getvalue()
+        temp_file_path = None
         
         try:
             # Initialize extractor
@@ -203,15 +167,23 @@ def main():
             # Display file info
             st.success(f"✅ File uploaded: {uploaded_file.name}")
             
+            # Open the workbook once per upload and keep it across reruns
+            if st.session_state.get("inspection_file_id") != uploaded_file.file_id:
+                st.session_state.inspection = WorkbookInspection(io.BytesIO(file_bytes))
+                st.session_state.inspection_file_id = uploaded_file.file_id
+            inspection = st.session_state.inspection
+            
             # Get basic file information
-            sheet_count = extractor.get_sheet_count(temp_file_path)
-            sheet_names = extractor.get_sheet_names(temp_file_path)
+            sheet_count = extractor.get_sheet_count(inspection)
+            sheet_names = extractor.get_sheet_names(inspection)
             
-            col1, col2 = st.columns(2)
+            col1, col2, col3 = st.columns(3)
             with col1:
                 st.metric("Number of Sheets", sheet_count)
             with col2:
                 st.metric("File Size", f"{uploaded_file.size / 1024:.1f} KB")
+            with col3:
+                st.metric("VBA Project", "Yes" if inspection.has_vba else "No")
             
             if sheet_names:
                 st.subheader("📋 Sheet Names")
@@ -220,20 +192,33 @@ def main():
             
             # Extraction method selection
             st.subheader("🔧 Control Extraction Method")
+            methods = ["Basic (openpyxl)"]
+            if is_available("xlwings"):
+                methods.append("Advanced (xlwings - requires Excel)")
             extraction_method = st.radio(
                 "Select extraction method:",
-                ["Basic (openpyxl)", "Advanced (xlwings - requires Excel)"],
+                methods,
                 help="Basic method works without Excel installed but has limited control detection. Advanced method requires Excel but can detect more control types."
             )
+            if len(methods) == 1:
+                st.caption("xlwings is not installed, so the advanced method is unavailable.")
             
             if st.button("🔍 Extract Controls", type="primary"):
                 with st.spinner("Extracting controls..."):
                     if extraction_method == "Basic (openpyxl)":
-                        controls_data = extractor.extract_controls_openpyxl(temp_file_path)
+                        controls_data = extractor.extract_controls_openpyxl(inspection)
+                        record_upload(file_bytes, uploaded_file.name, controls=inspection.controls())
                     else:
+                        # Excel needs a real file with the upload's own extension
+                        suffix = os.path.splitext(uploaded_file.name)[1]
+                        with get_metrics().span("temp_write", bytes=len(file_bytes)):
+                            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
+                                tmp_file.write(file_bytes)
+                                temp_file_path = tmp_file.name
                         controls_data = extractor.extract_controls_xlwings(temp_file_path)
                 
                 # Display results
+                pd = load_module("pandas")
                 st.subheader("📊 Extracted Controls")
                 
                 if not any(controls_data.values()):
@@ -272,8 +257,7 @@ def main():
                     export_data = []
                     for sheet_name, controls in controls_data.items():
                         for control in controls:
-                            control['sheet_name'] = sheet_name
-                            export_data.append(control)
+                            export_data.append(dict(control, sheet_name=sheet_name))
                     
                     if export_data:
                         export_df = pd.DataFrame(export_data)
@@ -291,23 +275,25 @@ def main():
         
         finally:
             # Clean up temporary file
-            try:
-                os.unlink(temp_file_path)
-            except:
-                pass
+            if temp_file_path:
+                try:
+                    os.unlink(temp_file_path)
+                except:
+                    pass
     
     # Instructions
     with st.sidebar:
         st.header("📖 Instructions")
         st.markdown("""
         **How to use:**
-        1. Upload an Excel file (.xlsx, .xlsm, .xls)
+        1. Upload an Excel file (.xlsx, .xlsm, .xlsb, .xls)
         2. Choose extraction method
         3. Click "Extract Controls"
         4. View and export results
         
         **Supported Controls:**
         - **Basic Method:**
+          - Form controls and ActiveX controls
           - Data validation (dropdowns)
           - Hyperlinks
           - Comments
@@ -322,6 +308,7 @@ def main():
         - Basic method: Only Python packages
         - Advanced method: Microsoft Excel installed
         """)
+    render_debug_panel()
         
         # st.header("🔧 Dependencies")
 #         st.code("""